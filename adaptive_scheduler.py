@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Адаптивный планировщик обработки видео
+Вместо фиксированных "детекция каждый 5-й кадр" и паузы 50 мс планировщик
+измеряет время стадий (детекция, распознавание, отрисовка) и по заданным
+целям - частоте кадров, доле процессора и максимальной задержке
+опознания - выбирает, как часто запускать детекцию, в каком разрешении
+ее выполнять и сколько ждать между кадрами.
+"""
+
+import math
+import time
+
+
+# Разрешения обработки от меньшего к большему
+RESOLUTIONS = ((240, 180), (320, 240), (400, 300), (480, 360))
+
+
+class AdaptiveScheduler:
+    def __init__(self, target_fps=15.0, cpu_budget=0.5, max_identify_latency=0.6,
+                 max_interval=15, adapt_period=2.0, smoothing=0.2, idle_fps=5.0):
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps  # Частота кадров, когда в кадре нет движения и лиц
+        self.cpu_budget = cpu_budget  # Доля одного ядра на обработку видео
+        self.max_identify_latency = max_identify_latency  # От появления лица до опознания (с)
+        self.max_interval = max_interval
+        self.adapt_period = adapt_period  # Как часто можно менять разрешение (с)
+        self.smoothing = smoothing
+
+        # Текущие настройки
+        self.resolution_index = 1
+        self.detection_interval = 5
+        self.latency_target_met = True
+
+        # Сглаженные измерения
+        self.stage_times = {}  # Стадия -> среднее время (с)
+        self._frame_stages = {}  # Время стадий текущего кадра
+        self.frame_work = None  # Работа на кадр без детекции (с)
+        self.fps = 0.0
+        self.cpu_load = 0.0
+
+        self._frames_since_detection = self.detection_interval
+        self._frame_started = None
+        self._last_frame_end = None
+        self._period = None
+        self._deadline = None
+        self._last_adapt = time.monotonic()
+
+    @property
+    def resolution(self):
+        """Разрешение обработки (ширина, высота)"""
+        return RESOLUTIONS[self.resolution_index]
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return previous + self.smoothing * (value - previous)
+
+    def record(self, stage, seconds, in_frame=True):
+        """Учет времени стадии
+
+        in_frame=False - стадия выполнялась вне потока кадра (например, в рабочем
+        процессе) и не входит в измеренное время обработки текущего кадра.
+        """
+        self.stage_times[stage] = self._smooth(self.stage_times.get(stage), seconds)
+        if in_frame:
+            self._frame_stages[stage] = self._frame_stages.get(stage, 0.0) + seconds
+
+    def begin_frame(self):
+        """Начало обработки кадра, возвращает True, если на этом кадре нужна детекция"""
+        self._frame_started = time.perf_counter()
+        self._frame_stages = {}
+        self._frames_since_detection += 1
+        if self._frames_since_detection >= self.detection_interval:
+            self._frames_since_detection = 0
+            return True
+        return False
+
+    def end_frame(self, idle=False):
+        """Конец обработки кадра: пересчет настроек, возвращает паузу до следующего кадра (с)
+
+        idle=True - в кадре ничего не происходит, используется частота idle_fps.
+        """
+        now = time.perf_counter()
+        work = now - self._frame_started if self._frame_started is not None else 0.0
+        # Работа на кадр без детекции и распознавания
+        detection_work = self._frame_stages.get('detect', 0.0) + self._frame_stages.get('recognize', 0.0)
+        self.frame_work = self._smooth(self.frame_work, max(0.0, work - detection_work))
+        self._adapt()
+
+        # Средняя работа на кадр с учетом детекции раз в detection_interval кадров
+        detect = self.stage_times.get('detect', 0.0) + self.stage_times.get('recognize', 0.0)
+        average_work = self.frame_work + detect / self.detection_interval
+
+        # Кадры не чаще целевой частоты и не чаще, чем позволяет доля процессора.
+        # Начало следующего кадра отсчитывается от плановых моментов, чтобы кадры
+        # после дорогой детекции догоняли расписание (но не более чем на один период)
+        fps = min(self.target_fps, self.idle_fps) if idle else self.target_fps
+        period = max(1.0 / fps, average_work / max(self.cpu_budget, 1e-3))
+        if self._deadline is None:
+            self._deadline = self._frame_started + period
+        else:
+            self._deadline = max(self._deadline + period, now - period)
+        delay = max(0.0, self._deadline - now)
+
+        if self._last_frame_end is not None:
+            self._period = self._smooth(self._period, now - self._last_frame_end)
+            self.fps = 1.0 / self._period if self._period > 0 else 0.0
+        self._last_frame_end = now
+        self.cpu_load = average_work * self.fps
+        return delay
+
+    def _adapt(self):
+        """Выбор интервала детекции и разрешения по измерениям"""
+        detect = self.stage_times.get('detect', 0.0) + self.stage_times.get('recognize', 0.0)
+        base = self.frame_work or 0.0
+        if detect <= 0:
+            return
+
+        # Интервал, при котором средняя нагрузка укладывается в долю процессора
+        frame_budget = self.cpu_budget / self.target_fps
+        spare = frame_budget - base
+        cpu_interval = self.max_interval if spare <= 0 else math.ceil(detect / spare)
+
+        # Интервал, при котором новое лицо опознается не позже заданной задержки
+        latency_interval = max(1, int((self.max_identify_latency - detect) * self.target_fps))
+
+        self.detection_interval = max(1, min(self.max_interval, cpu_interval))
+        self.latency_target_met = self.detection_interval <= latency_interval
+
+        now = time.monotonic()
+        if now - self._last_adapt < self.adapt_period:
+            return
+
+        if not self.latency_target_met and self.resolution_index > 0:
+            # Детекция слишком дорогая - уменьшаем разрешение
+            self._set_resolution(self.resolution_index - 1)
+        elif cpu_interval == 1 and spare > 2 * detect and self.resolution_index < len(RESOLUTIONS) - 1:
+            # Есть большой запас - повышаем разрешение для лучшей детекции
+            self._set_resolution(self.resolution_index + 1)
+
+    def _set_resolution(self, index):
+        self.resolution_index = index
+        self._last_adapt = time.monotonic()
+        # Время детекции зависит от разрешения - измеряем заново
+        self.stage_times.pop('detect', None)
+        self.stage_times.pop('recognize', None)
+
+    def set_targets(self, target_fps=None, cpu_budget=None, max_identify_latency=None):
+        """Изменение целей во время работы"""
+        if target_fps:
+            self.target_fps = float(target_fps)
+        if cpu_budget:
+            self.cpu_budget = float(cpu_budget)
+        if max_identify_latency:
+            self.max_identify_latency = float(max_identify_latency)
+
+    def get_status(self):
+        """Текущие настройки и измерения для отображения"""
+        width, height = self.resolution
+        return {
+            'interval': self.detection_interval,
+            'width': width,
+            'height': height,
+            'fps': self.fps,
+            'cpu': self.cpu_load,
+            'detect_ms': self.stage_times.get('detect', 0.0) * 1000,
+            'latency_met': self.latency_target_met
+        }
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Приближенный поиск ближайших соседей (IVF) на чистом NumPy
+Образцы галереи разбиваются на ячейки сферическим k-means, запрос
+сравнивается только с образцами из n_probe ближайших ячеек. По желанию
+образцы дополнительно сжимаются произведением квантователей (PQ), и
+оценка кандидатов идет по таблицам расстояний без чтения самих векторов.
+Индекс только отбирает строки-кандидаты - итоговая оценка людей
+остается точной (см. GalleryIndex).
+"""
+
+import numpy as np
+
+
+def _nearest_centroids(data, centroids, spherical=True, chunk=8192):
+    """Номер ближайшего центроида для каждой строки (по частям для экономии памяти)"""
+    assignments = np.empty(data.shape[0], dtype=np.int32)
+    bias = None if spherical else -0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    for start in range(0, data.shape[0], chunk):
+        scores = data[start:start + chunk] @ centroids.T
+        if bias is not None:
+            scores += bias
+        assignments[start:start + chunk] = np.argmax(scores, axis=1)
+    return assignments
+
+
+def kmeans(data, k, iterations=10, spherical=True, seed=0):
+    """k-means: сферический (по косинусу) или евклидов
+
+    Возвращает (центроиды, номера ячеек строк).
+    """
+    data = np.asarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _nearest_centroids(data, centroids, spherical)
+
+        # Суммы по ячейкам через сортировку и reduceat
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[filled]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        if spherical:
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            new_centroids[filled] = sums / norms
+        else:
+            new_centroids[filled] = sums / counts[filled, np.newaxis]
+
+        # Пустые ячейки переинициализируем случайными точками
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            new_centroids[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+        centroids = new_centroids
+
+    return centroids, _nearest_centroids(data, centroids, spherical)
+
+
+class IVFIndex:
+    def __init__(self, n_lists=None, n_probe=8, pq_subvectors=0, max_candidates=256,
+                 train_iterations=10, train_sample=50, seed=0):
+        self.n_lists = n_lists  # None - около sqrt(числа строк)
+        self.n_probe = n_probe  # Сколько ближайших ячеек просматривать
+        self.pq_subvectors = pq_subvectors  # 0 - без сжатия PQ
+        self.max_candidates = max_candidates  # Сколько лучших строк отдавать на точную оценку
+        self.train_iterations = train_iterations
+        self.train_sample = train_sample  # Строк обучающей выборки на одну ячейку
+        self.seed = seed
+
+        self.centroids = None
+        self.codebooks = None  # (подвекторы, 256, размер подвектора)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.codes = None
+        self._lists = None  # Кэш инвертированных списков
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def reset(self):
+        self.centroids = None
+        self.codebooks = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.codes = None
+        self._lists = None
+
+    def train(self, matrix):
+        """Обучение ячеек (и кодовых книг PQ) и распределение всех строк"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.reset()
+        if matrix.shape[0] == 0:
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(matrix.shape[0])))
+        n_lists = min(n_lists, matrix.shape[0])
+
+        # Обучаемся на случайной подвыборке
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(matrix.shape[0], n_lists * self.train_sample)
+        sample = matrix[np.sort(rng.choice(matrix.shape[0], sample_size, replace=False))]
+        self.centroids, _ = kmeans(sample, n_lists, self.train_iterations, spherical=True, seed=self.seed)
+
+        if self.pq_subvectors:
+            if matrix.shape[1] % self.pq_subvectors:
+                raise ValueError(f"Размерность {matrix.shape[1]} не делится на {self.pq_subvectors} подвекторов")
+            self.codebooks = np.stack([
+                kmeans(part, 256, self.train_iterations, spherical=False, seed=self.seed)[0]
+                for part in np.split(sample, self.pq_subvectors, axis=1)
+            ])
+
+        self.add(matrix)
+
+    def _encode(self, vectors):
+        """Коды PQ: номер центроида в каждом подпространстве"""
+        parts = np.split(vectors, self.pq_subvectors, axis=1)
+        return np.stack([
+            _nearest_centroids(part, codebook, spherical=False)
+            for part, codebook in zip(parts, self.codebooks)
+        ], axis=1).astype(np.uint8)
+
+    def add(self, vectors):
+        """Распределение новых строк по обученным ячейкам"""
+        if not self.is_trained:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[np.newaxis, :]
+        self.assignments = np.concatenate([
+            self.assignments, _nearest_centroids(vectors, self.centroids, spherical=True)])
+        if self.codebooks is not None:
+            new_codes = self._encode(vectors)
+            self.codes = new_codes if self.codes is None else np.concatenate([self.codes, new_codes])
+        self._lists = None
+
+    def remove(self, keep_mask):
+        """Удаление строк (маска оставшихся строк в прежнем порядке)"""
+        if not self.is_trained:
+            return
+        self.assignments = self.assignments[keep_mask]
+        if self.codes is not None:
+            self.codes = self.codes[keep_mask]
+        self._lists = None
+
+    def _get_lists(self):
+        """Инвертированные списки: строки, отсортированные по ячейкам, и границы ячеек"""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable').astype(np.int64)
+            counts = np.bincount(self.assignments, minlength=self.centroids.shape[0])
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            self._lists = (order, bounds)
+        return self._lists
+
+    def candidate_rows(self, query, matrix):
+        """Лучшие строки-кандидаты для запроса из n_probe ближайших ячеек"""
+        order, bounds = self._get_lists()
+        n_probe = min(self.n_probe, self.centroids.shape[0])
+        cells = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in cells])
+        if rows.size <= self.max_candidates and self.codes is None:
+            return rows
+
+        if self.codes is not None:
+            # Оценка по таблицам PQ без чтения полных векторов
+            tables = np.einsum('msd,md->ms', self.codebooks,
+                               query.reshape(self.pq_subvectors, -1))
+            codes = self.codes[rows]
+            scores = tables[np.arange(self.pq_subvectors), codes].sum(axis=1)
+        else:
+            scores = matrix[rows] @ query
+
+        if rows.size > self.max_candidates:
+            top = np.argpartition(-scores, self.max_candidates - 1)[:self.max_candidates]
+            rows = rows[top]
+        return rows
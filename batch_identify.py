@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетное опознание по записанному видео или каталогу изображений (без интерфейса)
+Кадры идут через цепочку генераторов: чтение (с шагом --stride) ->
+детекция лиц (в текущем процессе или в ProcessPipeline с --workers
+процессами) -> распознавание по галерее -> запись строк в CSV или JSONL
+с отметкой времени кадра. В конце выводится скорость обработки.
+
+Запуск: python batch_identify.py door_cam.mp4 -o result.csv [--stride 5] [--workers 2]
+        [--start "2026-10-18 14:00:00"] [--known-only]
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+
+import cv2
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+FIELDS = ['source', 'frame', 'offset', 'time', 'name', 'confidence', 'x', 'y', 'w', 'h']
+
+
+class BatchStats:
+    def __init__(self):
+        self.frames_read = 0  # Кадров прочитано (включая пропущенные шагом)
+        self.frames_processed = 0  # Кадров прошло детекцию
+        self.faces = 0
+        self.identified = 0  # Лиц, опознанных как известные люди
+        self.media_seconds = 0.0  # Длительность обработанного видео
+
+
+def iter_video_frames(path, stride, stats):
+    """Кадры видео: (имя источника, номер кадра, смещение в секундах, время кадра, кадр)
+
+    Пропускаемые шагом кадры только захватываются (grab) без декодирования.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    source = os.path.basename(path)
+    index = -1
+    try:
+        while True:
+            if not cap.grab():
+                break
+            index += 1
+            stats.frames_read += 1
+            if index % stride:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            offset = position if position > 0 or fps <= 0 else index / fps
+            stats.media_seconds = offset
+            yield source, index, offset, None, frame
+    finally:
+        cap.release()
+
+
+def iter_image_frames(directory, stride, stats):
+    """Изображения каталога по имени: (имя файла, номер, None, время изменения файла, кадр)"""
+    filenames = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    for index, filename in enumerate(filenames):
+        stats.frames_read += 1
+        if index % stride:
+            continue
+        path = os.path.join(directory, filename)
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"Не удалось прочитать {path}")
+            continue
+        yield filename, index, None, datetime.datetime.fromtimestamp(os.path.getmtime(path)), frame
+
+
+def fit_frame(frame, max_side):
+    """Уменьшение кадра до max_side по большей стороне, возвращает (кадр, масштаб)"""
+    height, width = frame.shape[:2]
+    scale = min(1.0, max_side / float(max(height, width)))
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return frame, scale
+
+
+def detect_stream(frames, max_side, workers, stats):
+    """Детекция лиц: (кадр источника, масштаб, лица) в порядке кадров"""
+    if workers <= 0:
+        from simple_face_recognizer import SimpleFaceRecognizer
+        detector = SimpleFaceRecognizer(detector_only=True)
+        for item in frames:
+            small, scale = fit_frame(item[4], max_side)
+            stats.frames_processed += 1
+            yield item, scale, detector.detect_faces(small)
+        return
+
+    from process_pipeline import ProcessPipeline
+    pipeline = ProcessPipeline(workers=workers, frame_shape=(max_side, max_side, 3))
+    waiting = {}  # Номер в конвейере -> (кадр источника, масштаб)
+    try:
+        for item in frames:
+            small, scale = fit_frame(item[4], max_side)
+            # Свободная ячейка ждется не дольше, чем результат при дочитывании
+            seq = None
+            deadline = time.monotonic() + 30.0
+            while seq is None and time.monotonic() < deadline and pipeline.alive_workers():
+                seq = pipeline.submit(small, block=True, timeout=1.0)
+            if seq is None:
+                print(f"Процессы детекции не отвечают, не обработано кадров: {len(waiting) + 1}")
+                return
+            waiting[seq] = (item, scale)
+            for seq, faces in pipeline.poll():
+                stats.frames_processed += 1
+                yield waiting.pop(seq) + (faces,)
+
+        while waiting:
+            ready = pipeline.poll(block=True, timeout=30.0)
+            if not ready:
+                print(f"Процессы детекции не отвечают, не обработано кадров: {len(waiting)}")
+                break
+            for seq, faces in ready:
+                stats.frames_processed += 1
+                yield waiting.pop(seq) + (faces,)
+    finally:
+        pipeline.close()
+
+
+def identify_stream(detections, recognizer, start_time, known_only, stats):
+    """Распознавание лиц кадра одним пакетом, строки результата"""
+    for (source, index, offset, moment, _), scale, faces in detections:
+        if not faces:
+            continue
+        stats.faces += len(faces)
+        results = recognizer.recognize_faces([face['face_roi'] for face in faces],
+                                             [face['features'] for face in faces])
+        for face, (name, confidence) in zip(faces, results):
+            if name is not None:
+                stats.identified += 1
+            elif known_only:
+                continue
+
+            if moment is None and start_time is not None:
+                moment = start_time + datetime.timedelta(seconds=offset)
+
+            x, y, w, h = (int(round(v / scale)) for v in face['coordinates'])
+            yield {
+                'source': source,
+                'frame': index,
+                'offset': None if offset is None else round(offset, 3),
+                'time': moment.isoformat(sep=' ', timespec='milliseconds') if moment else None,
+                'name': name,
+                'confidence': round(float(confidence), 4),
+                'x': x, 'y': y, 'w': w, 'h': h
+            }
+
+
+class RowWriter:
+    """Запись строк в CSV или JSONL (по расширению файла или --format)"""
+
+    def __init__(self, path, output_format=None):
+        self.format = output_format or ('jsonl' if path.lower().endswith(('.jsonl', '.json')) else 'csv')
+        self.rows = 0
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное опознание по видео или каталогу изображений")
+    parser.add_argument("source", help="Видеофайл или каталог изображений")
+    parser.add_argument("-o", "--output", default="identifications.csv")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--stride", type=int, default=1, help="Обрабатывать каждый N-й кадр")
+    parser.add_argument("--workers", type=int, default=0, help="Процессов детекции (0 - в текущем процессе)")
+    parser.add_argument("--max-side", type=int, default=640, help="Размер кадра для детекции по большей стороне")
+    parser.add_argument("--start", help="Время начала записи (ГГГГ-ММ-ДД ЧЧ:ММ:СС) для абсолютных отметок")
+    parser.add_argument("--known-only", action="store_true", help="Записывать только опознанных людей")
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "pickle"))
+    args = parser.parse_args()
+
+    start_time = None
+    if args.start:
+        try:
+            start_time = datetime.datetime.fromisoformat(args.start)
+        except ValueError:
+            print(f"Некорректное время начала: {args.start}")
+            return 1
+
+    stats = BatchStats()
+    stride = max(1, args.stride)
+    if os.path.isdir(args.source):
+        frames = iter_image_frames(args.source, stride, stats)
+    elif os.path.isfile(args.source):
+        frames = iter_video_frames(args.source, stride, stats)
+    else:
+        print(f"Источник не найден: {args.source}")
+        return 1
+
+    from simple_face_recognizer import SimpleFaceRecognizer
+    recognizer = SimpleFaceRecognizer(storage_backend=args.storage)
+    if not recognizer.face_database:
+        print("База данных пуста: все лица будут неизвестными")
+
+    writer = RowWriter(args.output, args.format)
+    detections = detect_stream(frames, args.max_side, args.workers, stats)
+    started = time.perf_counter()
+    try:
+        for row in identify_stream(detections, recognizer, start_time, args.known_only, stats):
+            writer.write(row)
+    except KeyboardInterrupt:
+        print("\nОбработка прервана, результаты записаны до текущего кадра")
+    except IOError as e:
+        print(e)
+        return 1
+    finally:
+        detections.close()
+        writer.close()
+        recognizer.close()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    print(f"Кадров прочитано: {stats.frames_read}, обработано: {stats.frames_processed}, "
+          f"лиц: {stats.faces}, опознано: {stats.identified}, строк: {writer.rows} -> {args.output}")
+    speed = f"Время: {elapsed:.1f} с, {stats.frames_processed / elapsed:.1f} кадров/с обработано"
+    if stats.media_seconds > 0:
+        speed += f", {stats.frames_read / elapsed:.1f} кадров/с видео (x{stats.media_seconds / elapsed:.1f} реального времени)"
+    print(speed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк приближенного поиска (IVF) по галерее
+Строит синтетическую галерею из неотрицательных векторов размерности 832
+(как гистограммы LBP), для разных n_probe сравнивает с точным поиском
+долю совпавших ответов (recall@1) и время на запрос.
+
+Запуск: python benchmarks/bench_ann.py [--persons 20000] [--samples 3] [--queries 200] [--pq 0]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+from gallery_index import GalleryIndex
+
+
+def make_gallery(persons, samples, dim, seed=0):
+    """Синтетическая галерея: центр человека и зашумленные образцы вокруг него"""
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(0.5, size=(persons, dim)).astype(np.float32)
+    gallery = {}
+    for p in range(persons):
+        noise = rng.normal(1.0, 0.35, size=(samples, dim)).clip(0)
+        gallery[f"person_{p}"] = list(centers[p] * noise)
+    return centers, gallery
+
+
+def make_queries(centers, count, seed=1):
+    """Запросы - новые зашумленные снимки случайных людей"""
+    rng = np.random.default_rng(seed)
+    picked = rng.integers(0, centers.shape[0], size=count)
+    noise = rng.normal(1.0, 0.35, size=(count, centers.shape[1])).clip(0)
+    return (centers[picked] * noise).astype(np.float32)
+
+
+def run(index, queries, threshold):
+    """Ответы и среднее время на один запрос (мс)"""
+    start = time.perf_counter()
+    results = [index.search(query, threshold) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк приближенного поиска")
+    parser.add_argument("--persons", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=832)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--pq", type=int, default=0, help="число подвекторов PQ (0 - без сжатия)")
+    parser.add_argument("--probes", default="1,2,4,8,16,32")
+    args = parser.parse_args()
+
+    centers, gallery = make_gallery(args.persons, args.samples, args.dim)
+    queries = make_queries(centers, args.queries)
+    threshold = -1.0  # Сравниваем лучший ответ без отсечения по порогу
+
+    index = GalleryIndex(top_k=3)
+    index.rebuild(gallery)
+    print(f"Галерея: {args.persons} человек, {len(index)} образцов")
+
+    exact, exact_ms = run(index, queries, threshold)
+    print(f"Точный поиск:            {exact_ms:8.3f} мс/запрос")
+
+    for n_probe in [int(p) for p in args.probes.split(",")]:
+        ann = IVFIndex(n_probe=n_probe, pq_subvectors=args.pq)
+        start = time.perf_counter()
+        index.enable_ann(ann, min_rows=0)
+        train_s = time.perf_counter() - start
+
+        approx, approx_ms = run(index, queries, threshold)
+        same = sum(a[0] == e[0] for a, e in zip(approx, exact))
+        # Для найденного человека оценка должна совпадать с точной
+        score_error = max(abs(a[1] - e[1]) for a, e in zip(approx, exact) if a[0] == e[0]) if same else 0.0
+
+        print(f"n_probe={n_probe:<3} recall@1={same / len(queries):6.3f}  "
+              f"{approx_ms:8.3f} мс/запрос (x{exact_ms / approx_ms:.1f})  "
+              f"обучение {train_s:.1f} с, погрешность оценки {score_error:.1e}")
+
+    index.disable_ann()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
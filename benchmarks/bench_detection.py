@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк детекции лиц на фотографиях
+Сравнивает прежние три прохода каскада с удалением дубликатов по смещению
+(mode="legacy") и один проход с подавлением немаксимумов по IoU
+(mode="single"): время на фотографию и полноту - долю рамок прежнего
+режима, для которых новый режим нашел рамку с IoU >= 0.5.
+
+Фотографии берутся из каталога (--images), иначе генерируются
+синтетические изображения с нарисованными лицами разного размера.
+
+Запуск: python benchmarks/bench_detection.py [--images photos/] [--count 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_boxes import iou_matrix
+from simple_face_recognizer import SimpleFaceRecognizer
+
+
+def draw_face(size):
+    """Схематичное лицо: овал, глаза, брови, нос и рот"""
+    s = size
+    face = np.full((s, s), 200, dtype=np.uint8)
+    cv2.ellipse(face, (s // 2, s // 2), (int(s * 0.38), int(s * 0.48)), 0, 0, 360, 170, -1)
+    for eye_x in (0.35, 0.65):
+        cv2.ellipse(face, (int(s * eye_x), int(s * 0.40)), (int(s * 0.08), int(s * 0.04)), 0, 0, 360, 40, -1)
+        cv2.line(face, (int(s * (eye_x - 0.1)), int(s * 0.32)), (int(s * (eye_x + 0.1)), int(s * 0.32)),
+                 60, max(1, s // 30))
+    cv2.line(face, (s // 2, int(s * 0.45)), (s // 2, int(s * 0.62)), 120, max(1, s // 25))
+    cv2.ellipse(face, (s // 2, int(s * 0.75)), (int(s * 0.15), int(s * 0.04)), 0, 0, 360, 70, -1)
+    return cv2.GaussianBlur(face, (0, 0), s / 60)
+
+
+def synthetic_photos(count, seed=0):
+    """Фотографии разного размера с 1-4 лицами на фоне"""
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        height, width = int(rng.integers(600, 2400)), int(rng.integers(800, 3200))
+        background = cv2.GaussianBlur(rng.integers(60, 200, size=(height // 8, width // 8), dtype=np.uint8), (5, 5), 0)
+        image = cv2.resize(background, (width, height))
+        for _ in range(int(rng.integers(1, 5))):
+            size = int(rng.integers(min(height, width) // 12, min(height, width) // 2))
+            x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+            image[y:y + size, x:x + size] = draw_face(size)
+        photos.append(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
+    return photos
+
+
+def load_photos(args):
+    if not args.images:
+        return synthetic_photos(args.count)
+    photos = []
+    for filename in sorted(os.listdir(args.images)):
+        image = cv2.imread(os.path.join(args.images, filename))
+        if image is not None:
+            photos.append(image)
+        if len(photos) >= args.count:
+            break
+    return photos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк детекции лиц на фотографиях")
+    parser.add_argument("--images")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    args = parser.parse_args()
+
+    photos = load_photos(args)
+    if not photos:
+        print("Нет фотографий для теста")
+        return 1
+
+    detector = SimpleFaceRecognizer(detector_only=True)
+    grays = [detector.prepare_image_gray(photo) for photo in photos]
+
+    results = {}
+    for mode in ("legacy", "single"):
+        start = time.perf_counter()
+        results[mode] = [detector.detect_image_boxes(gray, mode) for gray in grays]
+        elapsed = (time.perf_counter() - start) * 1000 / len(grays)
+        found = sum(len(boxes) for boxes in results[mode])
+        print(f"{mode:<7} {elapsed:8.1f} мс/фото, рамок: {found}")
+        results[mode + "_ms"] = elapsed
+
+    matched = 0
+    total = 0
+    for legacy, single in zip(results["legacy"], results["single"]):
+        total += len(legacy)
+        if legacy and single:
+            matched += int(np.count_nonzero(iou_matrix(legacy, single).max(axis=1) >= 0.5))
+    recall = matched / total if total else 1.0
+    speedup = results["legacy_ms"] / max(results["single_ms"], 1e-9)
+    print(f"Фотографий: {len(grays)}, ускорение x{speedup:.2f}, "
+          f"полнота относительно трех проходов: {matched}/{total} ({recall:.1%})")
+    return 0 if recall >= args.min_recall else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк отрисовки подписей на кадре
+Сравнивает прежний способ (весь кадр BGR -> PIL -> BGR и поиск шрифта
+на каждую подпись) с LabelRenderer (шрифт и растры подписей из кэша,
+смешивается только область подписи) и проверяет, что результат совпадает
+с рисованием того же текста тем же шрифтом через PIL по всему кадру.
+
+Запуск: python benchmarks/bench_labels.py [--frames 300] [--width 640] [--height 480] [--labels 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from label_renderer import LabelRenderer
+
+
+LABELS = ["Иванов Иван (87.5%)", "Неизвестный (41.2%)", "Petrov Petr (92.0%)",
+          "Сапаров Мерет (78.3%)", "Неизвестный"]
+COLORS = [(0, 255, 0), (0, 0, 255), (0, 255, 255)]
+
+
+def reference_put_text(image, text, position, font_scale, color):
+    """Прежний put_text_utf8: весь кадр через PIL, шрифт ищется на каждый вызов"""
+    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(pil_image)
+    try:
+        font = ImageFont.truetype("arial.ttf", int(38 * font_scale))
+    except Exception:
+        try:
+            font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", int(38 * font_scale))
+        except Exception:
+            font = ImageFont.load_default()
+    x, y = position
+    draw.text((x, y - 20), text, font=font, fill=color[::-1])
+    image[:] = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+
+
+def full_frame_put_text(image, text, position, font, color):
+    """Эталон: тот же шрифт, что у LabelRenderer, но рисование по всему кадру"""
+    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    x, y = position
+    ImageDraw.Draw(pil_image).text((x, y - 20), text, font=font, fill=color[::-1])
+    image[:] = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+
+
+def make_jobs(args, rng):
+    """Подписи для каждого кадра: (текст, позиция, цвет)"""
+    jobs = []
+    for _ in range(args.frames):
+        frame_jobs = []
+        for i in range(args.labels):
+            x = int(rng.integers(-20, args.width - 100))
+            y = int(rng.integers(10, args.height + 10))
+            frame_jobs.append((LABELS[(i + len(jobs)) % len(LABELS)], (x, y), COLORS[i % len(COLORS)]))
+        jobs.append(frame_jobs)
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк отрисовки подписей")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--labels", type=int, default=3)
+    parser.add_argument("--font-scale", type=float, default=0.6)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8), (7, 7), 0)
+    jobs = make_jobs(args, rng)
+    size = int(38 * args.font_scale)
+
+    # Прежний способ
+    frame = base.copy()
+    start = time.perf_counter()
+    for frame_jobs in jobs:
+        for text, position, color in frame_jobs:
+            reference_put_text(frame, text, position, args.font_scale, color)
+    before = (time.perf_counter() - start) * 1000 / len(jobs)
+
+    # LabelRenderer
+    renderer = LabelRenderer()
+    frame = base.copy()
+    start = time.perf_counter()
+    for frame_jobs in jobs:
+        for text, (x, y), color in frame_jobs:
+            renderer.draw(frame, text, (x, y - 20), size, color)
+    after = (time.perf_counter() - start) * 1000 / len(jobs)
+
+    print(f"Кадр {args.width}x{args.height}, подписей на кадр: {args.labels}, шрифт: {renderer.font_path or 'стандартный PIL'}")
+    print(f"Было (весь кадр через PIL): {before:8.3f} мс/кадр")
+    print(f"Стало (LabelRenderer):      {after:8.3f} мс/кадр (x{before / max(after, 1e-9):.1f}), "
+          f"попаданий в кэш: {renderer.hits}, промахов: {renderer.misses}")
+
+    # Совпадение с рисованием тем же шрифтом по всему кадру
+    font = renderer.get_font(size)
+    max_diff = 0
+    for frame_jobs in jobs[:50]:
+        expected = base.copy()
+        actual = base.copy()
+        for text, (x, y), color in frame_jobs:
+            full_frame_put_text(expected, text, (x, y), font, color)
+            renderer.draw(actual, text, (x, y - 20), size, color)
+        max_diff = max(max_diff, int(np.abs(expected.astype(np.int16) - actual.astype(np.int16)).max()))
+    same = max_diff <= 2
+    print(f"Максимальное отличие от PIL по всему кадру: {max_diff} ({'совпадает' if same else 'РАЗЛИЧАЕТСЯ'})")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка планирования нескольких камер при общем лимите процессора
+Несколько синтетических камер (движущееся светлое пятно на шуме, чтобы детектор
+движения пропускал кадры на детекцию) обрабатываются MultiCameraProcessor
+с настоящей детекцией каскадом Хаара во временном каталоге (рабочая база
+не затрагивается). Для каждого лимита CPU выводит фактическую загрузку,
+число детекций по камерам, индекс справедливости Джейна и ожидание
+детекции. Одна камера статична - ей детекция почти не нужна.
+
+Запуск: python benchmarks/bench_multi_camera.py [--cameras 4] [--budgets 0.2,0.5,0.9] [--seconds 5]
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multi_camera import CameraStream, MultiCameraProcessor
+from simple_face_recognizer import SimpleFaceRecognizer
+
+
+class SyntheticCamera:
+    """Источник кадров с интерфейсом FrameGrabber и заданной частотой кадров"""
+    _frame_ids = itertools.count(1)
+
+    def __init__(self, seed, fps=25.0, moving=True, size=(640, 480)):
+        self.fps = fps
+        self.moving = moving
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.background = self.rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        self.started = time.monotonic()
+        self.last = -1
+        self.opened = True
+        self._lock = threading.Lock()
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+    def read_latest(self, after_id=0, timeout=1.0):
+        with self._lock:
+            number = int((time.monotonic() - self.started) * self.fps)
+            if not self.opened or number <= self.last:
+                return False, None, after_id, 0.0
+            self.last = number
+        frame = self.background.copy()
+        if self.moving:
+            x = 50 + (number * 7) % (self.size[0] - 200)
+            frame[150:300, x:x + 150] = 255
+        return True, frame, next(self._frame_ids), time.monotonic()
+
+
+def jain_index(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not values.any():
+        return 1.0
+    return float(values.sum() ** 2 / (len(values) * (values ** 2).sum()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Планирование нескольких камер")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--budgets", default="0.2,0.5,0.9", help="Лимиты CPU (доля ядра) через запятую")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=15.0)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_multi_camera_")
+    os.chdir(workdir)
+    recognizer = None
+    ok = True
+    try:
+        recognizer = SimpleFaceRecognizer()
+        for budget in (float(v) for v in args.budgets.split(",")):
+            # Последняя камера статична: детекция ей нужна только контрольная
+            streams = [CameraStream(f"cam{i + 1}", None, None,
+                                    grabber=SyntheticCamera(i, moving=i < args.cameras - 1))
+                       for i in range(args.cameras)]
+            processor = MultiCameraProcessor(recognizer, streams, cpu_budget=budget, target_fps=args.fps)
+            processor.start()
+            time.sleep(args.seconds)
+            stats = processor.get_stats()
+            processor.stop()
+
+            moving = stats['streams'][:-1]
+            fairness = jain_index([s['detections'] for s in moving])
+            print(f"Лимит CPU {budget:.0%}: загрузка {stats['cpu']:.0%}, справедливость {fairness:.3f}")
+            for s in stats['streams']:
+                print(f"  {s['name']}: кадров {s['frames']}, детекций {s['detections']}, отложено {s['deferred']}, "
+                      f"ожидание {s['wait_avg'] * 1000:.0f}/{s['wait_max'] * 1000:.0f} мс, CPU {s['cpu']:.0%}")
+            # Допуск на последний шаг, начатый до исчерпания бюджета
+            ok = ok and stats['cpu'] <= budget * 1.1 + 0.02 and fairness >= 0.9
+    finally:
+        if recognizer is not None:
+            recognizer.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк многопроцессного конвейера детекции
+Прогоняет одни и те же кадры через детекцию в текущем процессе и через
+ProcessPipeline с разным числом рабочих процессов, проверяет, что
+результаты совпадают и приходят по порядку, и сравнивает кадры/с.
+
+Кадры берутся из видео (--video) или каталога изображений (--images),
+иначе генерируются синтетически: схематичное лицо (как в bench_detection)
+движется по размытому фону, поэтому в рабочих процессах измеряется и
+извлечение признаков найденных лиц.
+
+Запуск: python benchmarks/bench_pipeline.py [--video file.mp4] [--frames 200] [--workers 1,2,4]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_detection import draw_face
+from process_pipeline import ProcessPipeline
+from simple_face_recognizer import SimpleFaceRecognizer
+
+
+def load_frames(args):
+    """Кадры 320x240, как в режиме реального времени"""
+    frames = []
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, (320, 240)))
+        cap.release()
+    elif args.images:
+        for filename in sorted(os.listdir(args.images)):
+            image = cv2.imread(os.path.join(args.images, filename))
+            if image is not None:
+                frames.append(cv2.resize(image, (320, 240)))
+            if len(frames) >= args.frames:
+                break
+    else:
+        rng = np.random.default_rng(0)
+        background = cv2.GaussianBlur(rng.integers(60, 200, size=(30, 40), dtype=np.uint8), (5, 5), 0)
+        background = cv2.resize(background, (320, 240))
+        face = draw_face(100)
+        for i in range(args.frames):
+            frame = background.copy()
+            x = (i * 3) % (320 - 100)
+            frame[60:160, x:x + 100] = face
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    return frames
+
+
+def summarize(faces):
+    """Сравнимое представление результата детекции"""
+    return [(tuple(int(v) for v in face['coordinates']),
+             None if face['features'] is None else np.round(face['features'], 6).tobytes())
+            for face in faces]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк многопроцессного конвейера")
+    parser.add_argument("--video")
+    parser.add_argument("--images")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        print("Нет кадров для теста")
+        return 1
+
+    detector = SimpleFaceRecognizer(detector_only=True)
+    start = time.perf_counter()
+    expected = [summarize(detector.detect_faces(frame)) for frame in frames]
+    base_fps = len(frames) / (time.perf_counter() - start)
+    faces_total = sum(len(faces) for faces in expected)
+    print(f"Кадров: {len(frames)}, найдено лиц: {faces_total}")
+    print(f"В текущем процессе:  {base_fps:8.1f} кадров/с")
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        pipeline = ProcessPipeline(workers=workers)
+        try:
+            # Прогрев: запуск процессов и загрузка каскадов
+            pipeline.submit(frames[0], block=True)
+            pipeline.poll(block=True)
+
+            results = []
+            start = time.perf_counter()
+            for frame in frames:
+                while pipeline.submit(frame, block=True, timeout=1.0) is None:
+                    pass
+                results.extend(pipeline.poll())
+            while len(results) < len(frames):
+                results.extend(pipeline.poll(block=True, timeout=5.0))
+            fps = len(frames) / (time.perf_counter() - start)
+        finally:
+            pipeline.close()
+
+        in_order = [seq for seq, _ in results] == list(range(1, len(frames) + 1))
+        same = [summarize(faces) for _, faces in results] == expected
+        print(f"Процессов: {workers:<2}        {fps:8.1f} кадров/с (x{fps / base_fps:.2f}), "
+              f"порядок {'сохранен' if in_order else 'НАРУШЕН'}, "
+              f"результаты {'совпадают' if same else 'РАЗЛИЧАЮТСЯ'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сжатого индекса галереи (float16 / int8)
+Индекс, как в приложении, открывается из хранилища признаков (файл,
+отображенный в память). Сравнивает с прежним путем на float64 память
+процесса, занятую индексом, объем файла признаков, который читается
+на каждый запрос, пропускную способность поиска и совпадение ответов
+(лучший человек и его оценка) с переоценкой по полным векторам и без нее.
+Сжатые режимы экономят память, но ищут медленнее float32: блоки кодов
+декодируются на каждый запрос.
+
+Запуск: python benchmarks/bench_quantization.py [--persons 5000] [--samples 3] [--queries 256]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureStore
+from gallery_index import GalleryIndex
+
+
+def make_gallery(persons, samples, dim, seed=0):
+    """Синтетическая галерея из неотрицательных векторов (как гистограммы LBP)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(0.5, size=(persons, dim))
+    gallery = {}
+    for p in range(persons):
+        noise = rng.normal(1.0, 0.35, size=(samples, dim)).clip(0)
+        gallery[f"person_{p}"] = list(centers[p] * noise)
+    return centers, gallery
+
+
+def make_queries(centers, count, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = rng.integers(0, centers.shape[0], size=count)
+    noise = rng.normal(1.0, 0.35, size=(count, centers.shape[1])).clip(0)
+    return centers[picked] * noise
+
+
+def reference_search(gallery, queries, top_k=3):
+    """Прежний путь: float64 признаки, среднее топ-k косинусных сходств"""
+    names = list(gallery)
+    matrix = np.vstack([np.vstack(gallery[name]) for name in names])
+    labels = np.repeat(np.arange(len(names)), [len(gallery[name]) for name in names])
+    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    similarities = queries @ matrix.T
+    results = []
+    for row in similarities:
+        best_name, best_score = None, -np.inf
+        for person_id, name in enumerate(names):
+            person = np.sort(row[labels == person_id])[::-1][:top_k]
+            if person.mean() > best_score:
+                best_name, best_score = name, person.mean()
+        results.append((best_name, float(best_score)))
+    elapsed = time.perf_counter() - start
+    return results, elapsed, matrix.nbytes
+
+
+def run_index(index, queries, batch):
+    """Ответы и время поиска пакетами по batch запросов"""
+    start = time.perf_counter()
+    results = []
+    for i in range(0, len(queries), batch):
+        results.extend(index.search_batch(queries[i:i + batch], -1.0))
+    return results, time.perf_counter() - start
+
+
+def mapped_bytes_per_query(index):
+    """Объем файла признаков, который читается на каждый запрос
+
+    float32 оценивает прямо по отображенной матрице, поэтому весь файл
+    фактически держится в памяти; сжатый индекс читает из файла только
+    образцы людей, переоцениваемых по полным векторам.
+    """
+    return 0 if index.compressed else index.matrix.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сжатого индекса галереи")
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=832)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--reference-queries", type=int, default=32,
+                        help="запросов для медленного эталонного пути float64")
+    args = parser.parse_args()
+
+    centers, gallery = make_gallery(args.persons, args.samples, args.dim)
+    queries = make_queries(centers, args.queries)
+
+    reference_count = min(args.reference_queries, args.queries)
+    reference, reference_s, reference_bytes = reference_search(gallery, queries[:reference_count])
+    print(f"Галерея: {args.persons} человек по {args.samples} образца, размерность {args.dim}")
+    print(f"float64 (прежний путь): {reference_bytes / 2**20:7.1f} МБ, "
+          f"{reference_count / reference_s:8.1f} запросов/с")
+
+    # Галерея записывается в хранилище признаков и открывается из него, как при запуске
+    workdir = tempfile.mkdtemp(prefix="bench_quantization_")
+    try:
+        builder = GalleryIndex(top_k=3)
+        builder.rebuild(gallery)
+        store = FeatureStore(workdir)
+        store.save(builder)
+        del builder
+        matrix, labels, names = store.load()
+
+        print(f"{'':<18} {'память':>9} {'файл/запрос':>12}")
+        modes = [("float32", 0), ("float16", 0), ("float16", 5), ("int8", 0), ("int8", 5)]
+        for precision, rerank in modes:
+            index = GalleryIndex(top_k=3, precision=precision, rerank=rerank)
+            index.attach(matrix, labels, names)
+            run_index(index, queries[:args.batch], args.batch)  # Прогрев
+            results, elapsed = run_index(index, queries, args.batch)
+
+            compared = results[:reference_count]
+            same = sum(r[0] == e[0] for r, e in zip(compared, reference))
+            score_error = max(abs(r[1] - e[1]) for r, e in zip(compared, reference))
+            label = precision if not rerank else f"{precision}+rerank {rerank}"
+            print(f"{label:<18} {index.resident_bytes() / 2**20:6.1f} МБ {mapped_bytes_per_query(index) / 2**20:9.1f} МБ, "
+                  f"{len(queries) / elapsed:8.1f} запросов/с, совпадение {same}/{reference_count}, "
+                  f"макс. отклонение оценки {score_error:.1e}")
+            del index
+        del matrix
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
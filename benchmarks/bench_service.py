@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка и бенчмарк сервиса распознавания на localhost
+Запускает RecognitionService во временном каталоге (рабочая база не
+затрагивается) на свободном TCP-порту или Unix-сокете, добавляет через
+/enroll синтетических людей (текстуры-кропы лиц), затем из нескольких
+потоков шлет /recognize и проверяет ответы, в середине нагрузки
+выполняет /reload. Выводит запросы/с, задержки и средний размер пакета
+поиска по галерее.
+
+Запуск: python benchmarks/bench_service.py [--persons 50] [--clients 8] [--requests 400] [--unix]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recognition_service import RecognitionService, create_server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def make_person_crop(person, sample, seed=0):
+    """Кроп лица человека: своя крупная текстура и шум образца"""
+    base = np.random.default_rng(seed + person).integers(0, 256, size=(12, 12)).astype(np.float32)
+    face = cv2.resize(base, (120, 120), interpolation=cv2.INTER_CUBIC)
+    noise = np.random.default_rng(seed + 100000 + person * 97 + sample).normal(0, 6, size=face.shape)
+    crop = np.clip(face + noise, 0, 255).astype(np.uint8)
+    return base64.b64encode(cv2.imencode(".png", crop)[1].tobytes()).decode("ascii")
+
+
+def call(connection, method, path, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сервиса распознавания")
+    parser.add_argument("--persons", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--unix", action="store_true", help="Unix-сокет вместо TCP")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_service_")
+    os.chdir(workdir)
+    service = server = None
+    try:
+        service = RecognitionService("sqlite", args.max_batch, args.max_wait_ms / 1000.0)
+        unix_path = os.path.join(workdir, "service.sock") if args.unix else None
+        server = create_server(service, port=0, unix_path=unix_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def connect():
+            if unix_path:
+                return UnixHTTPConnection(unix_path)
+            return http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+
+        connection = connect()
+        start = time.perf_counter()
+        for person in range(args.persons):
+            for sample in range(2):
+                status, response = call(connection, "POST", "/enroll", {
+                    "image": make_person_crop(person, sample), "crop": True,
+                    "name": f"Person {person:03d}", "position": "", "age": 30, "rank": ""})
+                if status != 200:
+                    print(f"Ошибка /enroll: {response}")
+                    return 1
+        print(f"Добавлено людей: {args.persons} ({time.perf_counter() - start:.1f} с), "
+              f"{'Unix-сокет' if unix_path else 'TCP'}")
+
+        queries = [(person, make_person_crop(person, 5)) for person in range(args.persons)]
+        latencies = []
+        errors = []
+        correct = [0]
+        lock = threading.Lock()
+        per_client = max(1, args.requests // args.clients)
+
+        def client(index):
+            conn = connect()
+            for i in range(per_client):
+                person, image = queries[(index * per_client + i) % len(queries)]
+                started = time.perf_counter()
+                status, response = call(conn, "POST", "/recognize", {"image": image, "crop": True})
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if status != 200:
+                        errors.append(response)
+                    elif response["faces"] and response["faces"][0]["name"] == f"Person {person:03d}":
+                        correct[0] += 1
+            conn.close()
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # Перезагрузка базы под нагрузкой
+        time.sleep(0.2)
+        status, reload_response = call(connect(), "POST", "/reload", {})
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        status, health = call(connection, "GET", "/health")
+        total = len(latencies)
+        latencies_ms = np.asarray(latencies) * 1000
+        print(f"Запросов: {total}, клиентов: {args.clients}, {total / elapsed:.1f} запросов/с, "
+              f"задержка p50 {np.percentile(latencies_ms, 50):.1f} мс, p99 {np.percentile(latencies_ms, 99):.1f} мс")
+        print(f"Опознано верно: {correct[0]}/{total}, ошибок: {len(errors)}")
+        print(f"Пакеты поиска: {health['batching']['batches']}, "
+              f"средний размер {health['batching']['average_batch']:.2f}, наибольший {health['batching']['largest_batch']}")
+        print(f"Перезагрузка: поколение {reload_response.get('generation')}, "
+              f"людей {reload_response.get('persons')}, {reload_response.get('seconds')} с")
+        ok = not errors and correct[0] == total and reload_response.get('persons') == args.persons
+        return 0 if ok else 1
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if service is not None:
+            service.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Набор микробенчмарков горячих путей SimpleFaceRecognizer
+На синтетических данных (нарисованные лица или шумовые ROI, галерея
+persons x samples) измеряет распределение задержек calculate_lbp,
+calculate_texture_features, extract_features, detect_faces,
+detect_faces_from_image, recognize_face (полный путь от ROI: признаки и
+поиск), match_gallery (только поиск по галерее с готовыми признаками),
+save_database и load_database.
+Результаты сохраняются в JSON; с --compare выводится сравнение медиан
+с сохраненным ранее прогоном.
+
+База данных создается во временном каталоге, рабочая база не трогается.
+
+Запуск: python benchmarks/bench_suite.py [--persons 500] [--samples 3] [--repeat 50]
+        [--output results.json] [--compare previous.json] [--only extract_features,recognize_face]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_detection import draw_face, synthetic_photos
+from simple_face_recognizer import SimpleFaceRecognizer
+
+
+def make_rois(count, kind, seed=0):
+    """ROI 100x100: нарисованные лица с шумом или чистый шум"""
+    rng = np.random.default_rng(seed)
+    rois = []
+    for _ in range(count):
+        if kind == "noise":
+            roi = rng.integers(0, 256, size=(100, 100), dtype=np.uint8)
+        else:
+            noise = rng.normal(0, 12, size=(100, 100))
+            roi = np.clip(draw_face(100).astype(np.float64) + noise, 0, 255).astype(np.uint8)
+        rois.append(roi)
+    return rois
+
+
+def make_frame(width, height, faces, seed=0):
+    """Кадр камеры с несколькими нарисованными лицами"""
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(60, 200, size=(height, width), dtype=np.uint8), (9, 9), 0)
+    size = max(40, height // 3)
+    for i in range(faces):
+        x = int((i + 0.5) * width / max(faces, 1) - size / 2)
+        x = min(max(0, x), width - size)
+        background[height // 4:height // 4 + size, x:x + size] = draw_face(size)
+    return cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+
+
+def fill_gallery(recognizer, persons, samples, seed=0):
+    """Синтетическая галерея через add_persons_bulk: признаки нарисованного лица с шумом
+
+    Признаки разносятся вокруг признаков нарисованного лица, чтобы люди
+    различались; ROI (для снимков лиц) - нарисованное лицо с шумом.
+    Возвращает имена добавленных людей.
+    """
+    rng = np.random.default_rng(seed)
+    rois = make_rois(8, "face", seed)
+    base = recognizer.extract_features(rois[0])
+    scale = np.abs(base).mean() * 0.3
+    batch = []
+    for person in range(persons):
+        name = f"Person {person:05d}"
+        center = base + rng.normal(0, scale, size=base.shape)
+        batch.append({
+            'info': {'name': name, 'position': '', 'age': 0, 'rank': ''},
+            'face_rois': [rois[person % len(rois)]],
+            'features': [np.abs(center + rng.normal(0, scale * 0.2, size=base.shape)) for _ in range(samples)]
+        })
+    recognizer.add_persons_bulk(batch)
+    return [person['info']['name'] for person in batch]
+
+
+def measure(func, repeat, warmup=1):
+    """Задержки вызовов (мс); вывод функции подавляется"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            func()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+    times = np.asarray(times)
+    return {
+        'n': int(times.size),
+        'mean_ms': float(times.mean()),
+        'min_ms': float(times.min()),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p90_ms': float(np.percentile(times, 90)),
+        'p99_ms': float(np.percentile(times, 99)),
+        'max_ms': float(times.max())
+    }
+
+
+def cycle(items):
+    """Функция, возвращающая элементы по кругу (разные входы на каждый вызов)"""
+    state = {'i': 0}
+
+    def next_item():
+        item = items[state['i'] % len(items)]
+        state['i'] += 1
+        return item
+    return next_item
+
+
+def build_cases(recognizer, args, workdir, names):
+    """Список (имя, функция, число повторов)"""
+    rois = make_rois(max(8, args.rois), args.roi_kind)
+    roi = cycle(rois)
+    query_features = [recognizer.extract_features(r) for r in rois]
+    query = cycle(list(zip(rois, query_features)))
+    person = cycle(names)
+
+    frame = make_frame(args.frame_width, args.frame_height, args.frame_faces)
+    photo_paths = []
+    for i, photo in enumerate(synthetic_photos(args.photos)):
+        path = os.path.join(workdir, f"photo_{i}.jpg")
+        cv2.imwrite(path, photo)
+        photo_paths.append(path)
+    photo = cycle(photo_paths)
+
+    def save():
+        # Правка одного человека (без смены имени) помечает галерею измененной,
+        # поэтому запись включает и признаки, и запись о человеке
+        name = person()
+        info = recognizer.get_person_info(name)
+        recognizer.update_person_info(name, info)
+        recognizer.flush()
+
+    return [
+        ('calculate_lbp', lambda: recognizer.calculate_lbp(roi()), args.repeat),
+        ('calculate_texture_features', lambda: recognizer.calculate_texture_features(roi()), args.repeat),
+        ('extract_features', lambda: recognizer.extract_features(roi()), args.repeat),
+        ('detect_faces', lambda: recognizer.detect_faces(frame), args.repeat),
+        ('detect_faces_from_image', lambda: recognizer.detect_faces_from_image(photo()), args.image_repeat),
+        ('recognize_face', lambda: recognizer.recognize_face(roi()), args.repeat),
+        ('match_gallery', lambda: recognizer.recognize_face(*query()), args.repeat),
+        ('save_database', save, args.io_repeat),
+        ('load_database', recognizer.load_database, args.io_repeat),
+    ]
+
+
+def compare(results, previous_path):
+    """Сравнение медиан с предыдущим прогоном"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f).get('results', {})
+    print(f"\nСравнение с {previous_path} (медиана, было -> стало):")
+    for name, stats in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]['p50_ms']
+        ratio = stats['p50_ms'] / before if before > 0 else float('inf')
+        mark = "  РЕГРЕССИЯ" if ratio > 1.2 else ""
+        print(f"  {name:<28} {before:9.3f} -> {stats['p50_ms']:9.3f} мс (x{ratio:.2f}){mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей распознавания")
+    parser.add_argument("--persons", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--image-repeat", type=int, default=5, help="повторов detect_faces_from_image")
+    parser.add_argument("--io-repeat", type=int, default=10, help="повторов save/load_database")
+    parser.add_argument("--rois", type=int, default=16)
+    parser.add_argument("--roi-kind", choices=("face", "noise"), default="face")
+    parser.add_argument("--photos", type=int, default=3)
+    parser.add_argument("--frame-width", type=int, default=320)
+    parser.add_argument("--frame-height", type=int, default=240)
+    parser.add_argument("--frame-faces", type=int, default=2)
+    parser.add_argument("--storage", choices=("sqlite", "pickle"), default="sqlite")
+    parser.add_argument("--only", help="через запятую: какие функции измерять")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    previous = os.path.abspath(args.compare) if args.compare else None
+    selected = set(args.only.split(",")) if args.only else None
+
+    # Рабочая база приложения не затрагивается
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    os.chdir(workdir)
+    recognizer = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            recognizer = SimpleFaceRecognizer(storage_backend=args.storage)
+            names = fill_gallery(recognizer, args.persons, args.samples)
+
+        print(f"Галерея: {args.persons} x {args.samples} образцов, хранилище: {args.storage}")
+        print(f"{'функция':<28} {'n':>4} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (мс)")
+        results = {}
+        for name, func, repeat in build_cases(recognizer, args, workdir, names):
+            if selected and name not in selected:
+                continue
+            stats = measure(func, max(1, repeat))
+            results[name] = stats
+            print(f"{name:<28} {stats['n']:>4} {stats['p50_ms']:9.3f} {stats['p90_ms']:9.3f} "
+                  f"{stats['p99_ms']:9.3f} {stats['max_ms']:9.3f}")
+    finally:
+        if recognizer is not None:
+            recognizer.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+    if previous:
+        compare(results, previous)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
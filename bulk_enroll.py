@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Массовое добавление сотрудников из каталога фотографий (без интерфейса)
+Каталог содержит по папке на человека (имя папки - имя, "_" заменяется
+пробелом), в папке - одна или несколько фотографий. Необязательный CSV
+с колонками name, position, age, rank дополняет данные о людях.
+
+Детекция и извлечение признаков выполняются в пуле процессов, результаты
+по мере готовности дописываются в файл состояния, поэтому прерванный
+импорт продолжается с того же места. Галерея записывается один раз в
+конце, отклоненные фотографии (нет лица, несколько лиц, не читается)
+сохраняются в отчет CSV.
+
+Запуск: python bulk_enroll.py photos/ [--csv staff.csv] [--workers 4] [--report rejected.csv]
+"""
+
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import pickle
+import sys
+import time
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+# Детектор рабочего процесса (создается инициализатором пула)
+_detector = None
+
+
+def _init_worker():
+    global _detector
+    import cv2
+    from simple_face_recognizer import SimpleFaceRecognizer
+
+    # Параллелизм дают процессы, внутренние потоки OpenCV только мешают
+    cv2.setNumThreads(1)
+    _detector = SimpleFaceRecognizer(detector_only=True)
+
+
+def _process_photo(task):
+    """Рабочий процесс: детекция лица и признаки для одной фотографии"""
+    name, path = task
+    record = {'path': path, 'name': name, 'face_roi': None, 'features': None, 'reason': None}
+    try:
+        faces = _detector.detect_faces_from_image(path)
+    except Exception as e:
+        record['reason'] = f"ошибка: {e}"
+        return record
+
+    if not faces:
+        record['reason'] = "лицо не найдено или файл не читается"
+    elif len(faces) > 1:
+        record['reason'] = f"найдено несколько лиц: {len(faces)}"
+    else:
+        record['face_roi'] = faces[0]['face_roi']
+        record['features'] = faces[0]['features']
+    return record
+
+
+def scan_photos(root):
+    """Список задач (имя человека, путь к фотографии) по папкам каталога"""
+    tasks = []
+    for folder in sorted(os.listdir(root)):
+        person_dir = os.path.join(root, folder)
+        if not os.path.isdir(person_dir):
+            continue
+        name = folder.replace("_", " ").strip()
+        for dirpath, _, filenames in os.walk(person_dir):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    tasks.append((name, os.path.join(dirpath, filename)))
+    return tasks
+
+
+def load_person_info(csv_path):
+    """Данные о людях из CSV: имя -> {'position', 'age', 'rank'}"""
+    info = {}
+    if not csv_path:
+        return info
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('name') or '').replace("_", " ").strip()
+            if not name:
+                continue
+            try:
+                age = int(row.get('age') or 0)
+            except ValueError:
+                print(f"Некорректный возраст у {name}: {row.get('age')}")
+                age = 0
+            info[name] = {
+                'position': (row.get('position') or '').strip(),
+                'age': age,
+                'rank': (row.get('rank') or '').strip()
+            }
+    return info
+
+
+class EnrollmentState:
+    """Файл состояния импорта: записи дописываются по одной (pickle подряд)
+
+    Записи: результат обработки фотографии (словарь), ('committing', [пути])
+    перед записью галереи и ('committed', [пути]) после нее. Оборванная
+    последняя запись при чтении пропускается.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}  # Путь -> результат, еще не записанный в галерею
+        self.committed = set()  # Пути, уже попавшие в галерею
+        self.committing = set()  # Пути, запись которых в галерею могла не завершиться
+        self._file = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            while True:
+                offset = f.tell()
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    if f.tell() > offset:
+                        f.truncate(offset)
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+                    # Обрыв при прерывании: хвост отбрасывается, чтобы новые записи шли за целыми
+                    print("Последняя запись файла состояния повреждена, она будет пересчитана")
+                    f.truncate(offset)
+                    break
+                if isinstance(record, tuple) and record[0] == 'committing':
+                    self.committing.update(record[1])
+                elif isinstance(record, tuple) and record[0] == 'committed':
+                    for path in record[1]:
+                        self.results.pop(path, None)
+                        self.committing.discard(path)
+                        self.committed.add(path)
+                else:
+                    self.results[record['path']] = record
+
+    def append(self, record):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, 'ab')
+        pickle.dump(record, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.flush()
+        if isinstance(record, dict):
+            self.results[record['path']] = record
+
+    def mark_committing(self, paths):
+        """Отметка перед записью галереи (на диск с fsync)"""
+        self.append(('committing', list(paths)))
+        os.fsync(self._file.fileno())
+        self.committing.update(paths)
+
+    def mark_committed(self, paths):
+        self.append(('committed', list(paths)))
+        for path in paths:
+            self.results.pop(path, None)
+            self.committing.discard(path)
+            self.committed.add(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def done(self):
+        return self.committed | set(self.results)
+
+
+def run_pool(tasks, workers, state):
+    """Обработка фотографий в пуле процессов с выводом прогресса"""
+    total = len(tasks)
+    rejected = 0
+    start = time.perf_counter()
+
+    def report(done, final=False):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        end = "\n" if final else ""
+        print(f"\rОбработано {done}/{total} ({done / elapsed:.1f} фото/с), отклонено: {rejected}",
+              end=end, flush=True)
+
+    if workers <= 1:
+        _init_worker()
+        results = map(_process_photo, tasks)
+        pool = None
+    else:
+        pool = mp.get_context("spawn").Pool(workers, initializer=_init_worker)
+        results = pool.imap_unordered(_process_photo, tasks, chunksize=4)
+
+    try:
+        for done, record in enumerate(results, 1):
+            state.append(record)
+            if record['features'] is None:
+                rejected += 1
+            if done % 10 == 0 and done < total:
+                report(done)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if total:
+        report(total, final=True)
+
+
+def write_rejected(report_path, records):
+    with open(report_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'path', 'reason'])
+        for record in records:
+            writer.writerow([record['name'], record['path'], record['reason']])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовое добавление сотрудников из каталога фотографий")
+    parser.add_argument("photos", help="Каталог: по папке на человека")
+    parser.add_argument("--csv", help="CSV с колонками name, position, age, rank")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--state", default="database/bulk_enroll.state",
+                        help="Файл состояния для продолжения прерванного импорта")
+    parser.add_argument("--report", default="rejected.csv", help="Отчет об отклоненных фотографиях")
+    parser.add_argument("--restart", action="store_true", help="Начать заново, не используя файл состояния")
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "pickle"))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.photos):
+        print(f"Каталог не найден: {args.photos}")
+        return 1
+
+    person_info = load_person_info(args.csv)
+    tasks = scan_photos(args.photos)
+    if not tasks:
+        print("Фотографии не найдены")
+        return 1
+
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+    state = EnrollmentState(args.state)
+    state.load()
+
+    done = state.done
+    pending = [task for task in tasks if task[1] not in done]
+    print(f"Людей: {len(set(name for name, _ in tasks))}, фотографий: {len(tasks)}, "
+          f"уже обработано: {len(tasks) - len(pending)}")
+
+    try:
+        run_pool(pending, args.workers, state)
+    except KeyboardInterrupt:
+        state.close()
+        print("\nИмпорт прерван, при повторном запуске он продолжится с этого места")
+        return 1
+
+    from image_store import ImageStore
+    from simple_face_recognizer import SimpleFaceRecognizer
+    recognizer = SimpleFaceRecognizer(storage_backend=args.storage)
+
+    # Образцы по людям; в галерею попадают только фотографии из текущего каталога
+    task_paths = set(path for _, path in tasks)
+    persons = {}
+    rejected = []
+    already_added = 0
+    for record in state.results.values():
+        if record['path'] not in task_paths:
+            continue
+        if record['features'] is None:
+            rejected.append(record)
+            continue
+        if record['path'] in state.committing:
+            # Прошлый запуск прервался во время записи галереи: образец, изображение
+            # которого уже есть у этого человека, повторно не добавляется
+            refs = recognizer.persons_data.get(record['name'], {}).get('face_image_refs', [])
+            if ImageStore.make_ref(record['face_roi']) in refs:
+                already_added += 1
+                continue
+        person = persons.setdefault(record['name'], {
+            'info': dict(person_info.get(record['name'], {'position': '', 'age': 0, 'rank': ''}),
+                         name=record['name']),
+            'face_rois': [],
+            'features': [],
+            'source_path': record['path']
+        })
+        person['face_rois'].append(record['face_roi'])
+        person['features'].append(record['features'])
+
+    missing_info = sorted(name for name in persons if name not in person_info)
+    if args.csv and missing_info:
+        print(f"Нет данных в CSV для {len(missing_info)} чел.: {', '.join(missing_info[:10])}")
+
+    if already_added:
+        print(f"Уже в галерее после прерванной записи: {already_added} образцов")
+
+    # Отметка "committing" пишется до галереи: если запуск прервется между записью
+    # галереи и отметкой "committed", повторный запуск не задублирует образцы
+    commit_paths = [path for path in state.results if path in task_paths]
+    state.mark_committing(commit_paths)
+    try:
+        added_persons, added_samples = recognizer.add_persons_bulk(
+            [persons[name] for name in sorted(persons)])
+    finally:
+        recognizer.close()
+
+    state.mark_committed(commit_paths)
+    state.close()
+
+    if rejected:
+        write_rejected(args.report, sorted(rejected, key=lambda record: record['path']))
+    print(f"Добавлено людей: {added_persons}, образцов: {added_samples}, "
+          f"отклонено фотографий: {len(rejected)}" + (f" (отчет: {args.report})" if rejected else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
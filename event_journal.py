@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал событий входа/выхода (append-only)
+События дописываются в конец файла по одной JSON-строке.
+Фоновый поток собирает события в группы и фиксирует их одной
+записью с fsync (group commit), поэтому отметка входа не требует
+перезаписи всей базы данных. append только ставит событие в очередь;
+чтобы считать событие сохраненным, нужно дождаться wait_durable(seq).
+После сохранения снимка базы журнал усекается до событий, которые
+в снимок еще не попали.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class EventJournal:
+    def __init__(self, path, commit_interval=0.05, max_batch=256):
+        self.path = path
+        self.commit_interval = commit_interval  # Сколько ждать накопления группы
+        self.max_batch = max_batch
+
+        self.last_seq = 0  # Номер последнего записанного события
+        self.durable_seq = 0  # Номер последнего события, зафиксированного fsync
+        self.pending_events = 0  # Событий в журнале после последнего снимка
+        self.commits = 0  # Количество групповых фиксаций
+
+        self._buffer = []
+        self._file = None
+        self._writer = None
+        self._closed = False
+        self._write_error = None
+        self._cond = threading.Condition()
+        self._io_lock = threading.RLock()
+
+    def _ensure_writer(self):
+        """Запуск потока фиксации (вызывается под _cond)"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, daemon=True)
+            self._writer.start()
+
+    def _open_file(self):
+        """Открытие файла журнала (вызывается под _io_lock)"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, event):
+        """Постановка события в очередь на запись, возвращает его номер
+
+        Событие становится долговечным только после групповой фиксации,
+        дождаться ее можно через wait_durable(seq).
+        """
+        with self._cond:
+            self._ensure_writer()
+            self.last_seq += 1
+            record = dict(event, seq=self.last_seq)
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            self.pending_events += 1
+            self._cond.notify()
+            return self.last_seq
+
+    def wait_durable(self, seq, timeout=None):
+        """Ожидание записи события с номером seq на диск, True при успехе"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.durable_seq < seq:
+                if self._write_error is not None:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _run(self):
+        """Поток групповой фиксации"""
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+
+                # Даем накопиться группе событий
+                deadline = time.monotonic() + self.commit_interval
+                while len(self._buffer) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            self.flush()
+
+    def flush(self):
+        """Запись накопленных событий на диск с fsync"""
+        with self._io_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                batch_seq = self.last_seq
+            if not batch:
+                return
+            try:
+                self._open_file()
+                self._file.write("\n".join(batch) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                print(f"Ошибка записи журнала событий: {e}")
+                with self._cond:
+                    # События остаются в очереди до следующей попытки
+                    self._buffer = batch + self._buffer
+                    self._write_error = e
+                    self._cond.notify_all()
+                return
+            self.commits += 1
+            with self._cond:
+                self.durable_seq = max(self.durable_seq, batch_seq)
+                self._write_error = None
+                self._cond.notify_all()
+
+    def _read_records(self):
+        """Чтение всех целых записей журнала (оборванная последняя строка пропускается)"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"Пропущена поврежденная запись журнала: {line[:50]}")
+        return records
+
+    def replay(self, after_seq=0):
+        """События, записанные после снимка с номером after_seq"""
+        with self._io_lock:
+            records = self._read_records()
+            events = [record for record in records if record.get('seq', 0) > after_seq]
+            with self._cond:
+                self.last_seq = max([after_seq, self.last_seq] + [record.get('seq', 0) for record in records])
+                self.durable_seq = max(self.durable_seq, self.last_seq)
+                self.pending_events = len(events)
+            return events
+
+    def truncate(self, up_to_seq):
+        """Удаление событий, уже вошедших в снимок (номер <= up_to_seq)"""
+        with self._io_lock:
+            if self._file is None and not os.path.exists(self.path):
+                return
+            self.flush()
+            records = [record for record in self._read_records() if record.get('seq', 0) > up_to_seq]
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+            self._open_file()
+            with self._cond:
+                self.pending_events = len(records) + len(self._buffer)
+
+    def close(self):
+        """Остановка потока фиксации и запись оставшихся событий"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with self._cond:
+            self._writer = None
+            self._closed = False
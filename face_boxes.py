@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Операции над рамками лиц (x, y, w, h)
+Общие для детекции и сопровождения: матрица IoU и подавление
+немаксимумов, которое кроме перекрытия по IoU убирает и вложенные
+рамки (маленькая рамка внутри большой дает низкий IoU, но это то же лицо).
+"""
+
+import numpy as np
+
+
+def _intersection_matrix(a, b):
+    """Площади пересечений рамок a и b"""
+    x1 = np.maximum(a[:, np.newaxis, 0], b[np.newaxis, :, 0])
+    y1 = np.maximum(a[:, np.newaxis, 1], b[np.newaxis, :, 1])
+    x2 = np.minimum((a[:, 0] + a[:, 2])[:, np.newaxis], (b[:, 0] + b[:, 2])[np.newaxis, :])
+    y2 = np.minimum((a[:, 1] + a[:, 3])[:, np.newaxis], (b[:, 1] + b[:, 3])[np.newaxis, :])
+    return np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Матрица IoU для рамок (x, y, w, h)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    intersection = _intersection_matrix(a, b)
+    union = (a[:, 2] * a[:, 3])[:, np.newaxis] + (b[:, 2] * b[:, 3])[np.newaxis, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+def containment_matrix(boxes_a, boxes_b):
+    """Доля меньшей из двух рамок, покрытая пересечением"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    intersection = _intersection_matrix(a, b)
+    smaller = np.minimum((a[:, 2] * a[:, 3])[:, np.newaxis], (b[:, 2] * b[:, 3])[np.newaxis, :])
+    return intersection / np.maximum(smaller, 1e-6)
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3, containment_threshold=0.8):
+    """Подавление немаксимумов: индексы оставленных рамок по убыванию оценки
+
+    Рамка отбрасывается, если ее IoU с уже оставленной рамкой с большей
+    оценкой не меньше iou_threshold или если одна из рамок почти целиком
+    (не меньше containment_threshold площади меньшей) лежит внутри другой.
+    containment_threshold=None отключает проверку вложенности.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(-np.asarray(scores, dtype=np.float32).reshape(-1), kind='stable')
+    ordered = boxes[order]
+    suppress = iou_matrix(ordered, ordered) >= iou_threshold
+    if containment_threshold is not None:
+        suppress |= containment_matrix(ordered, ordered) >= containment_threshold
+
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= ~suppress[i, i + 1:]
+    return order[keep]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Сопровождение лиц между детекциями
+Детекции связываются с существующими треками по IoU, а между детекциями
+рамки сдвигаются поиском шаблона лица (cv2.matchTemplate) рядом с прежним
+положением. Трек запоминает личность после нескольких одинаковых ответов
+распознавания и дальше перепроверяется только периодически, поэтому
+человек перед камерой не распознается заново на каждой детекции.
+"""
+
+import itertools
+import time
+
+import cv2
+import numpy as np
+
+from face_boxes import iou_matrix
+
+
+class Track:
+    _ids = itertools.count(1)
+
+    def __init__(self, box, face, template):
+        self.track_id = next(self._ids)
+        self.box = tuple(int(v) for v in box)
+        self.face = face  # Последняя детекция: face_roi, features
+        self.template = template
+        self.missed = 0  # Детекций подряд без совпадения
+
+        # Личность: кандидат и сколько раз подряд он подтвержден
+        self.name = None
+        self.confidence = 0.0
+        self.votes = 0
+        self.confirmed = False
+        self.last_recognized = None
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=2, confirm_votes=2, recheck_interval=3.0,
+                 match_threshold=0.5, confidence_threshold=0.65):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed  # Сколько детекций трек живет без совпадения
+        self.confirm_votes = confirm_votes  # Одинаковых ответов подряд для подтверждения личности
+        self.recheck_interval = recheck_interval  # Период перепроверки подтвержденной личности (с)
+        self.match_threshold = match_threshold  # Минимальное сходство шаблона при сдвиге рамки
+        self.confidence_threshold = confidence_threshold
+
+        self.tracks = []
+
+        # Счетчики
+        self.recognitions = 0  # Лиц отправлено на распознавание
+        self.cached = 0  # Лиц, для которых использована запомненная личность
+
+    def reset(self):
+        self.tracks = []
+
+    @staticmethod
+    def _crop(gray, box):
+        x, y, w, h = box
+        return gray[max(0, y):y + h, max(0, x):x + w]
+
+    def update(self, faces, gray):
+        """Связывание детекций (словари с 'coordinates') с треками
+
+        Возвращает список актуальных треков.
+        """
+        boxes = [face['coordinates'] for face in faces]
+        matched_tracks = set()
+        matched_faces = set()
+
+        if self.tracks and boxes:
+            overlaps = iou_matrix([track.box for track in self.tracks], boxes)
+            # Жадное сопоставление по убыванию IoU
+            for flat in np.argsort(-overlaps, axis=None):
+                t, f = np.unravel_index(flat, overlaps.shape)
+                if overlaps[t, f] < self.iou_threshold:
+                    break
+                if t in matched_tracks or f in matched_faces:
+                    continue
+                track = self.tracks[t]
+                track.box = tuple(int(v) for v in boxes[f])
+                track.face = faces[f]
+                track.template = self._crop(gray, track.box).copy()
+                track.missed = 0
+                matched_tracks.add(t)
+                matched_faces.add(f)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                track.face = None
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        for f, face in enumerate(faces):
+            if f not in matched_faces:
+                box = face['coordinates']
+                survivors.append(Track(box, face, self._crop(gray, box).copy()))
+
+        self.tracks = survivors
+        return self.tracks
+
+    def propagate(self, gray):
+        """Сдвиг рамок между детекциями поиском шаблона рядом с прежним положением"""
+        for track in self.tracks:
+            template = track.template
+            if template is None or template.size == 0:
+                continue
+            x, y, w, h = track.box
+            margin_x, margin_y = w // 2, h // 2
+            x1, y1 = max(0, x - margin_x), max(0, y - margin_y)
+            x2 = min(gray.shape[1], x + w + margin_x)
+            y2 = min(gray.shape[0], y + h + margin_y)
+            window = gray[y1:y2, x1:x2]
+            if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+                continue
+
+            result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, location = cv2.minMaxLoc(result)
+            if score >= self.match_threshold:
+                track.box = (x1 + location[0], y1 + location[1], w, h)
+
+    def needs_recognition(self, track, now=None):
+        """Нужно ли распознавать трек: новый, неуверенный или пора перепроверить"""
+        if track.face is None:
+            return False
+        if not track.confirmed:
+            return True
+        now = time.monotonic() if now is None else now
+        return now - track.last_recognized >= self.recheck_interval
+
+    def set_identity(self, track, name, confidence, now=None):
+        """Учет ответа распознавания для трека"""
+        now = time.monotonic() if now is None else now
+        if confidence <= self.confidence_threshold:
+            name = None
+        track.last_recognized = now
+
+        if name == track.name and track.votes > 0:
+            track.votes += 1
+        else:
+            # Новый или противоречащий ответ - личность снова не подтверждена
+            track.votes = 1
+            track.confirmed = False
+        track.name = name
+        track.confidence = confidence
+        if track.votes >= self.confirm_votes:
+            track.confirmed = True
+
+    def recognize(self, recognizer, now=None):
+        """Распознавание только тех треков, которым это нужно"""
+        now = time.monotonic() if now is None else now
+        pending = [track for track in self.tracks if self.needs_recognition(track, now)]
+        self.cached += sum(1 for track in self.tracks if track.face is not None) - len(pending)
+        if not pending:
+            return
+        self.recognitions += len(pending)
+
+        results = recognizer.recognize_faces(
+            [track.face['face_roi'] for track in pending],
+            [track.face.get('features') for track in pending])
+        for track, (name, confidence) in zip(pending, results):
+            self.set_identity(track, name, confidence, now)
+
+    def as_faces(self):
+        """Треки в виде словарей лиц для отрисовки
+
+        face_roi и features - из последней детекции трека (None, если на
+        последней детекции трек не найден).
+        """
+        return [{
+            'coordinates': track.box,
+            'name': track.name,
+            'confidence': track.confidence,
+            'track_id': track.track_id,
+            'face_roi': track.face['face_roi'] if track.face is not None else None,
+            'features': track.face.get('features') if track.face is not None else None
+        } for track in self.tracks]
+
+    def get_stats(self):
+        return {
+            'tracks': len(self.tracks),
+            'recognitions': self.recognitions,
+            'cached': self.cached
+        }
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище векторов признаков галереи в файле с отображением в память
+Матрица образцов (float32) хранится в .npy файле и открывается через
+np.load(mmap_mode='r'): запуск не зависит от размера галереи, а страницы
+файла разделяются между процессами. Рядом лежит небольшой JSON с версией
+формата, размерностью и именами людей. Запись идет в новые файлы, а
+переключение на них - атомарной заменой файла метаданных.
+"""
+
+import json
+import os
+import uuid
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+
+class FeatureStore:
+    def __init__(self, directory="database", name="features"):
+        self.directory = directory
+        self.name = name
+        self.meta_path = os.path.join(directory, f"{name}_meta.json")
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def _read_meta(self):
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self):
+        """Открытие матрицы признаков: (матрица, метки строк, имена) или None"""
+        if not self.exists():
+            return None
+        try:
+            meta = self._read_meta()
+            if meta.get('version') != FORMAT_VERSION:
+                print(f"Неподдерживаемая версия хранилища признаков: {meta.get('version')}")
+                return None
+
+            matrix = np.load(os.path.join(self.directory, meta['matrix_file']), mmap_mode='r')
+            labels = np.load(os.path.join(self.directory, meta['labels_file']))
+
+            if matrix.dtype != np.float32 or matrix.ndim != 2 or matrix.shape != (meta['rows'], meta['dim']):
+                print("Хранилище признаков повреждено: размеры не совпадают с метаданными")
+                return None
+            if labels.shape[0] != matrix.shape[0]:
+                print("Хранилище признаков повреждено: число меток не совпадает с числом строк")
+                return None
+
+            self._remove_stale_files(meta)
+            return matrix, labels.astype(np.int32, copy=False), meta['names']
+
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ошибка при открытии хранилища признаков: {e}")
+            return None
+
+    def save(self, gallery_index):
+        """Запись матрицы и меток индекса галереи в новое поколение файлов"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        generation = uuid.uuid4().hex[:12]
+        matrix_file = f"{self.name}_{generation}.npy"
+        labels_file = f"{self.name}_{generation}_labels.npy"
+
+        matrix, labels, names = gallery_index.snapshot()
+
+        self._write_array(matrix_file, matrix)
+        self._write_array(labels_file, labels)
+
+        meta = {
+            'version': FORMAT_VERSION,
+            'dtype': 'float32',
+            'rows': int(matrix.shape[0]),
+            'dim': int(matrix.shape[1]),
+            'matrix_file': matrix_file,
+            'labels_file': labels_file,
+            'names': names
+        }
+        temp_path = self.meta_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.meta_path)
+
+        self._remove_stale_files(meta)
+
+    def _write_array(self, filename, array):
+        """Запись массива в .npy с fsync"""
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_stale_files(self, meta):
+        """Удаление файлов прежних поколений (открытые в памяти могут не удалиться)"""
+        current = {meta['matrix_file'], meta['labels_file']}
+        prefix = f"{self.name}_"
+        for filename in os.listdir(self.directory):
+            if filename.startswith(prefix) and filename.endswith(".npy") and filename not in current:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Захват кадров с камеры в отдельном потоке
+Поток постоянно читает камеру и хранит только самый свежий кадр с
+отметкой времени, поэтому кадры не копятся в буфере драйвера, пока
+идет медленная обработка. Непрочитанные кадры, замененные новыми,
+считаются пропущенными.
+"""
+
+import itertools
+import threading
+import time
+
+import cv2
+
+
+class FrameGrabber:
+    # Номера кадров уникальны для всех камер (удобно при смене камеры)
+    _frame_ids = itertools.count(1)
+
+    def __init__(self, source=0):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+
+        # Счетчики
+        self.captured = 0  # Прочитано кадров с камеры
+        self.dropped = 0  # Заменено новыми до того, как их забрали
+        self.read_failures = 0  # Неудачных чтений
+
+        self._frame = None
+        self._frame_id = 0
+        self._timestamp = 0.0
+        self._consumed = True
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        if self.cap.isOpened():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def isOpened(self):
+        return self._running and self.cap.isOpened()
+
+    def _run(self):
+        """Поток захвата: читает камеру и заменяет последний кадр"""
+        while self._running:
+            ret, frame = self.cap.read()
+            timestamp = time.monotonic()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                if not self._consumed:
+                    self.dropped += 1
+                self._frame = frame
+                self._frame_id = next(self._frame_ids)
+                self._timestamp = timestamp
+                self._consumed = False
+                self.captured += 1
+                self._cond.notify_all()
+
+    def read_latest(self, after_id=0, timeout=1.0):
+        """Самый свежий кадр новее after_id
+
+        Возвращает (успех, кадр, номер кадра, время захвата по time.monotonic()).
+        Если за timeout новый кадр не появился, возвращает (False, None, after_id, 0.0).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame_id > after_id or not self._running, timeout):
+                return False, None, after_id, 0.0
+            if self._frame is None or self._frame_id <= after_id:
+                return False, None, after_id, 0.0
+            self._consumed = True
+            return True, self._frame.copy(), self._frame_id, self._timestamp
+
+    def read(self):
+        """Совместимо с cv2.VideoCapture.read(): (успех, последний кадр)"""
+        ret, frame, _, _ = self.read_latest(0)
+        return ret, frame
+
+    def get_stats(self):
+        """Счетчики захвата"""
+        with self._cond:
+            return {
+                'captured': self.captured,
+                'dropped': self.dropped,
+                'read_failures': self.read_failures,
+                'last_frame_id': self._frame_id
+            }
+
+    def release(self):
+        """Остановка потока захвата и освобождение камеры"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.cap.release()
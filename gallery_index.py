@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс галереи лиц на основе непрерывной матрицы
+Все образцы хранятся в одной матрице float32 (строка = образец),
+рядом лежит массив меток строка -> номер человека.
+Запрос оценивается одним матричным произведением, а среднее
+топ-3 сходств для каждого человека считается векторно.
+Для очень больших галерей можно подключить приближенный индекс
+(ann_index.IVFIndex): он отбирает людей-кандидатов, а их оценка
+по-прежнему считается точно по всем образцам.
+В сжатом режиме (precision="float16" или "int8" с масштабом на строку)
+оценка идет по сжатой матрице, которая декодируется блоками, а лучшие
+кандидаты при желании переоцениваются по полным векторам. Полные векторы
+float32 в памяти процесса тогда не держатся: они читаются из файла
+хранилища признаков, отображенного в память (attach), и только образцы,
+добавленные после загрузки, лежат в памяти до следующей загрузки.
+Сжатие экономит память, но не ускоряет поиск: декодирование блоков
+медленнее произведения float32 (float16 - примерно в 3 раза).
+"""
+
+import threading
+
+import numpy as np
+
+
+CODE_DTYPES = {'float16': np.float16, 'int8': np.int8}
+
+
+class GalleryIndex:
+    def __init__(self, top_k=3, initial_capacity=64, precision="float32", rerank=0, block_rows=4096):
+        if precision != "float32" and precision not in CODE_DTYPES:
+            raise ValueError(f"Неизвестная точность индекса: {precision}")
+        self.top_k = top_k
+        self.dim = None
+
+        # Сжатая копия матрицы для оценки и число людей для переоценки по полным векторам
+        self.precision = precision
+        self.rerank = rerank
+        self.block_rows = block_rows  # Строк сжатой матрицы, декодируемых за раз
+        self._codes = None
+        self._scales = None
+
+        # Полные векторы в сжатом режиме: строка -> номер в _source (файл в памяти)
+        # или, если номер не меньше числа строк _source, в _extra (добавленные позже)
+        self._source = None
+        self._refs = None
+        self._extra = None
+        self._extra_size = 0
+
+        # Матрица образцов с запасом по емкости для дешевого добавления
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._labels = np.zeros(initial_capacity, dtype=np.int32)
+        self._size = 0
+        self._initial_capacity = initial_capacity
+
+        # Номер человека -> имя и обратно
+        self._names = []
+        self._ids = {}
+
+        # Кэш группировки строк по людям (сбрасывается при изменениях)
+        self._groups = None
+
+        # Необязательный приближенный индекс и размер галереи, с которого он используется
+        self._ann = None
+        self.ann_min_rows = 0
+
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrix(self):
+        """Нормированные образцы (без копирования; в сжатом режиме - собранная копия)"""
+        if self.compressed:
+            return self._full_rows(np.arange(self._size))
+        return self._matrix[:self._size]
+
+    def _source_rows(self):
+        return self._source.shape[0] if self._source is not None else 0
+
+    def _full_rows(self, rows):
+        """Полные векторы строк в сжатом режиме (из файла в памяти и добавленных строк)"""
+        refs = self._refs[rows]
+        result = np.empty((refs.shape[0], self.dim), dtype=np.float32)
+        source_rows = self._source_rows()
+        in_source = refs < source_rows
+        if in_source.any():
+            result[in_source] = self._source[refs[in_source]]
+        if not in_source.all():
+            result[~in_source] = self._extra[refs[~in_source] - source_rows]
+        return result
+
+    def _full_row(self, row):
+        """Полный вектор одной строки без копирования (представление)"""
+        ref = self._refs[row]
+        source_rows = self._source_rows()
+        return self._source[ref] if ref < source_rows else self._extra[ref - source_rows]
+
+    def resident_bytes(self):
+        """Объем массивов индекса в памяти процесса (файлы, отображенные в память, не считаются)"""
+        arrays = [self._matrix, self._labels, self._codes, self._scales, self._refs, self._extra]
+        return sum(array.nbytes for array in arrays
+                   if array is not None and not isinstance(array, np.memmap))
+
+    @property
+    def compressed(self):
+        return self.precision != "float32"
+
+    @property
+    def labels(self):
+        """Номер человека для каждой строки матрицы"""
+        return self._labels[:self._size]
+
+    @property
+    def names(self):
+        """Имена людей в порядке их номеров"""
+        return list(self._names)
+
+    def clear(self):
+        """Очистка индекса"""
+        with self._lock:
+            self.dim = None
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+            self._labels = np.zeros(self._initial_capacity, dtype=np.int32)
+            self._codes = None
+            self._scales = None
+            self._source = None
+            self._refs = None
+            self._extra = None
+            self._extra_size = 0
+            self._size = 0
+            self._names = []
+            self._ids = {}
+            self._groups = None
+            if self._ann is not None:
+                self._ann.reset()
+
+    def attach(self, matrix, labels, names):
+        """Использование готовой матрицы (например, отображенной в память) без копирования
+
+        Строки должны быть нормированы. Матрица копируется только при первом
+        изменении индекса, если она доступна лишь для чтения. В сжатом режиме
+        матрица не копируется никогда: из нее читаются полные векторы.
+        """
+        with self._lock:
+            self.dim = matrix.shape[1]
+            self._labels = np.array(labels, dtype=np.int32)
+            self._size = matrix.shape[0]
+            if self.compressed:
+                self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+                self._source = matrix
+                self._refs = np.arange(self._size, dtype=np.int64)
+                self._extra = np.zeros((0, self.dim), dtype=np.float32)
+                self._extra_size = 0
+                self._codes, self._scales = self._encode_blocks(matrix)
+            else:
+                self._matrix = matrix
+            self._names = list(names)
+            self._ids = {name: i for i, name in enumerate(self._names)}
+            self._groups = None
+            if self._ann is not None:
+                self._ann.reset()
+
+    def snapshot(self):
+        """Копия состояния индекса для сохранения: (матрица, метки, имена)"""
+        with self._lock:
+            matrix = np.array(self.matrix, dtype=np.float32)
+            if self.dim is None:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            return matrix, np.array(self.labels, dtype=np.int32), list(self._names)
+
+    def rows_by_person(self):
+        """Строки матрицы, сгруппированные по людям: имя -> список векторов (представлений)"""
+        with self._lock:
+            labels = self.labels
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=len(self._names))
+            groups = np.split(order, np.cumsum(counts)[:-1])
+            if self.compressed:
+                row = self._full_row
+            else:
+                matrix = self.matrix.view(np.ndarray)
+                row = matrix.__getitem__
+            return {name: [row(i) for i in rows] for name, rows in zip(self._names, groups)}
+
+    def _make_writable(self):
+        """Копирование матрицы, открытой только для чтения, перед изменением"""
+        if not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix[:self._size], dtype=np.float32)
+
+    def rebuild(self, face_database):
+        """Полное построение индекса из словаря имя -> список признаков"""
+        with self._lock:
+            self.clear()
+            for name, feature_list in face_database.items():
+                if feature_list:
+                    self.add(name, feature_list)
+
+    @staticmethod
+    def _normalize(vectors):
+        """Нормировка строк на единичную длину (нулевые строки остаются нулевыми)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[np.newaxis, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _encode(self, vectors):
+        """Сжатие нормированных строк: (коды, масштабы строк или None)"""
+        if self.precision == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, np.newaxis]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _encode_blocks(self, matrix):
+        """Сжатие всей матрицы блоками (матрица может быть отображена в память)"""
+        codes = np.zeros(matrix.shape, dtype=CODE_DTYPES[self.precision])
+        scales = np.ones(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], self.block_rows):
+            block_codes, block_scales = self._encode(np.asarray(matrix[start:start + self.block_rows]))
+            codes[start:start + self.block_rows] = block_codes
+            if block_scales is not None:
+                scales[start:start + self.block_rows] = block_scales
+        return codes, scales
+
+    def _reserve(self, rows):
+        """Увеличение емкости матрицы (в сжатом режиме - кодов) с удвоением"""
+        capacity = self._codes.shape[0] if self.compressed and self._codes is not None else self._matrix.shape[0]
+        if self._size + rows <= capacity:
+            return
+        new_capacity = max(self._initial_capacity, capacity * 2, self._size + rows)
+        labels = np.zeros(new_capacity, dtype=np.int32)
+        labels[:self._size] = self._labels[:self._size]
+        self._labels = labels
+
+        if not self.compressed:
+            matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+            return
+
+        codes = np.zeros((new_capacity, self.dim), dtype=CODE_DTYPES[self.precision])
+        scales = np.ones(new_capacity, dtype=np.float32)
+        refs = np.zeros(new_capacity, dtype=np.int64)
+        if self._codes is not None:
+            codes[:self._size] = self._codes[:self._size]
+            scales[:self._size] = self._scales[:self._size]
+            refs[:self._size] = self._refs[:self._size]
+        self._codes = codes
+        self._scales = scales
+        self._refs = refs
+
+    def _append_extra(self, vectors):
+        """Полные векторы новых строк сжатого режима: возвращает их номера для _refs"""
+        if self._extra is None:
+            self._extra = np.zeros((0, self.dim), dtype=np.float32)
+        if self._extra_size + vectors.shape[0] > self._extra.shape[0]:
+            capacity = max(self._initial_capacity, self._extra.shape[0] * 2, self._extra_size + vectors.shape[0])
+            extra = np.zeros((capacity, self.dim), dtype=np.float32)
+            extra[:self._extra_size] = self._extra[:self._extra_size]
+            self._extra = extra
+        start = self._extra_size
+        self._extra[start:start + vectors.shape[0]] = vectors
+        self._extra_size += vectors.shape[0]
+        return self._source_rows() + np.arange(start, self._extra_size, dtype=np.int64)
+
+    def _compact_extra(self):
+        """Удаление из _extra векторов удаленных строк, когда их больше половины"""
+        source_rows = self._source_rows()
+        refs = self._refs[:self._size]
+        used = refs >= source_rows
+        used_count = int(used.sum())
+        if used_count * 2 >= self._extra_size:
+            return
+        extra = np.zeros((max(used_count, self._initial_capacity), self.dim), dtype=np.float32)
+        extra[:used_count] = self._extra[refs[used] - source_rows]
+        self._extra = extra
+        self._extra_size = used_count
+        refs[used] = source_rows + np.arange(used_count, dtype=np.int64)
+
+    def add(self, name, features):
+        """Добавление одного или нескольких образцов человека"""
+        vectors = self._normalize(features)
+        if vectors.shape[0] == 0:
+            return
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            if vectors.shape[1] != self.dim:
+                print(f"Предупреждение: Несовместимые размерности для {name}: {vectors.shape[1]} vs {self.dim}")
+                return
+
+            if name not in self._ids:
+                self._ids[name] = len(self._names)
+                self._names.append(name)
+            person_id = self._ids[name]
+
+            self._reserve(vectors.shape[0])
+            start = self._size
+            self._labels[start:start + vectors.shape[0]] = person_id
+            if self.compressed:
+                codes, scales = self._encode(vectors)
+                self._codes[start:start + vectors.shape[0]] = codes
+                if scales is not None:
+                    self._scales[start:start + vectors.shape[0]] = scales
+                self._refs[start:start + vectors.shape[0]] = self._append_extra(vectors)
+            else:
+                self._matrix[start:start + vectors.shape[0]] = vectors
+            self._size += vectors.shape[0]
+            self._groups = None
+            if self._ann is not None:
+                self._ann.add(vectors)
+
+    def remove(self, name):
+        """Удаление всех образцов человека"""
+        with self._lock:
+            if name not in self._ids:
+                return False
+            person_id = self._ids.pop(name)
+
+            # Сдвигаем оставшиеся строки на место удаленных
+            keep = self._labels[:self._size] != person_id
+            kept = int(keep.sum())
+            self._labels[:kept] = self._labels[:self._size][keep]
+            if self.compressed:
+                # Файл признаков не копируется: сдвигаются только коды и ссылки
+                self._codes[:kept] = self._codes[:self._size][keep]
+                self._scales[:kept] = self._scales[:self._size][keep]
+                self._refs[:kept] = self._refs[:self._size][keep]
+            else:
+                self._make_writable()
+                self._matrix[:kept] = self._matrix[:self._size][keep]
+            self._size = kept
+            if self.compressed:
+                self._compact_extra()
+            if self._ann is not None:
+                self._ann.remove(keep)
+
+            # Перенумеровываем людей без пропусков
+            labels = self._labels[:self._size]
+            labels[labels > person_id] -= 1
+            del self._names[person_id]
+            self._ids = {n: i for i, n in enumerate(self._names)}
+            self._groups = None
+            return True
+
+    def rename(self, old_name, new_name):
+        """Переименование человека без перестроения матрицы"""
+        with self._lock:
+            if old_name not in self._ids or old_name == new_name:
+                return
+            # Образцы старого владельца нового имени заменяются, как в face_database
+            self.remove(new_name)
+            person_id = self._ids.pop(old_name)
+            self._names[person_id] = new_name
+            self._ids[new_name] = person_id
+
+    def enable_ann(self, ann_index, min_rows=20000):
+        """Подключение приближенного индекса для галерей от min_rows образцов
+
+        Индекс обучается сразу, если галерея уже достаточно велика,
+        иначе - при первом поиске после достижения min_rows.
+        """
+        with self._lock:
+            self._ann = ann_index
+            self.ann_min_rows = min_rows
+            self._ann.reset()
+            if self._size >= min_rows:
+                self._ann.train(self.matrix)
+
+    def disable_ann(self):
+        """Возврат к точному поиску"""
+        with self._lock:
+            self._ann = None
+
+    def _get_groups(self):
+        """Порядок строк, сгруппированных по людям, и маска топ-k в каждой группе"""
+        if self._groups is None:
+            labels = self._labels[:self._size]
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=len(self._names))
+            starts = np.cumsum(counts) - counts
+            rank = np.arange(self._size) - starts[labels[order]]
+            keep = rank < self.top_k
+
+            # Начала групп среди оставленных (топ-k) позиций
+            kept_counts = np.minimum(counts, self.top_k)
+            present = np.flatnonzero(kept_counts)
+            kept_starts = (np.cumsum(kept_counts) - kept_counts)[present]
+
+            self._groups = (order, labels[order], keep, present, kept_starts,
+                            kept_counts[present].astype(np.float32), starts, counts)
+        return self._groups
+
+    def person_scores(self, queries):
+        """Среднее топ-k косинусных сходств для каждого человека
+
+        Возвращает (номера людей, матрица оценок запросы x люди).
+        """
+        queries = self._normalize(queries)
+        with self._lock:
+            if self._size == 0 or queries.shape[1] != self.dim:
+                return np.zeros(0, dtype=np.int64), np.zeros((queries.shape[0], 0), dtype=np.float32)
+
+            if self._ann is not None and self._size >= self.ann_min_rows:
+                return self._ann_person_scores(queries)
+
+            groups = self._get_groups()
+            present = groups[3]
+            if not self.compressed:
+                scores = queries @ self.matrix.T
+            else:
+                scores = self._compressed_scores(queries)
+                if self.rerank:
+                    return present, self._rerank(queries, self._aggregate(scores, groups), present)
+
+        return present, self._aggregate(scores, groups)
+
+    @staticmethod
+    def _aggregate(scores, groups):
+        """Среднее топ-k сходств каждого человека по матрице сходств запросы x строки"""
+        order, sorted_labels, keep, present, kept_starts, kept_counts = groups[:6]
+
+        # Внутри каждой группы сортируем по убыванию сходства:
+        # ключ = номер человека + (1 - сходство) / 4, сходство в [-1, 1]
+        grouped = scores[:, order]
+        keys = sorted_labels.astype(np.float64) + (1.0 - grouped.astype(np.float64)) / 4.0
+        within = np.argsort(keys, axis=1, kind='stable')
+        ranked = np.take_along_axis(grouped, within, axis=1)[:, keep]
+
+        sums = np.add.reduceat(ranked, kept_starts, axis=1)
+        return sums / kept_counts
+
+    def _compressed_scores(self, queries):
+        """Сходства запросов со всеми строками по сжатой матрице (декодирование блоками)"""
+        scores = np.empty((queries.shape[0], self._size), dtype=np.float32)
+        for start in range(0, self._size, self.block_rows):
+            end = min(start + self.block_rows, self._size)
+            block = self._codes[start:end].astype(np.float32)
+            scores[:, start:end] = queries @ block.T
+            if self.precision == "int8":
+                scores[:, start:end] *= self._scales[start:end]
+        return scores
+
+    def _rerank(self, queries, scores, present):
+        """Переоценка rerank лучших людей каждого запроса по полным векторам"""
+        count = min(self.rerank, present.size)
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        for i, query in enumerate(queries):
+            scores[i, top[i]] = self._exact_person_scores(query, present[top[i]])
+        return scores
+
+    def _exact_person_scores(self, query, persons):
+        """Точное среднее топ-k по всем образцам каждого из указанных людей"""
+        groups = self._get_groups()
+        order, starts, counts = groups[0], groups[6], groups[7]
+
+        # Все образцы этих людей, сгруппированные по людям
+        rows = np.concatenate([order[starts[p]:starts[p] + counts[p]] for p in persons])
+        vectors = self._full_rows(rows) if self.compressed else self.matrix[rows]
+        similarities = vectors @ query
+        group_counts = counts[persons]
+        group_ids = np.repeat(np.arange(persons.size), group_counts)
+
+        # Топ-k внутри каждой группы по убыванию сходства
+        ranked = similarities[np.lexsort((-similarities, group_ids))]
+        rank = np.arange(rows.size) - np.repeat(np.cumsum(group_counts) - group_counts, group_counts)
+        kept_counts = np.minimum(group_counts, self.top_k)
+        sums = np.add.reduceat(ranked[rank < self.top_k], np.cumsum(kept_counts) - kept_counts)
+        return sums / kept_counts
+
+    def _ann_person_scores(self, queries):
+        """Оценки людей через приближенный индекс (вызывается под блокировкой)
+
+        Индекс отбирает строки-кандидаты, а для каждого найденного человека
+        среднее топ-k считается точно по всем его образцам. Люди, не попавшие
+        в кандидаты, получают оценку -inf.
+        """
+        if not self._ann.is_trained:
+            self._ann.train(self.matrix)
+
+        # В сжатом режиме полные векторы кандидатов собираются по запросу
+        matrix = _RowReader(self) if self.compressed else self.matrix
+        labels = self.labels
+        scores = np.full((queries.shape[0], len(self._names)), -np.inf, dtype=np.float32)
+
+        for i, query in enumerate(queries):
+            persons = np.unique(labels[self._ann.candidate_rows(query, matrix)])
+            if persons.size:
+                scores[i, persons] = self._exact_person_scores(query, persons)
+
+        return np.arange(len(self._names)), scores
+
+    def search(self, query, threshold):
+        """Лучший человек для одного запроса: (имя, сходство) или (None, 0.0)"""
+        return self.search_batch([query], threshold)[0]
+
+    def search_batch(self, queries, threshold):
+        """Лучший человек для каждого запроса за один проход по галерее"""
+        if len(queries) == 0:
+            return []
+        queries = np.asarray(queries)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        if self.dim is not None and queries.shape[1] != self.dim:
+            print(f"Предупреждение: Несовместимая размерность запроса: {queries.shape[1]} vs {self.dim}")
+            return [(None, 0.0)] * queries.shape[0]
+
+        with self._lock:
+            person_ids, scores = self.person_scores(queries)
+            names = list(self._names)
+
+        if scores.shape[1] == 0:
+            return [(None, 0.0)] * queries.shape[0]
+
+        best = np.argmax(scores, axis=1)
+        best_similarity = scores[np.arange(scores.shape[0]), best]
+
+        results = []
+        for person_id, similarity in zip(person_ids[best], best_similarity):
+            if similarity > threshold:
+                results.append((names[person_id], float(similarity)))
+            else:
+                results.append((None, 0.0))
+        return results
+
+
+class _RowReader:
+    """Доступ matrix[rows] к полным векторам сжатого индекса без сборки всей матрицы"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, rows):
+        return self.index._full_rows(rows)
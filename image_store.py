@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище изображений лиц с адресацией по содержимому
+Каждое изображение сохраняется без потерь (PNG) под именем, равным
+SHA-1 от его содержимого, поэтому одинаковые снимки не дублируются.
+В записях о людях хранятся только ссылки, а сами изображения
+читаются по запросу через ограниченный LRU-кэш. Один файл может
+принадлежать нескольким людям, поэтому удаляются только ссылки,
+которые больше никем не используются (remove_unused).
+Изображения из кэша общие для всех вызывающих и доступны только для чтения.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class ImageStore:
+    def __init__(self, directory="database/images", cache_size=32):
+        self.directory = directory
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_ref(image):
+        """Ссылка на изображение: хэш формы, типа и содержимого"""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha1()
+        digest.update(f"{image.shape}|{image.dtype}".encode('ascii'))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, ref):
+        return os.path.join(self.directory, ref[:2], f"{ref}.png")
+
+    def put(self, image):
+        """Сохранение изображения (если его еще нет), возвращает ссылку"""
+        ref = self.make_ref(image)
+        path = self._path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + ".tmp.png"
+            if not cv2.imwrite(temp_path, image):
+                raise IOError(f"Не удалось сохранить изображение {path}")
+            os.replace(temp_path, path)
+        return ref
+
+    def get(self, ref):
+        """Загрузка изображения по ссылке через LRU-кэш (None если файла нет)"""
+        with self._lock:
+            if ref in self._cache:
+                self._cache.move_to_end(ref)
+                self.hits += 1
+                return self._cache[ref]
+            self.misses += 1
+
+        image = cv2.imread(self._path(ref), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None
+        # Кэшированный массив отдается всем вызывающим, изменять его нельзя
+        image.setflags(write=False)
+
+        with self._lock:
+            self._cache[ref] = image
+            self._cache.move_to_end(ref)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return image
+
+    def remove_unused(self, refs, live_refs):
+        """Удаление изображений из refs, на которые нет ссылок в live_refs
+
+        Возвращает число удаленных файлов.
+        """
+        removed = 0
+        for ref in set(refs) - set(live_refs):
+            with self._lock:
+                self._cache.pop(ref, None)
+            try:
+                os.remove(self._path(ref))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Не удалось удалить изображение {ref}: {e}")
+        return removed
+
+    def clear_cache(self):
+        """Очистка кэша изображений"""
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Отрисовка подписей (в том числе кириллицы) на кадре с кэшированием
+Шрифты загружаются один раз (с поиском по путям Windows, Linux и macOS),
+маски подписей кэшируются по тексту, размеру и цвету, а в кадр
+смешивается только небольшая область самой подписи - без перевода
+всего кадра в PIL и обратно.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Шрифты с кириллицей в порядке предпочтения
+FONT_CANDIDATES = (
+    "arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+)
+
+
+class LabelRenderer:
+    def __init__(self, cache_size=256, font_candidates=FONT_CANDIDATES):
+        self.cache_size = cache_size
+        self.font_candidates = font_candidates
+        self.font_path = None  # Найденный шрифт (None - стандартный шрифт PIL)
+
+        self._fonts = {}
+        self._font_searched = False
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_font(self, size):
+        """Шрифт нужного размера (поиск файла шрифта выполняется один раз)"""
+        font = self._fonts.get(size)
+        if font is not None:
+            return font
+
+        if not self._font_searched:
+            self._font_searched = True
+            for path in self.font_candidates:
+                try:
+                    ImageFont.truetype(path, size)
+                    self.font_path = path
+                    break
+                except OSError:
+                    continue
+
+        if self.font_path is not None:
+            font = ImageFont.truetype(self.font_path, size)
+        else:
+            try:
+                font = ImageFont.load_default(size=size)
+            except TypeError:
+                font = ImageFont.load_default()
+        self._fonts[size] = font
+        return font
+
+    def render(self, text, size, color):
+        """Подпись из кэша: (смещение x, смещение y, цветная заливка, альфа-маска)"""
+        key = (text, size, tuple(color))
+        with self._lock:
+            label = self._cache.get(key)
+            if label is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return label
+            self.misses += 1
+
+        font = self.get_font(size)
+        left, top, right, bottom = font.getbbox(text)
+        mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+
+        alpha = np.asarray(mask, dtype=np.float32)[:, :, np.newaxis] / 255.0
+        fill = np.empty(alpha.shape[:2] + (len(color),), dtype=np.float32)
+        fill[:] = color
+        label = (left, top, fill * alpha, 1.0 - alpha)
+
+        with self._lock:
+            self._cache[key] = label
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return label
+
+    def draw(self, image, text, origin, size, color):
+        """Смешивание подписи с кадром; origin - точка, от которой PIL рисует текст"""
+        if image.ndim == 2:
+            color = (int(round(np.mean(color))),)
+        left, top, premultiplied, inverse_alpha = self.render(text, size, color)
+
+        x0 = origin[0] + left
+        y0 = origin[1] + top
+        height, width = premultiplied.shape[:2]
+
+        # Обрезка подписи по границам кадра
+        fx0, fy0 = max(0, -x0), max(0, -y0)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1 = min(image.shape[1], origin[0] + left + width)
+        y1 = min(image.shape[0], origin[1] + top + height)
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        region = image[y0:y1, x0:x1]
+        if image.ndim == 2:
+            region = region[:, :, np.newaxis]
+        patch = premultiplied[fy0:fy0 + (y1 - y0), fx0:fx0 + (x1 - x0)]
+        keep = inverse_alpha[fy0:fy0 + (y1 - y0), fx0:fx0 + (x1 - x0)]
+        blended = region * keep + patch
+        np.copyto(region, np.rint(blended).astype(image.dtype))
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Фильтр движения перед детекцией лиц
+Кадр уменьшается до крошечного размера и сравнивается с медленно
+обновляемой моделью фона. Каскад Хаара запускается только если
+изменилась заметная доля кадра (или в кадре есть сопровождаемые лица),
+поэтому пустой коридор почти не нагружает процессор.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, size=(80, 60), pixel_threshold=15, min_changed=0.005,
+                 background_rate=0.05, max_idle=5.0):
+        self.size = size  # Размер кадра для сравнения (ширина, высота)
+        self.pixel_threshold = pixel_threshold  # Изменение яркости пикселя, считающееся движением
+        self.min_changed = min_changed  # Доля изменившихся пикселей для срабатывания
+        self.background_rate = background_rate  # Скорость подстройки фона под освещение
+        self.max_idle = max_idle  # Контрольная детекция не реже, чем раз в max_idle секунд
+
+        self._background = None
+        self._last_open = 0.0
+        self.last_changed = 0.0  # Доля изменившихся пикселей на последнем кадре
+
+        # Счетчики
+        self.checked = 0  # Кадров, на которых решалось, нужна ли детекция
+        self.gated = 0  # Из них детекция пропущена
+        self.motion_frames = 0  # Кадров с движением
+
+    def reset(self):
+        self._background = None
+
+    def update(self, frame):
+        """Обновление модели фона, возвращает True, если в кадре есть движение"""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small
+            self.last_changed = 1.0
+            return True
+
+        diff = cv2.absdiff(small, self._background)
+        self.last_changed = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        cv2.accumulateWeighted(small, self._background, self.background_rate)
+
+        motion = self.last_changed >= self.min_changed
+        if motion:
+            self.motion_frames += 1
+        return motion
+
+    def allow(self, motion, has_tracks=False, now=None):
+        """Нужно ли запускать детекцию на кадре, где ее запланировал планировщик"""
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        if motion or has_tracks or now - self._last_open >= self.max_idle:
+            self._last_open = now
+            return True
+        self.gated += 1
+        return False
+
+    def get_stats(self):
+        return {
+            'checked': self.checked,
+            'gated': self.gated,
+            'motion_frames': self.motion_frames,
+            'changed': self.last_changed
+        }
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Несколько камер в одном процессе с общей базой лиц
+Каждая камера читается своим потоком захвата (FrameGrabber) и имеет свои
+детектор движения, треки лиц и направление (вход или выход), а
+распознаватель и галерея общие - одна копия в памяти и один писатель
+базы. Детекцию и распознавание выполняет один рабочий поток: на каждом
+шаге он забирает свежие кадры всех камер, сдвигает треки и запускает
+детекцию для камер, которым она нужна, начиная с той, что ждет дольше
+всех. Общий лимит процессора задается долей одного ядра: время работы
+списывается с бюджета, пополняемого со скоростью cpu_budget, и при
+перерасходе детекции откладываются, а шаг ждет пополнения бюджета.
+Декодирование видео в потоках захвата в бюджет не входит.
+
+Камера задается строкой ИСТОЧНИК[@in|@out[@НАЗВАНИЕ]]: номер камеры, файл
+или URL потока, направление (in - вход, out - выход, none - без записи)
+и название для истории, например: 0@in@Главный вход, rtsp://host/1@out
+
+Запуск: python multi_camera.py 0@in 1@out [--cpu-budget 0.5] [--fps 15] [--headless]
+"""
+
+import argparse
+import collections
+import math
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from face_tracker import FaceTracker
+from frame_grabber import FrameGrabber
+from label_renderer import LabelRenderer
+from motion_gate import MotionGate
+
+
+# Направление камеры -> действие в истории (None - события не записываются)
+ACTIONS = {'in': 'Вошел', 'out': 'Вышел', 'none': None}
+
+
+def parse_camera_spec(spec, index=0):
+    """Разбор строки ИСТОЧНИК[@in|@out[@НАЗВАНИЕ]] в (источник, действие, название)
+
+    В URL потока тоже бывает '@' (логин и пароль), поэтому направление
+    ищется только среди последних частей строки.
+    """
+    spec = spec.strip()
+    parts = spec.rsplit('@', 2)
+    if len(parts) == 3 and parts[1].lower() in ACTIONS:
+        source, direction, name = parts[0], parts[1].lower(), parts[2].strip()
+    elif len(parts) >= 2 and parts[-1].lower() in ACTIONS:
+        source, direction, name = spec.rsplit('@', 1)[0], parts[-1].lower(), ""
+    else:
+        source, direction, name = spec, 'none', ""
+
+    source = source.strip()
+    if not source:
+        raise ValueError(f"не указан источник камеры: {spec!r}")
+    if source.isdigit():
+        source = int(source)
+    if not name:
+        name = f"cam{source}" if isinstance(source, int) else f"cam{index + 1}"
+    return source, ACTIONS[direction], name
+
+
+class CameraStream:
+    """Одна камера: захват, детектор движения, треки и счетчики"""
+
+    def __init__(self, name, source, action=None, grabber=None, resolution=(320, 240)):
+        self.name = name
+        self.source = source
+        self.action = action
+        self.resolution = resolution
+        self.grabber = grabber if grabber is not None else FrameGrabber(source)
+        self.motion_gate = MotionGate()
+        self.tracker = FaceTracker(recheck_interval=3.0)
+
+        self.frame = None  # Последний кадр в разрешении обработки
+        self.gray = None
+        self.frame_id = 0
+        self.motion = False
+        self.preview = None  # Кадр с рамками и подписями для показа
+
+        # Детекция запрошена, но еще не выполнена (ждет очереди или бюджета)
+        self.pending = False
+        self.pending_since = 0.0
+        self.last_detection = 0.0
+
+        # Повторная запись того же человека на этой камере не чаще, чем раз в cooldown
+        self.last_events = {}  # Имя -> время последней записи (time.monotonic)
+        self.recorded_tracks = set()  # Треки, по которым событие уже учтено
+
+        # Счетчики
+        self.frames = 0  # Обработано кадров
+        self.detections = 0  # Выполнено детекций
+        self.deferred = 0  # Шагов, на которых детекция отложена из-за бюджета
+        self.events = 0  # Записано входов/выходов
+        self.wait_total = 0.0  # Суммарное ожидание детекции (с)
+        self.wait_max = 0.0
+        self.work_time = 0.0  # Время обработки этой камеры (с)
+
+    def isOpened(self):
+        return self.grabber.isOpened()
+
+    def poll(self, now):
+        """Забрать новый кадр, если он есть: уменьшение, движение, сдвиг треков"""
+        ret, frame, self.frame_id, _ = self.grabber.read_latest(self.frame_id, timeout=0)
+        if not ret:
+            return False
+        self.frames += 1
+        self.frame = cv2.resize(frame, self.resolution)
+        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        self.motion = self.motion_gate.update(self.frame)
+
+        if self.tracker.tracks:
+            self.tracker.propagate(self.gray)
+        if not self.pending and self.motion_gate.allow(self.motion, bool(self.tracker.tracks), now):
+            self.pending = True
+            self.pending_since = now
+        return True
+
+    def release(self):
+        self.grabber.release()
+
+    def get_stats(self, elapsed):
+        served = max(self.detections, 1)
+        return {
+            'name': self.name,
+            'source': self.source,
+            'action': self.action,
+            'opened': self.isOpened(),
+            'frames': self.frames,
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'detections': self.detections,
+            'deferred': self.deferred,
+            'events': self.events,
+            'tracks': len(self.tracker.tracks),
+            'wait_avg': self.wait_total / served,
+            'wait_max': self.wait_max,
+            'cpu': self.work_time / elapsed if elapsed > 0 else 0.0
+        }
+
+
+class MultiCameraProcessor:
+    """Обработка нескольких камер одним потоком с общим распознавателем
+
+    cpu_budget - доля одного ядра на обработку всех камер, target_fps -
+    частота шагов (опроса камер), event_cooldown - минимальный интервал
+    между записями одного человека на одной камере (с).
+    """
+
+    def __init__(self, recognizer, cameras, cpu_budget=0.5, target_fps=15.0, event_cooldown=30.0,
+                 resolution=(320, 240), burst=0.25):
+        self.recognizer = recognizer
+        self.cpu_budget = cpu_budget
+        self.target_fps = target_fps
+        self.event_cooldown = event_cooldown
+        self.resolution = resolution
+        self.burst = burst  # Наибольший запас бюджета, накопленный в простое (с)
+        self.label_renderer = LabelRenderer()
+
+        # cameras - объекты CameraStream или кортежи (источник, действие, название)
+        self.streams = []
+        for camera in cameras:
+            if not isinstance(camera, CameraStream):
+                source, action, name = camera
+                camera = CameraStream(name, source, action, resolution=resolution)
+            self.streams.append(camera)
+
+        self.recent_events = collections.deque(maxlen=50)  # (время, камера, имя, действие)
+        self.event_count = 0
+        self.work_time = 0.0
+        self._credit = 0.0
+        self._started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка рабочего потока и захвата всех камер"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        for stream in self.streams:
+            stream.release()
+
+    def _run(self):
+        period = 1.0 / self.target_fps
+        last_tick = time.perf_counter()
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            self._credit = min(self.burst, self._credit + (started - last_tick) * self.cpu_budget)
+            last_tick = started
+            try:
+                self.step(started)
+            except Exception as e:
+                print(f"Ошибка обработки камер: {e}")
+            work = time.perf_counter() - started
+            self._credit -= work
+            self.work_time += work
+
+            # Ждем следующего шага, а при перерасходе - пока бюджет не восполнится
+            delay = period - work
+            if self._credit < 0:
+                delay = max(delay, -self._credit / self.cpu_budget)
+            if delay > 0:
+                self._stop.wait(min(delay, 1.0))
+
+    def step(self, started=None):
+        """Один шаг: новые кадры всех камер, детекции по очереди ожидания, превью"""
+        started = time.perf_counter() if started is None else started
+        now = time.monotonic()
+        updated = []
+        for stream in self.streams:
+            stream_started = time.perf_counter()
+            if stream.poll(now):
+                updated.append(stream)
+            stream.work_time += time.perf_counter() - stream_started
+
+        # Первой обслуживается камера, которая ждет детекцию дольше всех (при равном
+        # ожидании - давнее обслуженная); когда бюджет шага исчерпан, остальные
+        # камеры ждут следующего шага
+        pending = sorted((s for s in self.streams if s.pending), key=lambda s: (s.pending_since, s.last_detection))
+        for stream in pending:
+            if self._credit - (time.perf_counter() - started) <= 0:
+                stream.deferred += 1
+                continue
+            stream_started = time.perf_counter()
+            self._detect(stream, time.monotonic())
+            stream.work_time += time.perf_counter() - stream_started
+            if stream not in updated:
+                updated.append(stream)
+
+        for stream in updated:
+            stream_started = time.perf_counter()
+            stream.preview = self._draw_preview(stream)
+            stream.work_time += time.perf_counter() - stream_started
+
+    def _detect(self, stream, now):
+        """Детекция, связывание с треками, распознавание и запись событий камеры"""
+        wait = now - stream.pending_since
+        stream.pending = False
+        stream.last_detection = now
+        stream.detections += 1
+        stream.wait_total += wait
+        stream.wait_max = max(stream.wait_max, wait)
+
+        faces = self.recognizer.detect_faces(stream.frame, with_features=False)
+        stream.tracker.update(faces, stream.gray)
+        stream.tracker.recognize(self.recognizer, now)
+        self._record_events(stream, now)
+
+    def _record_events(self, stream, now):
+        """Вход/выход по подтвержденным трекам: один раз на трек и не чаще cooldown"""
+        live = {track.track_id for track in stream.tracker.tracks}
+        stream.recorded_tracks &= live
+        if stream.action is None:
+            return
+
+        for track in stream.tracker.tracks:
+            if not track.confirmed or not track.name or track.track_id in stream.recorded_tracks:
+                continue
+            stream.recorded_tracks.add(track.track_id)
+            last = stream.last_events.get(track.name)
+            if last is not None and now - last < self.event_cooldown:
+                continue
+            if self.recognizer.record_entry_exit(track.name, stream.action, source=stream.name):
+                stream.last_events[track.name] = now
+                stream.events += 1
+                self.event_count += 1
+                self.recent_events.append((time.strftime("%H:%M:%S"), stream.name, track.name, stream.action))
+
+    def _draw_preview(self, stream):
+        preview = stream.frame.copy()
+        for track in stream.tracker.tracks:
+            x, y, w, h = track.box
+            color = (0, 255, 0) if track.confirmed and track.name else (0, 0, 255)
+            cv2.rectangle(preview, (x, y), (x + w, y + h), color, 2)
+            if track.name:
+                self.label_renderer.draw(preview, track.name, (x, y - 18), 15, color)
+        return preview
+
+    def tiled_preview(self, tile_size=None, columns=None):
+        """Превью всех камер одной сеткой с названием камеры на каждой плитке"""
+        tile_w, tile_h = tile_size or self.resolution
+        count = len(self.streams)
+        columns = columns or max(1, math.ceil(math.sqrt(count)))
+        rows = max(1, math.ceil(count / columns))
+        canvas = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+
+        for index, stream in enumerate(self.streams):
+            x, y = (index % columns) * tile_w, (index // columns) * tile_h
+            preview = stream.preview  # Рабочий поток подменяет ссылку, а не меняет массив
+            tile = canvas[y:y + tile_h, x:x + tile_w]
+            if preview is not None:
+                if preview.shape[1] != tile_w or preview.shape[0] != tile_h:
+                    preview = cv2.resize(preview, (tile_w, tile_h))
+                tile[:] = preview
+            else:
+                tile[:] = 40
+                self.label_renderer.draw(tile, "нет сигнала", (10, tile_h // 2 - 10), 16, (200, 200, 200))
+
+            direction = {'Вошел': "вход", 'Вышел': "выход"}.get(stream.action, "")
+            tile[:22] //= 3
+            self.label_renderer.draw(tile, f"{stream.name} {direction}".strip(), (6, 2), 15, (255, 255, 255))
+            cv2.rectangle(canvas, (x, y), (x + tile_w - 1, y + tile_h - 1), (90, 90, 90), 1)
+        return canvas
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            'streams': [stream.get_stats(elapsed) for stream in self.streams],
+            'cpu': self.work_time / elapsed if elapsed > 0 else 0.0,
+            'cpu_budget': self.cpu_budget,
+            'events': self.event_count
+        }
+
+    def status_text(self):
+        """Краткая сводка по камерам для строки состояния"""
+        stats = self.get_stats()
+        lines = [f"CPU {stats['cpu']:.0%} из {stats['cpu_budget']:.0%}, событий: {stats['events']}"]
+        for s in stats['streams']:
+            state = f"{s['fps']:.1f} кадр/с" if s['opened'] else "не открыта"
+            lines.append(f"{s['name']}: {state}, детекций {s['detections']}, "
+                         f"ожидание {s['wait_avg'] * 1000:.0f}/{s['wait_max'] * 1000:.0f} мс, событий {s['events']}")
+        return "\n".join(lines)
+
+
+class MultiCameraWindow:
+    """Окно Tk с превью всех камер, сводкой и последними событиями
+
+    window - tk.Tk или tk.Toplevel; on_event вызывается в потоке Tk после
+    записи новых событий, on_close - при закрытии окна.
+    """
+
+    def __init__(self, window, processor, interval_ms=100, tile_size=None, on_event=None, on_close=None):
+        self.window = window
+        self.processor = processor
+        self.interval_ms = interval_ms
+        self.tile_size = tile_size
+        self.on_event = on_event
+        self.on_close = on_close
+        self.photo = None
+        self._seen_events = processor.event_count
+        self._closed = False
+
+        self.video_label = ttk.Label(window)
+        self.video_label.pack(padx=5, pady=5)
+        self.status_label = ttk.Label(window, justify=tk.LEFT, font=("Arial", 9))
+        self.status_label.pack(fill=tk.X, padx=5)
+        self.events_label = ttk.Label(window, justify=tk.LEFT, font=("Arial", 9))
+        self.events_label.pack(fill=tk.X, padx=5, pady=(0, 5))
+
+        window.protocol("WM_DELETE_WINDOW", self.close)
+        window.after(self.interval_ms, self.refresh)
+
+    def refresh(self):
+        if self._closed:
+            return
+        frame = self.processor.tiled_preview(self.tile_size)
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if self.photo is None or self.photo.width() != image.width or self.photo.height() != image.height:
+            self.photo = ImageTk.PhotoImage(image)
+            self.video_label.configure(image=self.photo)
+        else:
+            self.photo.paste(image)
+        self.status_label.configure(text=self.processor.status_text())
+
+        if self.processor.event_count != self._seen_events:
+            self._seen_events = self.processor.event_count
+            self.events_label.configure(text="\n".join(
+                f"{moment}  {camera}: {name} - {action}"
+                for moment, camera, name, action in list(self.processor.recent_events)[-5:]))
+            if self.on_event is not None:
+                self.on_event()
+        self.window.after(self.interval_ms, self.refresh)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.processor.stop()
+        if self.on_close is not None:
+            self.on_close()
+        self.window.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Несколько камер с общей базой лиц")
+    parser.add_argument("cameras", nargs="+", help="ИСТОЧНИК[@in|@out[@НАЗВАНИЕ]]")
+    parser.add_argument("--cpu-budget", type=float, default=0.5, help="Доля одного ядра на все камеры")
+    parser.add_argument("--fps", type=float, default=15.0, help="Частота опроса камер")
+    parser.add_argument("--cooldown", type=float, default=30.0, help="Интервал повторной записи человека (с)")
+    parser.add_argument("--resolution", default="320x240", help="Разрешение обработки ШИРИНАxВЫСОТА")
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "pickle"))
+    parser.add_argument("--headless", action="store_true", help="Без окна, сводка в консоль")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=0.0, help="Остановка через N секунд (0 - без ограничения)")
+    args = parser.parse_args()
+
+    try:
+        cameras = [parse_camera_spec(spec, index) for index, spec in enumerate(args.cameras)]
+        resolution = tuple(int(v) for v in args.resolution.lower().split("x"))
+        if len(resolution) != 2:
+            raise ValueError(f"неверное разрешение: {args.resolution}")
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    from simple_face_recognizer import SimpleFaceRecognizer
+    recognizer = SimpleFaceRecognizer(storage_backend=args.storage)
+    processor = MultiCameraProcessor(recognizer, cameras, cpu_budget=args.cpu_budget, target_fps=args.fps,
+                                     event_cooldown=args.cooldown, resolution=resolution)
+    try:
+        closed = [stream.name for stream in processor.streams if not stream.isOpened()]
+        if closed:
+            print(f"Не удалось открыть камеры: {', '.join(closed)}")
+        if len(closed) == len(processor.streams):
+            return 1
+        processor.start()
+        print(f"Камер: {len(processor.streams)}, людей в базе: {len(recognizer.face_database)}")
+
+        deadline = time.monotonic() + args.duration if args.duration > 0 else None
+        if args.headless:
+            try:
+                while deadline is None or time.monotonic() < deadline:
+                    time.sleep(args.stats_interval if deadline is None
+                               else min(args.stats_interval, max(0.0, deadline - time.monotonic())))
+                    print(processor.status_text())
+            except KeyboardInterrupt:
+                pass
+        else:
+            root = tk.Tk()
+            root.title("Камеры")
+            window = MultiCameraWindow(root, processor)
+            if deadline is not None:
+                root.after(int(args.duration * 1000), window.close)
+            try:
+                root.mainloop()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        processor.stop()
+        recognizer.close()
+    print(processor.status_text())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
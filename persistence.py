@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенная (write-behind) запись базы данных
+Изменяющие методы только помечают базу как измененную, а фоновый поток
+через небольшую задержку выполняет одну запись на всю серию изменений.
+Файлы записываются атомарно: во временный файл с последующей заменой.
+"""
+
+import os
+import threading
+import time
+
+
+def atomic_write_bytes(path, data):
+    """Атомарная запись файла через временный файл и os.replace"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class WriteBehindSaver:
+    def __init__(self, save_func, delay=0.5):
+        self.save_func = save_func
+        self.delay = delay  # Сколько ждать новых изменений перед записью
+
+        # Счетчики
+        self.requests = 0  # Вызовов mark_dirty
+        self.coalesced = 0  # Запросов, объединенных с уже ожидающей записью
+        self.writes = 0  # Фактических записей
+        self.failures = 0  # Неудачных записей
+
+        self._dirty = False
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+
+    def mark_dirty(self):
+        """Пометить базу измененной; запись произойдет в фоне"""
+        with self._cond:
+            self.requests += 1
+            if self._dirty:
+                self.coalesced += 1
+            self._dirty = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        """Фоновый поток записи"""
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Собираем серию изменений в одну запись
+            time.sleep(self.delay)
+            self.flush()
+
+    def flush(self):
+        """Немедленная запись, если есть несохраненные изменения"""
+        with self._write_lock:
+            with self._cond:
+                if not self._dirty:
+                    return False
+                self._dirty = False
+            try:
+                self.save_func()
+                self.writes += 1
+                return True
+            except Exception as e:
+                print(f"Ошибка при сохранении базы данных: {e}")
+                self.failures += 1
+                with self._cond:
+                    self._dirty = True
+                return False
+
+    def get_stats(self):
+        """Счетчики отложенной записи"""
+        with self._cond:
+            return {
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'writes': self.writes,
+                'failures': self.failures,
+                'pending': self._dirty
+            }
+
+    def close(self):
+        """Остановка фонового потока с записью оставшихся изменений"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._cond:
+            self._thread = None
+            self._closed = False
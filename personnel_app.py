@@ -5,19 +5,28 @@
 Оптимизирована для работы на слабых процессорах
 """
 
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import cv2
-import numpy as np
 import os
 from PIL import Image, ImageTk
+import queue
 import threading
 import time
+from adaptive_scheduler import RESOLUTIONS, AdaptiveScheduler
+from face_tracker import FaceTracker
+from frame_grabber import FrameGrabber
+from label_renderer import LabelRenderer
+from motion_gate import MotionGate
+from multi_camera import MultiCameraProcessor, MultiCameraWindow, parse_camera_spec
+from process_pipeline import ProcessPipeline
 from simple_face_recognizer import SimpleFaceRecognizer
+from stage_metrics import MetricsExporter, StageMetrics
 
 
 class PersonnelApp:
-    def __init__(self, root):
+    def __init__(self, root, pipeline_workers=0, metrics_port=None, metrics_file=None):
         self.root = root
         self.root.title(self.get_text("main_title"))
         self.root.geometry("1200x800")
@@ -191,6 +200,7 @@ class PersonnelApp:
                 "column_name": "ФИО",
                 "column_action": "Действие", 
                 "column_time": "Время",
+                "column_source": "Камера",
                 
                 # Дополнительные переводы для исправления незавершённого перевода
                 "no_photo_found": "Фото не найдено",
@@ -203,7 +213,18 @@ class PersonnelApp:
                 "recent_entries_title": "Последние входы/выходы",
                 "no_history_found": "История не найдена",
                 "failed_load_image": "Не удалось загрузить изображение",
-                "failed_load_face_image": "Не удалось загрузить изображение лица"
+                "failed_load_face_image": "Не удалось загрузить изображение лица",
+                "capture_stats": "Задержка кадра: {latency:.0f} мс | Пропущено кадров: {dropped}",
+                "tracking_stats": "Распознаваний: {recognitions} | Личность из трека: {cached}",
+                "target_fps": "Цель, кадр/с:",
+                "cpu_budget": "Лимит CPU, %:",
+                "scheduler_stats": "Детекция: каждые {interval} кадр. при {width}x{height} | {fps:.1f} кадр/с | CPU {cpu:.0%}",
+                "latency_target_missed": "задержка опознания выше цели",
+                "motion_stats": "Детекций пропущено без движения: {gated}",
+                "metrics_overlay": "Время стадий на видео",
+                "multi_camera": "Несколько камер",
+                "multi_camera_prompt": "Камеры через запятую: ИСТОЧНИК@in|out[@название]\nнапример: 0@in@Главный вход, 1@out@Северный выход",
+                "multi_camera_failed": "Не удалось открыть ни одной камеры"
             },
             
             "tm": {
@@ -367,6 +388,7 @@ class PersonnelApp:
                 "column_name": "Ady-familiýasy",
                 "column_action": "Hereket",
                 "column_time": "Wagt",
+                "column_source": "Kamera",
                 
                 # Дополнительные переводы для исправления незавершённого перевода
                 "no_photo_found": "Surat tapylmady",
@@ -379,7 +401,18 @@ class PersonnelApp:
                 "recent_entries_title": "Soňky girişler/çykyşlar",
                 "no_history_found": "Taryh tapylmady",
                 "failed_load_image": "Surat ýükläp bolmady",
-                "failed_load_face_image": "Ýüz suratyny ýükläp bolmady"
+                "failed_load_face_image": "Ýüz suratyny ýükläp bolmady",
+                "capture_stats": "Kadryň gijikmesi: {latency:.0f} ms | Geçirilen kadrlar: {dropped}",
+                "tracking_stats": "Tanamalar: {recognitions} | Yzarlamadan şahsyýet: {cached}",
+                "target_fps": "Maksat, kadr/s:",
+                "cpu_budget": "CPU çägi, %:",
+                "scheduler_stats": "Kesgitleme: her {interval} kadrda {width}x{height} | {fps:.1f} kadr/s | CPU {cpu:.0%}",
+                "latency_target_missed": "tanamak gijikmesi maksatdan ýokary",
+                "motion_stats": "Hereketsiz geçirilen kesgitlemeler: {gated}",
+                "metrics_overlay": "Tapgyrlaryň wagty wideoda",
+                "multi_camera": "Birnäçe kamera",
+                "multi_camera_prompt": "Kameralar otur bilen: ÇEŞME@in|out[@ady]\nmeselem: 0@in@Esasy giriş, 1@out@Demirgazyk çykyş",
+                "multi_camera_failed": "Hiç bir kamera açylmady"
             }
         }
         
@@ -389,6 +422,58 @@ class PersonnelApp:
         self.current_camera = 0
         self.detected_faces = []
         self.recognition_active = True
+        self.history_window_limit = 1000  # Сколько последних записей показывать в окне истории
+        self.display_latency = None  # Сглаженная задержка от захвата до показа кадра (с)
+        
+        # Готовые кадры передаются из потока обработки в главный поток Tk
+        self.render_queue = queue.Queue(maxsize=2)
+        self.render_dropped = 0  # Кадров, замененных более новыми до показа
+        self.render_generation = 0  # Номер сеанса камеры: кадры прежних сеансов не показываются
+        self.display_interval_ms = 15  # Как часто главный поток забирает кадры
+        self.video_photo = None  # Переиспользуемый буфер изображения
+        self.shown_info = None
+        self.last_stats_update = 0.0
+        
+        # Планировщик: частота детекции, разрешение обработки и паузы между кадрами
+        # подбираются по измеренному времени стадий под заданные цели
+        self.scheduler = AdaptiveScheduler(target_fps=15, cpu_budget=0.5, max_identify_latency=0.6)
+        
+        # Детекция в отдельных процессах (0 - в потоке обновления видео)
+        self.pipeline_workers = pipeline_workers
+        self.pipeline = None
+        if self.pipeline_workers > 0:
+            max_width, max_height = RESOLUTIONS[-1]
+            self.pipeline = ProcessPipeline(workers=self.pipeline_workers, frame_shape=(max_height, max_width, 3))
+        # Кадры в работе: номер -> (масштаб X, масштаб Y, время отправки)
+        self.pipeline_frames = {}
+        
+        # Фильтр движения: на статичной сцене каскад не запускается
+        self.motion_gate = MotionGate(max_idle=5.0)
+        
+        # Подписи на кадре: шрифт загружается один раз, растры подписей кэшируются
+        self.label_renderer = LabelRenderer()
+        
+        # Время стадий обработки кадра, счетчики и текущие значения
+        self.metrics = StageMetrics()
+        self.face_recognizer.metrics = self.metrics
+        
+        # Отдача метрик в формате Prometheus: порт HTTP (/metrics) и/или файл
+        # для textfile-коллектора (None - не отдавать)
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_exporter = None
+        if self.metrics_port or self.metrics_file:
+            try:
+                self.metrics_exporter = MetricsExporter(self.metrics, port=self.metrics_port,
+                                                        path=self.metrics_file, collect=self.collect_metrics)
+            except OSError as e:
+                print(f"Не удалось запустить отдачу метрик: {e}")
+        
+        # Сопровождение лиц между детекциями с запоминанием личности трека
+        self.face_tracker = FaceTracker(recheck_interval=3.0)
+        
+        # Обработка нескольких камер (окно "Несколько камер"), None - не запущена
+        self.multi_camera = None
         
         # Создание интерфейса
         self.create_widgets()
@@ -399,6 +484,9 @@ class PersonnelApp:
         # Запуск потока обновления видео
         self.update_thread = threading.Thread(target=self.update_frame, daemon=True)
         self.update_thread.start()
+        
+        # Показ кадров в главном потоке Tk со своей частотой
+        self.root.after(self.display_interval_ms, self.render_loop)
     
     def get_text(self, key):
         """Получить перевод для текущего языка"""
@@ -479,6 +567,9 @@ class PersonnelApp:
         
         # Toggle для автоматического распознавания
         self.recognition_var = tk.BooleanVar(value=True)
+        # Поток обработки видео читает копию значения, а не переменную Tk
+        self.recognition_enabled = True
+        self.recognition_var.trace_add('write', self.on_recognition_toggle)
         self.recognition_toggle_btn = ttk.Button(toggles_frame, text=self.get_text("recognition_on"), 
                                                command=self.toggle_recognition, width=20)
         self.recognition_toggle_btn.pack(side=tk.LEFT, padx=2)
@@ -487,6 +578,40 @@ class PersonnelApp:
         self.video_label = ttk.Label(left_frame, text=self.get_text("camera_not_active"), 
                                     background="black", foreground="white")
         self.video_label.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.video_photo = None
+        self.shown_info = None
+        
+        # Задержка кадра и пропущенные кадры
+        self.capture_status_label = ttk.Label(left_frame, text="")
+        self.capture_status_label.pack(fill=tk.X, pady=(0, 5))
+        
+        # Цели планировщика и выбранные им настройки
+        scheduler_frame = ttk.Frame(left_frame)
+        scheduler_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(scheduler_frame, text=self.get_text("target_fps")).pack(side=tk.LEFT, padx=(0, 5))
+        self.target_fps_var = tk.StringVar(value=f"{self.scheduler.target_fps:g}")
+        fps_combo = ttk.Combobox(scheduler_frame, textvariable=self.target_fps_var,
+                                 values=["5", "10", "15", "20", "30"], width=4)
+        fps_combo.pack(side=tk.LEFT, padx=5)
+        fps_combo.bind('<<ComboboxSelected>>', self.on_scheduler_targets_change)
+        
+        ttk.Label(scheduler_frame, text=self.get_text("cpu_budget")).pack(side=tk.LEFT, padx=(10, 5))
+        self.cpu_budget_var = tk.StringVar(value=f"{self.scheduler.cpu_budget * 100:.0f}")
+        cpu_combo = ttk.Combobox(scheduler_frame, textvariable=self.cpu_budget_var,
+                                 values=["25", "50", "75", "100"], width=4)
+        cpu_combo.pack(side=tk.LEFT, padx=5)
+        cpu_combo.bind('<<ComboboxSelected>>', self.on_scheduler_targets_change)
+        
+        self.scheduler_status_label = ttk.Label(scheduler_frame, text="")
+        self.scheduler_status_label.pack(side=tk.LEFT, padx=10)
+        
+        # Время стадий поверх видео
+        self.metrics_overlay_var = tk.BooleanVar(value=False)
+        self.metrics_overlay_enabled = False
+        self.metrics_overlay_var.trace_add('write', self.on_metrics_overlay_toggle)
+        ttk.Checkbutton(scheduler_frame, text=self.get_text("metrics_overlay"),
+                        variable=self.metrics_overlay_var).pack(side=tk.RIGHT, padx=5)
         
         # === ГЛАВНЫЕ КНОПКИ ДЕЙСТВИЙ (перенесены наверх правой части) ===
         main_actions_frame = ttk.LabelFrame(right_frame, text=self.get_text("main_actions"))
@@ -529,6 +654,13 @@ class PersonnelApp:
               command=self.delete_person, style="Delete.TButton", width=btn_width).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         ttk.Button(actions_row4, text=self.get_text("show_history"),
               command=self.show_history, style="Action.TButton", width=btn_width).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
+        # Пятая строка: несколько камер с общей базой лиц
+        actions_row5 = ttk.Frame(main_actions_frame)
+        actions_row5.pack(fill=tk.X, pady=2)
+
+        ttk.Button(actions_row5, text=self.get_text("multi_camera"),
+              command=self.open_multi_camera, style="Action.TButton", width=btn_width).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         # Информация о текущем лице
         current_info_frame = ttk.LabelFrame(right_frame, text=self.get_text("current_face_info"))
         current_info_frame.pack(fill=tk.X, pady=(0, 10))
@@ -589,7 +721,8 @@ class PersonnelApp:
     def start_camera(self):
         """Запуск камеры"""
         if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(self.current_camera)
+            # Камера читается в отдельном потоке, хранится только последний кадр
+            self.cap = FrameGrabber(self.current_camera)
             if self.cap.isOpened():
                 # Камера уже запущена
                 messagebox.showinfo(self.get_text("success"), self.get_text("camera_on"))
@@ -601,7 +734,15 @@ class PersonnelApp:
         if self.cap:
             # Камера остановлена
             self.cap.release()
+            # Кадры, уже поставленные в очередь или еще обрабатываемые, не показываем
+            self.render_generation += 1
+            try:
+                while True:
+                    self.render_queue.get_nowait()
+            except queue.Empty:
+                pass
             self.video_label.configure(image="", text=self.get_text("camera_not_active"))
+            self.video_photo = None
             messagebox.showinfo(self.get_text("information"), self.get_text("camera_off"))
     
     def toggle_recognition(self):
@@ -615,14 +756,18 @@ class PersonnelApp:
         else:
             # Выключаем распознавание
             self.recognition_toggle_btn.configure(text=self.get_text("recognition_off"), style="Warning.TButton")
-            self.clear_current_info()
     
     def on_recognition_toggle(self, *args):
         """Вызывается при изменении статуса автоматического распознавания"""
-        if not self.recognition_var.get():
+        self.recognition_enabled = self.recognition_var.get()
+        if not self.recognition_enabled:
             # При отключении автоматического распознавания очищаем информацию
             self.clear_current_info()
     
+    def on_metrics_overlay_toggle(self, *args):
+        """Копия флага вывода метрик для потока обработки видео"""
+        self.metrics_overlay_enabled = self.metrics_overlay_var.get()
+    
     def change_camera(self, event=None):
         """Смена камеры"""
         if self.cap and self.cap.isOpened():
@@ -633,6 +778,47 @@ class PersonnelApp:
         # Автоматически запускаем камеру после смены
         self.start_camera()
     
+    def open_multi_camera(self):
+        """Окно нескольких камер: общий распознаватель и база, запись входа/выхода по камерам"""
+        specs = simpledialog.askstring(self.get_text("multi_camera"), self.get_text("multi_camera_prompt"),
+                                       initialvalue=f"{self.current_camera}@in", parent=self.root)
+        if not specs:
+            return
+        try:
+            cameras = [parse_camera_spec(spec, index)
+                       for index, spec in enumerate(spec for spec in specs.split(",") if spec.strip())]
+        except ValueError as e:
+            messagebox.showerror(self.get_text("error"), str(e))
+            return
+        
+        # Камеры освобождаются, чтобы их могла открыть новая обработка нескольких камер
+        if self.multi_camera is not None:
+            self.multi_camera.stop()
+            self.multi_camera = None
+        if self.cap and self.cap.isOpened():
+            self.cap.release()
+            self.video_label.configure(image="", text=self.get_text("camera_not_active"))
+            self.video_photo = None
+        
+        processor = MultiCameraProcessor(self.face_recognizer, cameras,
+                                         cpu_budget=self.scheduler.cpu_budget,
+                                         target_fps=self.scheduler.target_fps)
+        if not any(stream.isOpened() for stream in processor.streams):
+            processor.stop()
+            messagebox.showerror(self.get_text("error"), self.get_text("multi_camera_failed"))
+            return
+        self.multi_camera = processor
+        processor.start()
+        
+        def on_close():
+            if self.multi_camera is processor:
+                self.multi_camera = None
+            self.update_personnel_list()
+        
+        window = tk.Toplevel(self.root)
+        window.title(self.get_text("multi_camera"))
+        MultiCameraWindow(window, processor, on_event=self.update_personnel_list, on_close=on_close)
+    
     def on_language_change(self, event=None):
         """Обработка смены языка"""
         new_language = self.language_var.get()
@@ -642,39 +828,10 @@ class PersonnelApp:
     def put_text_utf8(self, image, text, position, font_scale=2, color=(255, 255, 255), thickness=2):
         """Безопасное отображение UTF-8 текста на изображении с поддержкой кириллицы"""
         try:
-            # Пытаемся создать изображение с текстом через PIL
-            from PIL import Image as PILImage, ImageDraw, ImageFont
-            import numpy as np
-            
-            # Конвертируем BGR в RGB
-            if len(image.shape) == 3:
-                pil_image = PILImage.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-            else:
-                pil_image = PILImage.fromarray(image)
-            
-            draw = ImageDraw.Draw(pil_image)
-            
-            # Пытаемся загрузить системный шрифт
-            try:
-                # Для Windows
-                font = ImageFont.truetype("arial.ttf", int(38 * font_scale))
-            except:
-                try:
-                    # Альтернативный шрифт для Windows
-                    font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", int(38 * font_scale))
-                except:
-                    # Стандартный шрифт PIL
-                    font = ImageFont.load_default()
-            
-            # Рисуем текст
+            # Подпись рисуется через PIL только в своей области кадра,
+            # шрифт и растр подписи берутся из кэша
             x, y = position
-            draw.text((x, y - 20), text, font=font, fill=color[::-1])  # BGR -> RGB
-            
-            # Конвертируем обратно в OpenCV формат
-            cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            # Копируем результат обратно в оригинальное изображение
-            image[:] = cv_image[:]
+            self.label_renderer.draw(image, text, (x, y - 20), int(38 * font_scale), color)  # Цвет в BGR, как у кадра
             
         except Exception as e:
             # Если PIL не работает, используем транслитерацию
@@ -712,48 +869,104 @@ class PersonnelApp:
     
     def update_frame(self):
         """Оптимизированное обновление кадра видео для слабых процессоров"""
-        frame_count = 0
-        recognition_interval = 5  # Распознавание каждый 5-й кадр для производительности
+        last_frame_id = 0
         
         while True:
+            # Пауза, пока камера не активна; при обработке ее задает планировщик
+            delay = 0.05
             if self.cap and self.cap.isOpened():
-                ret, frame = self.cap.read()
+                # Самый свежий кадр из потока захвата (устаревшие кадры отбрасываются)
+                frame_started = time.perf_counter()
+                generation = self.render_generation
+                ret, frame, last_frame_id, captured_at = self.cap.read_latest(last_frame_id, timeout=0.5)
                 if ret:
                     # Отражаем изображение
                     frame = cv2.flip(frame, 1)
+                    self.metrics.observe('capture', time.perf_counter() - frame_started)
+                    
+                    # Планировщик решает, нужна ли детекция на этом кадре
+                    detect_now = self.scheduler.begin_frame()
+                    
+                    # Уменьшаем разрешение для обработки (выбирается планировщиком)
+                    with self.metrics.time('resize'):
+                        processing_frame = cv2.resize(frame, self.scheduler.resolution)
+                    scale_x = frame.shape[1] / processing_frame.shape[1]
+                    scale_y = frame.shape[0] / processing_frame.shape[0]
                     
-                    # Уменьшаем разрешение для обработки
-                    processing_frame = cv2.resize(frame, (320, 240))
+                    # Каскад запускается только при движении в кадре или если в кадре уже есть лица
+                    with self.metrics.time('motion'):
+                        motion = self.motion_gate.update(processing_frame)
+                    has_faces = bool(self.face_tracker.tracks or self.detected_faces)
+                    if detect_now:
+                        detect_now = self.motion_gate.allow(motion, has_faces)
+                    
+                    # Переключатели читаются один раз на кадр (копии переменных Tk)
+                    recognition_enabled = self.recognition_enabled
                     
                     # Детекция и распознавание только если включено автоматическое распознавание
-                    if self.recognition_var.get() and frame_count % recognition_interval == 0:
-                        self.detected_faces = self.face_recognizer.detect_faces(processing_frame)
-                        
-                        # Масштабируем координаты обратно к оригинальному размеру
-                        scale_x = frame.shape[1] / 320
-                        scale_y = frame.shape[0] / 240
+                    if recognition_enabled:
+                        faces = None
+                        face_scale = (scale_x, scale_y)
+                        if self.pipeline is not None:
+                            # Детекция и признаки в рабочих процессах: кадр отправляется,
+                            # если есть свободная ячейка, берется последний готовый результат
+                            if detect_now:
+                                seq = self.pipeline.submit(processing_frame)
+                                if seq is not None:
+                                    # Разрешение может смениться, пока кадр в работе
+                                    self.pipeline_frames[seq] = (scale_x, scale_y, time.perf_counter())
+                            for seq, result in self.pipeline.poll():
+                                result_scale_x, result_scale_y, submitted_at = self.pipeline_frames.pop(seq)
+                                # Время от отправки до результата - задержка детекции в конвейере
+                                elapsed = time.perf_counter() - submitted_at
+                                self.scheduler.record('detect', elapsed, in_frame=False)
+                                self.metrics.observe('detect', elapsed)
+                                faces = result
+                                face_scale = (result_scale_x, result_scale_y)
+                        elif detect_now:
+                            # Признаки считаются позже и только для лиц, которые нужно распознать
+                            started = time.perf_counter()
+                            faces = self.face_recognizer.detect_faces(processing_frame, with_features=False)
+                            elapsed = time.perf_counter() - started
+                            self.scheduler.record('detect', elapsed)
+                            self.metrics.observe('detect', elapsed)
                         
-                        for face in self.detected_faces:
-                            x, y, w, h = face['coordinates']
-                            x = int(x * scale_x)
-                            y = int(y * scale_y)
-                            w = int(w * scale_x)
-                            h = int(h * scale_y)
-                            face['coordinates'] = (x, y, w, h)
+                        if faces is not None:
+                            # Масштабируем координаты обратно к размеру кадра, на котором шла детекция
+                            for face in faces:
+                                x, y, w, h = face['coordinates']
+                                x = int(x * face_scale[0])
+                                y = int(y * face_scale[1])
+                                w = int(w * face_scale[0])
+                                h = int(h * face_scale[1])
+                                face['coordinates'] = (x, y, w, h)
                             
-                            # Распознавание лица
-                            name, confidence = self.face_recognizer.recognize_face(face['face_roi'])
-                            face['name'] = name
-                            face['confidence'] = confidence
+                            # Связываем детекции с треками и распознаем только новые,
+                            # неуверенные или давно не проверенные треки
+                            with self.metrics.time('track'):
+                                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                                self.face_tracker.update(faces, gray)
+                            started = time.perf_counter()
+                            self.face_tracker.recognize(self.face_recognizer)
+                            self.scheduler.record('recognize', time.perf_counter() - started)
+                        elif self.face_tracker.tracks:
+                            # Между детекциями сдвигаем рамки по шаблонам лиц
+                            with self.metrics.time('track'):
+                                self.face_tracker.propagate(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+                        
+                        self.detected_faces = self.face_tracker.as_faces()
                     
                     # Если автоматическое распознавание отключено, только детектируем лица
-                    elif not self.recognition_var.get() and frame_count % recognition_interval == 0:
-                        self.detected_faces = self.face_recognizer.detect_faces(processing_frame)
+                    elif detect_now:
+                        # Треки с личностями сбрасываются, признаки не нужны
+                        self.face_tracker.reset()
+                        started = time.perf_counter()
+                        self.detected_faces = self.face_recognizer.detect_faces(processing_frame, with_features=False)
+                        elapsed = time.perf_counter() - started
+                        self.scheduler.record('detect', elapsed)
+                        self.metrics.observe('detect', elapsed)
                         
                         # Масштабируем координаты обратно к оригинальному размеру
-                        scale_x = frame.shape[1] / 320
-                        scale_y = frame.shape[0] / 240
-                        
                         for face in self.detected_faces:
                             x, y, w, h = face['coordinates']
                             x = int(x * scale_x)
@@ -766,20 +979,24 @@ class PersonnelApp:
                             face['confidence'] = 0.0
                     
                     # Очищаем детекцию если автоматическое распознавание отключено и время прошло
-                    elif not self.recognition_var.get():
+                    else:
                         if hasattr(self, 'detected_faces'):
                             # Очищаем старые результаты распознавания
                             for face in self.detected_faces:
                                 face['name'] = None
                                 face['confidence'] = 0.0
                     
+                    # Обновление панели информации передается вместе с кадром в главный поток
+                    info = None
+                    
                     # Рисуем прямоугольники и информацию
+                    labels_started = time.perf_counter()
                     if hasattr(self, 'detected_faces') and self.detected_faces:
                         for face in self.detected_faces:
                             x, y, w, h = face['coordinates']
                             
                             # Цвет рамки зависит от статуса распознавания
-                            if self.recognition_var.get():
+                            if recognition_enabled:
                                 color = (0, 255, 0) if face.get('name') else (0, 0, 255)
                             else:
                                 color = (255, 255, 0)  # Желтая рамка когда распознавание отключено
@@ -787,7 +1004,7 @@ class PersonnelApp:
                             cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
                             
                             # Показываем информацию только если автоматическое распознавание включено
-                            if self.recognition_var.get():
+                            if recognition_enabled:
                                 name = face.get('name')
                                 confidence = face.get('confidence', 0.0)
                                 
@@ -797,7 +1014,7 @@ class PersonnelApp:
                                                      (x, y - 10), 0.6, (0, 255, 0), 2)
                                     
                                     # Обновляем информацию о текущем лице
-                                    self.update_current_info(name, confidence)
+                                    info = ('show', name, confidence)
                                 else:
                                     self.put_text_utf8(frame, self.get_text("unknown"), 
                                                      (x, y - 10), 0.6, (0, 0, 255), 2)
@@ -807,24 +1024,163 @@ class PersonnelApp:
                                                  (x, y - 10), 0.6, (255, 255, 0), 2)
                         
                         # Очищаем информацию периодически если автораспознавание выключено
-                        if not self.recognition_var.get():
-                            if frame_count % recognition_interval == 0:
-                                self.clear_current_info()
+                        if not recognition_enabled:
+                            if detect_now:
+                                info = ('clear',)
+                    
+                    self.metrics.observe('labels', time.perf_counter() - labels_started)
+                    
+                    # Время стадий поверх видео
+                    if self.metrics_overlay_enabled:
+                        self.collect_metrics()
+                        self.draw_metrics_overlay(frame)
                     
                     # Конвертируем для отображения в tkinter с пониженным качеством для производительности
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    frame_resized = cv2.resize(frame_rgb, (580, 400))
-                    img = Image.fromarray(frame_resized)
-                    photo = ImageTk.PhotoImage(image=img)
+                    with self.metrics.time('convert'):
+                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                        frame_resized = cv2.resize(frame_rgb, (580, 400))
+                        img = Image.fromarray(frame_resized)
                     
-                    # Обновляем изображение
-                    self.video_label.configure(image=photo, text="")
-                    self.video_label.image = photo
+                    # Готовый кадр показывает главный поток Tk (render_loop)
+                    self.submit_render(img, captured_at, info, generation)
                     
-                    frame_count += 1
+                    # Без движения и лиц кадры обрабатываются с пониженной частотой
+                    delay = self.scheduler.end_frame(idle=not (motion or has_faces))
+                    self.metrics.observe('frame', time.perf_counter() - frame_started)
+                    self.metrics.inc('frames', help_text="Обработано кадров")
+                    if detect_now:
+                        self.metrics.inc('detections', help_text="Кадров с запуском детекции")
             
-            # Увеличиваем задержку для снижения нагрузки на процессор
-            time.sleep(0.05)  # ~20 FPS вместо 30 для экономии ресурсов
+            # Пауза до следующего кадра по целевой частоте и доле процессора
+            time.sleep(delay)
+    
+    def submit_render(self, image, captured_at, info=None, generation=None):
+        """Передача готового кадра в главный поток; при заполненной очереди старый кадр выбрасывается"""
+        if generation is None:
+            generation = self.render_generation
+        item = (image, captured_at, info, generation)
+        try:
+            self.render_queue.put_nowait(item)
+        except queue.Full:
+            try:
+                _, _, dropped_info, dropped_generation = self.render_queue.get_nowait()
+                self.render_dropped += 1
+                if info is None and dropped_generation == generation:
+                    item = (image, captured_at, dropped_info, generation)
+            except queue.Empty:
+                pass
+            self.render_queue.put_nowait(item)
+    
+    def render_loop(self):
+        """Показ последнего готового кадра в главном потоке Tk (через root.after)"""
+        item = None
+        info = None
+        try:
+            while True:
+                queued = self.render_queue.get_nowait()
+                # Кадр, обработанный до остановки камеры, отбрасывается
+                if queued[3] != self.render_generation:
+                    continue
+                item = queued
+                if item[2] is not None:
+                    info = item[2]
+        except queue.Empty:
+            pass
+        
+        if item is not None:
+            image, captured_at, _, _ = item
+            tk_started = time.perf_counter()
+            photo = self.video_photo
+            if photo is None or photo.width() != image.width or photo.height() != image.height:
+                # Буфер изображения создается один раз и дальше переиспользуется
+                self.video_photo = ImageTk.PhotoImage(image=image)
+                self.video_label.configure(image=self.video_photo, text="")
+                self.video_label.image = self.video_photo
+            else:
+                photo.paste(image)
+            self.metrics.observe('tk', time.perf_counter() - tk_started)
+            
+            if info is not None:
+                self.apply_current_info(info)
+            self.update_capture_stats(time.monotonic() - captured_at)
+        
+        self.root.after(self.display_interval_ms, self.render_loop)
+    
+    def apply_current_info(self, info):
+        """Обновление панели информации, только если она изменилась"""
+        if info[0] == 'show':
+            info = ('show', info[1], round(info[2], 2))
+        if info == self.shown_info:
+            return
+        self.shown_info = info
+        if info[0] == 'show':
+            self.update_current_info(info[1], info[2])
+        else:
+            self.clear_current_info()
+    
+    def update_capture_stats(self, latency):
+        """Учет задержки от захвата до показа кадра и вывод статистики раз в секунду"""
+        if self.display_latency is None:
+            self.display_latency = latency
+        else:
+            self.display_latency = 0.9 * self.display_latency + 0.1 * latency
+        
+        now = time.monotonic()
+        if now - self.last_stats_update < 1.0:
+            return
+        self.last_stats_update = now
+        
+        stats = self.cap.get_stats()
+        tracking = self.face_tracker.get_stats()
+        self.capture_status_label.configure(text=self.get_text("capture_stats").format(
+            latency=self.display_latency * 1000, dropped=stats['dropped']) + " | " +
+            self.get_text("tracking_stats").format(**tracking) + " | " +
+            self.get_text("motion_stats").format(**self.motion_gate.get_stats()))
+        
+        status = self.scheduler.get_status()
+        text = self.get_text("scheduler_stats").format(**status)
+        if not status['latency_met']:
+            text += " | " + self.get_text("latency_target_missed")
+        self.scheduler_status_label.configure(text=text)
+    
+    def collect_metrics(self):
+        """Обновление счетчиков и текущих значений, которые ведут другие объекты"""
+        metrics = self.metrics
+        cap = self.cap
+        if cap is not None and hasattr(cap, 'get_stats'):
+            stats = cap.get_stats()
+            metrics.set_counter('capture_dropped', stats['dropped'], "Кадров камеры, замененных более новыми до обработки")
+        metrics.set_counter('render_dropped', self.render_dropped, "Обработанных кадров, замененных более новыми до показа")
+        
+        status = self.scheduler.get_status()
+        metrics.set_gauge('fps', float(status['fps']), "Частота обработки кадров")
+        metrics.set_gauge('detection_interval', status['interval'], "Детекция раз в столько кадров")
+        metrics.set_gauge('gallery_samples', len(self.face_recognizer.gallery_index), "Образцов в галерее")
+        metrics.set_gauge('gallery_persons', len(self.face_recognizer.face_database), "Людей в галерее")
+        metrics.set_gauge('tracks', len(self.face_tracker.tracks), "Сопровождаемых лиц")
+        if self.display_latency is not None:
+            metrics.set_gauge('display_latency_seconds', float(self.display_latency), "Задержка от захвата до показа кадра")
+    
+    def draw_metrics_overlay(self, frame):
+        """Время стадий и текущие значения в левом верхнем углу кадра"""
+        lines = self.metrics.overlay_lines()
+        if not lines:
+            return
+        line_height = 16
+        height = min(frame.shape[0], line_height * len(lines) + 8)
+        region = frame[:height, :min(frame.shape[1], 270)]
+        region[:] = region // 3  # Затемнение фона под текстом
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (6, 16 + i * line_height), cv2.FONT_HERSHEY_PLAIN, 1.0,
+                        (255, 255, 255), 1, cv2.LINE_AA)
+    
+    def on_scheduler_targets_change(self, event=None):
+        """Изменение целевой частоты кадров и доли процессора"""
+        try:
+            self.scheduler.set_targets(target_fps=float(self.target_fps_var.get()),
+                                       cpu_budget=float(self.cpu_budget_var.get()) / 100)
+        except ValueError:
+            pass
     
     def add_person_dialog(self):
         """Диалог добавления нового сотрудника"""
@@ -882,8 +1238,6 @@ class PersonnelApp:
                 'rank': rank
             }
             
-            face_roi = self.detected_faces[0]['face_roi']
-            
             # Получаем текущий кадр для сохранения оригинального изображения
             original_frame = None
             if self.cap and self.cap.isOpened():
@@ -891,7 +1245,18 @@ class PersonnelApp:
                 if ret:
                     original_frame = cv2.flip(frame, 1)  # Отражаем как в интерфейсе
             
-            success = self.face_recognizer.add_person(face_roi, person_info, original_frame)
+            # Лицо берется с текущего кадра: в лицах с экрана (треках) между
+            # детекциями может не быть области лица
+            faces = self.face_recognizer.detect_faces(original_frame) if original_frame is not None else []
+            if not faces:
+                faces = [face for face in self.detected_faces if face.get('face_roi') is not None]
+            if not faces:
+                messagebox.showwarning(self.get_text("warning"), self.get_text("no_face_detected"))
+                return
+            face_roi = faces[0]['face_roi']
+            face_features = faces[0].get('features')
+            
+            success = self.face_recognizer.add_person(face_roi, person_info, original_frame, face_features)
             
             if success:
                 messagebox.showinfo(self.get_text("success"), f"{name} {self.get_text('person_added_db')}")
@@ -1037,7 +1402,7 @@ class PersonnelApp:
         face_roi = detected_faces[0]['face_roi']
         
         # Распознаем лицо с теми же параметрами что и в автоматическом режиме
-        name, confidence = self.face_recognizer.recognize_face(face_roi)
+        name, confidence = self.face_recognizer.recognize_face(face_roi, detected_faces[0]['features'])
         
         if not name or confidence < 0.65:  # Тот же порог что и в автоматическом режиме
             messagebox.showwarning(self.get_text("warning"), 
@@ -1244,20 +1609,22 @@ class PersonnelApp:
         self.center_window(history_window, 700, 500)
         
         # Treeview для истории
-        columns = (self.get_text("column_name"), self.get_text("column_action"), self.get_text("column_time"))
+        columns = (self.get_text("column_name"), self.get_text("column_action"),
+                   self.get_text("column_time"), self.get_text("column_source"))
         history_tree = ttk.Treeview(history_window, columns=columns, show="headings")
         
         for col in columns:
             history_tree.heading(col, text=col)
-            history_tree.column(col, width=200)
+            history_tree.column(col, width=160)
         
         # Добавляем записи истории
-        history = self.face_recognizer.get_entry_history()
+        history = self.face_recognizer.get_entry_history(limit=self.history_window_limit)
         for entry in reversed(history):  # Показываем последние записи сверху
             history_tree.insert("", tk.END, values=(
                 entry['name'],
                 entry['action'],
-                entry['time']
+                entry['time'],
+                entry.get('source', "")
             ))
         
         history_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -1463,16 +1830,15 @@ class PersonnelApp:
         history_frame = ttk.LabelFrame(info_window, text=self.get_text("recent_entries_title"))
         history_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
         
-        # Получаем историю для этого сотрудника
-        all_history = self.face_recognizer.get_entry_history()
-        person_history = [entry for entry in all_history if entry['name'] == name]
+        # Получаем последние 10 записей истории для этого сотрудника
+        person_history = self.face_recognizer.get_entry_history(name, limit=10)
         
         if person_history:
             history_text = tk.Text(history_frame, height=6, state=tk.DISABLED, font=("Arial", 9))
             history_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
             
             history_text.config(state=tk.NORMAL)
-            for entry in reversed(person_history[-10:]):  # Последние 10 записей
+            for entry in reversed(person_history):
                 history_text.insert(tk.END, f"{entry['action']} - {entry['time']}\n")
             history_text.config(state=tk.DISABLED)
         else:
@@ -1489,8 +1855,20 @@ class PersonnelApp:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Система учета персонала")
+    parser.add_argument("--pipeline-workers", type=int,
+                        default=int(os.environ.get("PERSONNEL_PIPELINE_WORKERS", 0)),
+                        help="Процессов детекции и признаков (0 - в потоке видео)")
+    parser.add_argument("--metrics-port", type=int,
+                        default=int(os.environ.get("PERSONNEL_METRICS_PORT", 0)) or None,
+                        help="Порт HTTP для метрик Prometheus (/metrics на 127.0.0.1)")
+    parser.add_argument("--metrics-file", default=os.environ.get("PERSONNEL_METRICS_FILE") or None,
+                        help="Файл метрик для textfile-коллектора node_exporter")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = PersonnelApp(root)
+    app = PersonnelApp(root, pipeline_workers=max(0, args.pipeline_workers),
+                       metrics_port=args.metrics_port, metrics_file=args.metrics_file)
     
     try:
         root.mainloop()
@@ -1499,6 +1877,13 @@ def main():
     finally:
         if hasattr(app, 'cap') and app.cap:
             app.cap.release()
+        if app.pipeline is not None:
+            app.pipeline.close()
+        if app.metrics_exporter is not None:
+            app.metrics_exporter.close()
+        if app.multi_camera is not None:
+            app.multi_camera.stop()
+        app.face_recognizer.close()
         cv2.destroyAllWindows()
 
 
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Многопроцессный конвейер детекции лиц
+Детекция и извлечение признаков выполняются в отдельных процессах, чтобы
+не упираться в GIL. Кадры передаются не через pickle, а через кольцевой
+буфер в общей памяти (multiprocessing.shared_memory): в очередь уходит
+только номер ячейки. Результаты возвращаются строго в порядке кадров.
+Распознавание по галерее остается в основном процессе.
+"""
+
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    def __init__(self, slots, frame_shape, dtype=np.uint8, name=None):
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+
+        size = slots * int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            try:
+                # Подключившийся процесс не должен удалять общую память при выходе
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((slots,) + self.frame_shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, slot, frame):
+        """Копирование кадра в ячейку, возвращает его фактическую форму"""
+        frame = np.asarray(frame, dtype=self.dtype)
+        if frame.ndim != len(self.frame_shape) or frame.shape[0] > self.frame_shape[0] \
+                or frame.shape[1] > self.frame_shape[1] or frame.shape[2:] != self.frame_shape[2:]:
+            raise ValueError(f"Кадр {frame.shape} не помещается в ячейку {self.frame_shape}")
+        self.frames[slot][:frame.shape[0], :frame.shape[1]] = frame
+        return frame.shape
+
+    def view(self, slot, shape):
+        """Кадр в ячейке без копирования"""
+        return self.frames[slot][:shape[0], :shape[1]]
+
+    def close(self):
+        """Отключение от общей памяти (владелец также удаляет ее)"""
+        self.frames = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _worker_main(ring_name, slots, frame_shape, tasks, results):
+    """Рабочий процесс: детекция лиц и признаки для кадров из общей памяти"""
+    import cv2
+    from simple_face_recognizer import SimpleFaceRecognizer
+
+    # Параллелизм дают процессы, внутренние потоки OpenCV только мешают
+    cv2.setNumThreads(1)
+    ring = SharedFrameRing(slots, frame_shape, name=ring_name)
+    recognizer = SimpleFaceRecognizer(detector_only=True)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot, shape, with_features = task
+            try:
+                faces = recognizer.detect_faces(ring.view(slot, shape), with_features)
+            except Exception as e:
+                # Результат нужен в любом случае: иначе ячейка не освободится,
+                # а выдача по порядку будет ждать этот кадр бесконечно
+                print(f"Ошибка детекции в рабочем процессе (кадр {seq}): {e}")
+                faces = []
+            results.put((seq, slot, faces))
+    finally:
+        ring.close()
+
+
+class ProcessPipeline:
+    """Конвейер детекции в процессах; методы вызываются из одного потока"""
+
+    def __init__(self, workers=2, frame_shape=(240, 320, 3), slots=None, with_features=True):
+        self.workers = workers
+        self.with_features = with_features
+        self.slots = slots or workers * 2
+
+        # Счетчики
+        self.submitted = 0  # Кадров отправлено в работу
+        self.skipped = 0  # Кадров пропущено из-за заполненного буфера
+        self.completed = 0  # Результатов выдано по порядку
+
+        self.ring = SharedFrameRing(self.slots, frame_shape)
+        self._free = list(range(self.slots))
+        self._next_seq = 0
+        self._next_out = 0
+        self._pending = {}  # Буфер переупорядочивания: номер кадра -> лица
+
+        # spawn: процессы не наследуют потоки Tk и OpenCV
+        context = mp.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(target=_worker_main,
+                            args=(self.ring.name, self.slots, self.ring.frame_shape, self._tasks, self._results),
+                            daemon=True)
+            for _ in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+    @property
+    def in_flight(self):
+        """Кадров в обработке или ожидающих выдачи"""
+        return self._next_seq - self._next_out
+
+    def submit(self, frame, block=False, timeout=None):
+        """Отправка кадра в работу, возвращает его номер или None, если буфер заполнен"""
+        if not self._free:
+            self._collect(block, timeout)
+            if not self._free:
+                self.skipped += 1
+                return None
+
+        slot = self._free.pop()
+        shape = self.ring.write(slot, frame)
+        seq = self._next_seq
+        self._next_seq += 1
+        self._tasks.put((seq, slot, shape, self.with_features))
+        self.submitted += 1
+        return seq
+
+    def _collect(self, block=False, timeout=None):
+        """Прием готовых результатов в буфер переупорядочивания, возвращает их число"""
+        received = 0
+        try:
+            item = self._results.get(block=block, timeout=timeout)
+            while True:
+                seq, slot, faces = item
+                self._free.append(slot)
+                self._pending[seq] = faces
+                received += 1
+                item = self._results.get_nowait()
+        except queue.Empty:
+            pass
+        return received
+
+    def poll(self, block=False, timeout=None):
+        """Готовые результаты в порядке кадров: список (номер кадра, лица)
+
+        При block=True ждет, пока не будет готов следующий по порядку кадр
+        (если есть кадры в работе).
+        """
+        self._collect()
+        while block and self._next_out not in self._pending and self._next_out < self._next_seq:
+            if not self._collect(True, timeout):
+                break
+
+        ready = []
+        while self._next_out in self._pending:
+            ready.append((self._next_out, self._pending.pop(self._next_out)))
+            self._next_out += 1
+        self.completed += len(ready)
+        return ready
+
+    def alive_workers(self):
+        """Число работающих рабочих процессов"""
+        return sum(1 for process in self._processes if process.is_alive())
+
+    def get_stats(self):
+        """Счетчики конвейера"""
+        return {
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'skipped': self.skipped,
+            'completed': self.completed,
+            'in_flight': self.in_flight,
+            'alive': self.alive_workers()
+        }
+
+    def close(self):
+        """Остановка рабочих процессов и освобождение общей памяти"""
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self.ring.close()
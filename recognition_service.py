@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Сервис распознавания без интерфейса (HTTP по TCP или Unix-сокету)
+Галерея загружается один раз, запросы обрабатываются параллельно:
+декодирование, детекция и признаки - в потоках запросов (у каждого потока
+свой детектор), а поиск по галерее собирается из одновременных запросов
+в пакеты и выполняется одним матричным проходом. Перезагрузка базы
+(POST /reload или SIGHUP) не прерывает обслуживание: новая база
+загружается рядом со старой и подменяет ее целиком.
+
+Запросы и ответы - JSON, изображения передаются в base64 (JPEG/PNG):
+  GET  /health
+  POST /detect     {"image": ...}
+  POST /recognize  {"image": ..., "crop": false}   crop=true - изображение уже лицо
+  POST /enroll     {"image": ..., "name", "position", "age", "rank", "crop": false}
+  POST /record     {"name": ..., "action": "entry" | "exit"}
+  POST /reload
+
+Запуск: python recognition_service.py [--host 127.0.0.1] [--port 8765] | [--unix /run/faces.sock]
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from simple_face_recognizer import SimpleFaceRecognizer
+
+
+ACTIONS = {'entry': 'Вошел', 'exit': 'Вышел', 'Вошел': 'Вошел', 'Вышел': 'Вышел'}
+
+
+class RequestError(ValueError):
+    """Ошибка в запросе клиента (ответ 400)"""
+
+
+class RecognitionBatcher:
+    """Сбор признаков из одновременных запросов в один поиск по галерее"""
+
+    def __init__(self, use_recognizer, max_batch=32, max_wait=0.005):
+        self.use_recognizer = use_recognizer  # Контекст: текущий распознаватель на время пакета
+        self.max_batch = max_batch
+        self.max_wait = max_wait  # Сколько ждать остальных запросов после первого (с)
+
+        # Счетчики
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, features):
+        """Признаки лиц одного запроса -> Future со списком (имя, уверенность)"""
+        future = Future()
+        if not features:
+            future.set_result([])
+        else:
+            self._queue.put((features, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            rows = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while rows < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            self._process(batch)
+            if stop:
+                break
+
+    def _process(self, batch):
+        features = [vector for item_features, _ in batch for vector in item_features]
+        try:
+            with self.use_recognizer() as recognizer:
+                results = recognizer.recognize_faces([None] * len(features), features)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(features)
+        self.largest_batch = max(self.largest_batch, len(features))
+        start = 0
+        for item_features, future in batch:
+            future.set_result(results[start:start + len(item_features)])
+            start += len(item_features)
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'largest_batch': self.largest_batch,
+            'average_batch': self.items / self.batches if self.batches else 0.0
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+
+class RecognitionService:
+    def __init__(self, storage_backend="sqlite", max_batch=32, max_wait=0.005):
+        self.storage_backend = storage_backend
+        self.recognizer = SimpleFaceRecognizer(storage_backend=storage_backend)
+        self.generation = 1  # Номер загрузки базы (растет при перезагрузке)
+        self.started = time.time()
+        self.requests = 0
+        self._active = 0  # Запросов в обработке
+        self._active_cond = threading.Condition()
+        self._in_use = {}  # Распознаватель -> число пакетов, которые с ним работают
+
+        # Изменения базы и перезагрузка не выполняются одновременно
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self.batcher = RecognitionBatcher(self.use_recognizer, max_batch, max_wait)
+
+    @contextmanager
+    def use_recognizer(self):
+        """Текущий распознаватель; после перезагрузки он закрывается только когда освобожден"""
+        with self._active_cond:
+            recognizer = self.recognizer
+            self._in_use[recognizer] = self._in_use.get(recognizer, 0) + 1
+        try:
+            yield recognizer
+        finally:
+            with self._active_cond:
+                self._in_use[recognizer] -= 1
+                if not self._in_use[recognizer]:
+                    del self._in_use[recognizer]
+                self._active_cond.notify_all()
+
+    def detector(self):
+        """Детектор текущего потока (каскады OpenCV не делятся между потоками)"""
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            detector = self._local.detector = SimpleFaceRecognizer(detector_only=True)
+        return detector
+
+    @staticmethod
+    def decode_image(request):
+        data = request.get('image')
+        if not data:
+            raise RequestError("не передано изображение (image)")
+        try:
+            buffer = np.frombuffer(base64.b64decode(data, validate=True), dtype=np.uint8)
+        except (binascii.Error, ValueError):
+            raise RequestError("изображение должно быть в base64")
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is None:
+            raise RequestError("не удалось декодировать изображение")
+        return image
+
+    def faces_from_request(self, request, with_features=True):
+        """Лица запроса: детекция на кадре или готовый кроп лица (crop=true)"""
+        image = self.decode_image(request)
+        detector = self.detector()
+        if request.get('crop'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            face_roi = cv2.resize(gray, (100, 100))
+            return image, [{
+                'face_roi': face_roi,
+                'coordinates': (0, 0, image.shape[1], image.shape[0]),
+                'features': detector.extract_features(face_roi) if with_features else None
+            }]
+        return image, detector.detect_faces(image, with_features=with_features)
+
+    @staticmethod
+    def box(face):
+        x, y, w, h = (int(v) for v in face['coordinates'])
+        return {'x': x, 'y': y, 'w': w, 'h': h}
+
+    def detect(self, request):
+        _, faces = self.faces_from_request(request, with_features=False)
+        return {'faces': [self.box(face) for face in faces]}
+
+    def recognize(self, request):
+        _, faces = self.faces_from_request(request)
+        results = self.batcher.submit([face['features'] for face in faces]).result()
+        return {'faces': [dict(self.box(face), name=name, confidence=round(float(confidence), 4))
+                          for face, (name, confidence) in zip(faces, results)]}
+
+    def enroll(self, request):
+        name = request.get('name') or ''
+        if not isinstance(name, str) or not name.strip():
+            raise RequestError("не указано имя (name)")
+        name = name.strip()
+        # Имя становится именем каталога с фотографиями в faces/
+        separators = {'/', '\\', os.sep, os.altsep} - {None}
+        if name in ('.', '..') or any(char in separators or ord(char) < 32 or ord(char) == 127
+                                      for char in name):
+            raise RequestError("имя (name) не должно быть '.' или '..' и содержать разделители пути "
+                               "или управляющие символы")
+        try:
+            age = int(request.get('age') or 0)
+        except (TypeError, ValueError):
+            raise RequestError("возраст (age) должен быть числом")
+        image, faces = self.faces_from_request(request)
+        if not faces:
+            raise RequestError("лицо не найдено")
+        if len(faces) > 1:
+            raise RequestError(f"найдено несколько лиц: {len(faces)}")
+
+        person_info = {
+            'name': name,
+            'position': request.get('position', ''),
+            'age': age,
+            'rank': request.get('rank', '')
+        }
+        with self._write_lock:
+            self.recognizer.add_person(faces[0]['face_roi'], person_info,
+                                       original_frame=None if request.get('crop') else image,
+                                       features=faces[0]['features'])
+        return {'enrolled': name, 'face': self.box(faces[0])}
+
+    def record(self, request):
+        name = request.get('name')
+        action = ACTIONS.get(request.get('action'))
+        if not name or action is None:
+            raise RequestError("нужны name и action (entry/exit)")
+        with self._write_lock:
+            recorded = self.recognizer.record_entry_exit(name, action)
+        if not recorded:
+            raise RequestError(f"человек не найден: {name}")
+        return {'recorded': name, 'action': action}
+
+    def reload(self, request=None):
+        """Загрузка базы с диска без остановки обслуживания
+
+        Несохраненные изменения записываются, новая база загружается рядом
+        со старой, распознавание переключается на нее между пакетами.
+        Старая база закрывается после завершения пакетов, которые ее используют.
+        """
+        started = time.perf_counter()
+        with self._write_lock:
+            old = self.recognizer
+            old.flush()
+            new = SimpleFaceRecognizer(storage_backend=self.storage_backend)
+            with self._active_cond:
+                self.recognizer = new
+                self.generation += 1
+        with self._active_cond:
+            self._active_cond.wait_for(lambda: old not in self._in_use)
+        old.close()
+        return {
+            'generation': self.generation,
+            'persons': len(new.face_database),
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def health(self, request=None):
+        recognizer = self.recognizer
+        return {
+            'status': 'ok',
+            'generation': self.generation,
+            'persons': len(recognizer.face_database),
+            'samples': len(recognizer.gallery_index),
+            'uptime': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'batching': self.batcher.get_stats()
+        }
+
+    def handle(self, method, path, request):
+        """Обработка запроса, возвращает (код, ответ)"""
+        routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/detect'): self.detect,
+            ('POST', '/recognize'): self.recognize,
+            ('POST', '/enroll'): self.enroll,
+            ('POST', '/record'): self.record,
+            ('POST', '/reload'): self.reload,
+        }
+        handler = routes.get((method, path.split("?")[0].rstrip("/") or "/"))
+        if handler is None:
+            return 404, {'error': f"нет метода {method} {path}"}
+        with self._active_cond:
+            self.requests += 1
+            self._active += 1
+        try:
+            return 200, handler(request)
+        except RequestError as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            print(f"Ошибка обработки {method} {path}: {e}")
+            return 500, {'error': str(e)}
+        finally:
+            with self._active_cond:
+                self._active -= 1
+                self._active_cond.notify_all()
+
+    def close(self, timeout=10.0):
+        """Остановка после завершения начатых запросов (не дольше timeout)"""
+        with self._active_cond:
+            self._active_cond.wait_for(lambda: self._active == 0, timeout)
+        self.batcher.close()
+        self.recognizer.close()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Соединения переиспользуются клиентами
+
+    def address_string(self):
+        # У Unix-сокета нет адреса клиента
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _respond(self, method, request):
+        status, response = self.server.service.handle(method, self.path, request)
+        body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond('GET', {})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            self.send_error(400, "JSON object expected")
+            return
+        self._respond('POST', request)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host="127.0.0.1", port=8765, unix_path=None):
+    """HTTP-сервер сервиса на TCP-порту или Unix-сокете"""
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        server = ThreadingUnixHTTPServer(unix_path, ServiceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервис распознавания лиц")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Путь к Unix-сокету вместо TCP")
+    parser.add_argument("--max-batch", type=int, default=32, help="Лиц в одном поиске по галерее")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Ожидание остальных запросов пакета")
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "pickle"))
+    args = parser.parse_args()
+
+    service = RecognitionService(args.storage, args.max_batch, args.max_wait_ms / 1000.0)
+    server = create_server(service, args.host, args.port, args.unix)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Сервис запущен: {args.unix or f'http://{args.host}:{server.server_address[1]}'}, "
+          f"людей в базе: {len(service.recognizer.face_database)}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=service.reload, daemon=True).start())
+    try:
+        while not stop.wait(0.5):
+            pass
+    finally:
+        # Новые соединения не принимаются, начатые запросы завершаются
+        server.shutdown()
+        server.server_close()
+        service.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+        print("Сервис остановлен")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,20 +7,45 @@
 - Сравнение гистограмм для распознавания
 """
 
+import atexit
 import cv2
 import numpy as np
 import os
+import threading
 import time
-from sklearn.metrics.pairwise import cosine_similarity
 import pickle
+import shutil
+
+from ann_index import IVFIndex
+from event_journal import EventJournal
+from face_boxes import non_max_suppression
+from feature_store import FeatureStore
+from gallery_index import GalleryIndex
+from image_store import ImageStore
+from lbp import compute_lbp
+from persistence import WriteBehindSaver, atomic_write_bytes
+from sqlite_storage import SQLiteStorage
 
 
 class SimpleFaceRecognizer:
-    def __init__(self):
+    def __init__(self, storage_backend="sqlite", gallery_precision="float32", gallery_rerank=5,
+                 detector_only=False):
         # Загружаем каскады Хаара для детекции лиц
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
         
+        # Детекция на фотографиях: "single" - один проход с NMS, "legacy" - три прохода
+        self.image_detection_mode = "single"
+        self.image_nms_threshold = 0.3
+        self.image_containment_threshold = 0.8
+        
+        # Необязательные метрики стадий (StageMetrics): признаки и поиск по галерее
+        self.metrics = None
+        
+        # Рабочим процессам конвейера нужны только детекция и признаки, без базы данных
+        if detector_only:
+            return
+        
         # Простая система распознавания без LBPH (используем только признаки)
         
         # База данных лиц (словарь: имя -> данные о человеке)
@@ -29,14 +54,49 @@ class SimpleFaceRecognizer:
         self.entry_history = []  # История входов/выходов
         self.label_counter = 0
         
+        # Матричный индекс образцов для быстрого распознавания.
+        # gallery_precision="float16"/"int8" - оценка по сжатой матрице (меньше
+        # памяти, но медленнее float32), полные векторы остаются в файле признаков;
+        # gallery_rerank лучших людей переоцениваются по полным векторам
+        self.gallery_index = GalleryIndex(top_k=3, precision=gallery_precision, rerank=gallery_rerank)
+        
         # Путь к файлу базы данных
         self.database_path = "database/face_database.pkl"
         
+        # Векторы признаков хранятся отдельно в файле, отображаемом в память
+        self.feature_store = FeatureStore("database")
+        self._features_dirty = False  # Галерея изменилась после последнего сохранения
+        self._dirty_persons = set()  # Люди, чьи записи нужно обновить (или удалить) в SQLite
+        
+        # Снимки лиц хранятся на диске, в записях о людях - только ссылки
+        self.image_store = ImageStore("database/images", cache_size=32)
+        
+        # Журнал событий входа/выхода поверх снимка базы данных
+        self.journal = EventJournal("database/entry_journal.log")
+        self.journal_compact_threshold = 500  # Событий в журнале до свертки в снимок
+        
+        # Данные о людях и история входов/выходов: "sqlite" или "pickle" (все в одном снимке)
+        self.storage_backend = storage_backend
+        self.storage = None
+        if storage_backend == "sqlite":
+            self.storage = SQLiteStorage("database/personnel.db")
+        
+        # Блокировка данных: изменения идут из потока Tk, запись - из фонового потока
+        self._lock = threading.RLock()
+        
+        # Отложенная запись: серии изменений объединяются в одну запись на диск
+        self._saver = WriteBehindSaver(self._write_database, delay=0.5)
+        atexit.register(self.flush)
+        
         # Загружаем существующую базу данных
         self.load_database()
     
-    def detect_faces(self, frame):
-        """Детекция лиц на изображении с обработкой ошибок"""
+    def detect_faces(self, frame, with_features=True):
+        """Детекция лиц на изображении с обработкой ошибок
+        
+        При with_features=False признаки не извлекаются (режим только детекции),
+        поле 'features' у найденных лиц равно None.
+        """
         try:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             
@@ -91,7 +151,7 @@ class SimpleFaceRecognizer:
                 detected_faces.append({
                     'face_roi': face_roi,
                     'coordinates': (x, y, w, h),
-                    'features': self.extract_features(face_roi)
+                    'features': self.extract_features(face_roi) if with_features else None
                 })
             
             return detected_faces
@@ -99,7 +159,82 @@ class SimpleFaceRecognizer:
         except Exception as e:
             print(f"Общая ошибка при детекции лиц: {e}")
             return []
-    def detect_faces_from_image(self, image_path):
+    def prepare_image_gray(self, frame, max_dimension=1000):
+        """Подготовка фотографии к детекции: уменьшение, градации серого, CLAHE"""
+        # Масштабируем изображение если оно очень большое
+        height, width = frame.shape[:2]
+        if max(height, width) > max_dimension:
+            if width > height:
+                new_width = max_dimension
+                new_height = int(height * max_dimension / width)
+            else:
+                new_height = max_dimension
+                new_width = int(width * max_dimension / height)
+            frame = cv2.resize(frame, (new_width, new_height))
+        
+        # Преобразуем в градации серого
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        # Улучшаем контрастность
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        return clahe.apply(gray)
+    
+    def detect_image_boxes(self, gray, mode="single"):
+        """Рамки лиц (x, y, w, h) на подготовленной фотографии
+        
+        mode="single" - один проход каскада с мелким шагом масштаба, который
+        покрывает размеры лиц всех трех прежних проходов, и подавление
+        немаксимумов по IoU и вложенности рамок (оценка - число соседних
+        срабатываний).
+        mode="legacy" - прежние три прохода с удалением дубликатов по смещению.
+        """
+        if mode == "single":
+            boxes, neighbours = self.face_cascade.detectMultiScale2(
+                gray, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
+            )
+            if len(boxes) == 0:
+                return []
+            keep = non_max_suppression(boxes, neighbours, self.image_nms_threshold,
+                                       self.image_containment_threshold)
+            return [tuple(int(v) for v in boxes[i]) for i in keep]
+        
+        # Пробуем разные наборы параметров
+        all_faces = []
+        
+        # Набор 1: Стандартные параметры
+        faces1 = self.face_cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(50, 50)
+        )
+        all_faces.extend(faces1)
+        
+        # Набор 2: Более чувствительные параметры
+        faces2 = self.face_cascade.detectMultiScale(
+            gray, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
+        )
+        all_faces.extend(faces2)
+        
+        # Набор 3: Для больших лиц
+        faces3 = self.face_cascade.detectMultiScale(
+            gray, scaleFactor=1.2, minNeighbors=3, minSize=(100, 100)
+        )
+        all_faces.extend(faces3)
+        
+        # Убираем дубликаты
+        unique_faces = []
+        for face in all_faces:
+            is_duplicate = False
+            for existing in unique_faces:
+                # Проверяем перекрытие
+                x1, y1, w1, h1 = face
+                x2, y2, w2, h2 = existing
+                if abs(x1 - x2) < 50 and abs(y1 - y2) < 50:
+                    is_duplicate = True
+                    break
+            if not is_duplicate:
+                unique_faces.append(tuple(int(v) for v in face))
+        return unique_faces
+    
+    def detect_faces_from_image(self, image_path, mode=None):
         """Детекция лиц из файла изображения с улучшенными параметрами"""
         try:
             # Загружаем изображение
@@ -107,59 +242,8 @@ class SimpleFaceRecognizer:
             if frame is None:
                 return []
             
-            # Масштабируем изображение если оно очень большое
-            height, width = frame.shape[:2]
-            max_dimension = 1000
-            if max(height, width) > max_dimension:
-                if width > height:
-                    new_width = max_dimension
-                    new_height = int(height * max_dimension / width)
-                else:
-                    new_height = max_dimension
-                    new_width = int(width * max_dimension / height)
-                frame = cv2.resize(frame, (new_width, new_height))
-            
-            # Преобразуем в градации серого
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Улучшаем контрастность
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            gray = clahe.apply(gray)
-            
-            # Пробуем разные наборы параметров
-            all_faces = []
-            
-            # Набор 1: Стандартные параметры
-            faces1 = self.face_cascade.detectMultiScale(
-                gray, scaleFactor=1.1, minNeighbors=5, minSize=(50, 50)
-            )
-            all_faces.extend(faces1)
-            
-            # Набор 2: Более чувствительные параметры
-            faces2 = self.face_cascade.detectMultiScale(
-                gray, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
-            )
-            all_faces.extend(faces2)
-            
-            # Набор 3: Для больших лиц
-            faces3 = self.face_cascade.detectMultiScale(
-                gray, scaleFactor=1.2, minNeighbors=3, minSize=(100, 100)
-            )
-            all_faces.extend(faces3)
-            
-            # Убираем дубликаты
-            unique_faces = []
-            for face in all_faces:
-                is_duplicate = False
-                for existing in unique_faces:
-                    # Проверяем перекрытие
-                    x1, y1, w1, h1 = face
-                    x2, y2, w2, h2 = existing
-                    if abs(x1 - x2) < 50 and abs(y1 - y2) < 50:
-                        is_duplicate = True
-                        break
-                if not is_duplicate:
-                    unique_faces.append(face)
+            gray = self.prepare_image_gray(frame)
+            unique_faces = self.detect_image_boxes(gray, mode or self.image_detection_mode)
             
             detected_faces = []
             for (x, y, w, h) in unique_faces:
@@ -218,28 +302,13 @@ class SimpleFaceRecognizer:
         
         return combined_features
     
+    def extract_features_batch(self, face_rois):
+        """Извлечение признаков для нескольких лиц в виде матрицы (лица x признаки)"""
+        return np.vstack([self.extract_features(face_roi) for face_roi in face_rois])
+    
     def calculate_lbp(self, image):
-        """Вычисление Local Binary Patterns"""
-        lbp = np.zeros_like(image)
-        for i in range(1, image.shape[0] - 1):
-            for j in range(1, image.shape[1] - 1):
-                center = image[i, j]
-                code = 0
-                
-                # 8 соседей
-                neighbors = [
-                    image[i-1, j-1], image[i-1, j], image[i-1, j+1],
-                    image[i, j+1], image[i+1, j+1], image[i+1, j],
-                    image[i+1, j-1], image[i, j-1]
-                ]
-                
-                for k, neighbor in enumerate(neighbors):
-                    if neighbor >= center:
-                        code += 2**k
-                
-                lbp[i, j] = code
-        
-        return lbp
+        """Вычисление Local Binary Patterns (векторизованная версия из lbp.py)"""
+        return compute_lbp(image).astype(image.dtype, copy=False)
     
     def calculate_texture_features(self, image):
         """Вычисление текстурных признаков с фиксированной размерностью"""
@@ -273,17 +342,58 @@ class SimpleFaceRecognizer:
         
         return np.array(texture_features)
     
-    def add_person(self, face_roi, person_info, original_frame=None):
+    def add_person(self, face_roi, person_info, original_frame=None, features=None):
         """Добавление нового человека в базу данных с сохранением фотографии и оригинального кадра"""
         name = person_info['name']
-        features = self.extract_features(face_roi)
+        if features is None:
+            features = self.extract_features(face_roi)
         
-        if name not in self.face_database:
-            self.face_database[name] = []
-            self.label_counter += 1
+        with self._lock:
+            if name not in self.face_database:
+                self.face_database[name] = []
+                self.label_counter += 1
+            
+            self.face_database[name].append(features)
+            self.gallery_index.add(name, features)
+            self._features_dirty = True
         
-        self.face_database[name].append(features)
+        # Сохраняем оригинальный кадр и улучшенную фотографию лица
+        original_path, face_path = self._save_person_photos(name, face_roi, original_frame)
         
+        # Сохраняем информацию о человеке
+        person_data = {
+            'info': {
+                'name': person_info['name'],
+                'position': person_info['position'],
+                'age': person_info['age'],
+                'rank': person_info['rank']
+            },
+            'face_photo_path': face_path,      # Путь к обработанному лицу
+            'original_photo_path': original_path,  # Путь к оригинальному кадру
+            'entry_time': None,
+            'exit_time': None,
+            'status': 'Вышел',  # По умолчанию считаем, что человек не на работе
+            'face_image_refs': [self.image_store.put(face_roi)]  # Ссылка на изображение лица
+        }
+        
+        # Добавляем путь к оригинальной фотографии если есть
+        if 'original_photo_path' in person_info:
+            person_data['original_photo_path'] = person_info['original_photo_path']
+        
+        with self._lock:
+            self.persons_data[name] = person_data
+            self._dirty_persons.add(name)
+        
+        # Сохраняем базу данных
+        self.save_database()
+        
+        return True
+    
+    def _save_person_photos(self, name, face_roi, original_frame=None):
+        """Сохранение оригинального кадра и улучшенной фотографии лица в папку человека
+        
+        Возвращает (путь к оригиналу или None, путь к фотографии лица).
+        """
         # Создаем папку для конкретного человека
         person_dir = os.path.join("faces", name.replace(" ", "_").replace("/", "_"))
         os.makedirs(person_dir, exist_ok=True)
@@ -321,32 +431,7 @@ class SimpleFaceRecognizer:
         # Сохраняем с максимальным качеством JPEG
         cv2.imwrite(face_path, enhanced, [cv2.IMWRITE_JPEG_QUALITY, 95])
         
-        # Сохраняем информацию о человеке
-        person_data = {
-            'info': {
-                'name': person_info['name'],
-                'position': person_info['position'],
-                'age': person_info['age'],
-                'rank': person_info['rank']
-            },
-            'face_photo_path': face_path,      # Путь к обработанному лицу
-            'original_photo_path': original_path,  # Путь к оригинальному кадру
-            'entry_time': None,
-            'exit_time': None,
-            'status': 'Вышел',  # По умолчанию считаем, что человек не на работе
-            'face_images': [face_roi.copy()]  # Сохраняем изображение лица
-        }
-        
-        # Добавляем путь к оригинальной фотографии если есть
-        if 'original_photo_path' in person_info:
-            person_data['original_photo_path'] = person_info['original_photo_path']
-        
-        self.persons_data[name] = person_data
-        
-        # Сохраняем базу данных
-        self.save_database()
-        
-        return True
+        return original_path, face_path
     
     def add_person_from_image(self, image_path, person_info):
         """Добавление человека из файла изображения"""
@@ -360,6 +445,7 @@ class SimpleFaceRecognizer:
         
         # Используем первое найденное лицо
         face_roi = faces[0]['face_roi']
+        face_features = faces[0]['features']
         
         # Сохраняем оригинальную фотографию в папку faces
         name = person_info['name']
@@ -392,7 +478,7 @@ class SimpleFaceRecognizer:
         # Добавляем информацию об оригинальной фотографии
         person_info['original_photo_path'] = original_photo_path
         
-        success = self.add_person(face_roi, person_info)
+        success = self.add_person(face_roi, person_info, features=face_features)
         
         if success:
             return True, "Человек успешно добавлен из изображения"
@@ -403,100 +489,255 @@ class SimpleFaceRecognizer:
         """Добавление нескольких образцов лица для повышения точности"""
         name = person_info['name']
         
-        if name not in self.face_database:
-            self.face_database[name] = []
-            self.label_counter += 1
-            
-            # Сохраняем информацию о человеке только при первом добавлении
-            self.persons_data[name] = {
-                'name': person_info['name'],
-                'position': person_info['position'],
-                'age': person_info['age'],
-                'rank': person_info['rank'],
-                'entry_time': None,
-                'exit_time': None,
-                'status': 'Вышел'
-            }
+        # Признаки считаем до блокировки базы
+        new_features = [self.extract_features(face_roi) for face_roi in face_samples]
         
-        # Добавляем все образцы
-        for face_roi in face_samples:
-            features = self.extract_features(face_roi)
-            self.face_database[name].append(features)
+        with self._lock:
+            if name not in self.face_database:
+                self.face_database[name] = []
+                self.label_counter += 1
+                
+                # Сохраняем информацию о человеке только при первом добавлении
+                self.persons_data[name] = {
+                    'name': person_info['name'],
+                    'position': person_info['position'],
+                    'age': person_info['age'],
+                    'rank': person_info['rank'],
+                    'entry_time': None,
+                    'exit_time': None,
+                    'status': 'Вышел'
+                }
+                self._dirty_persons.add(name)
+            
+            # Добавляем все образцы
+            self.face_database[name].extend(new_features)
+            self.gallery_index.add(name, new_features)
+            self._features_dirty = True
         
         # Сохраняем базу данных
         self.save_database()
         
         return True
     
-    def recognize_face(self, face_roi):
-        """Улучшенное распознавание лица с проверкой размерностей"""
+    def add_persons_bulk(self, persons):
+        """Массовое добавление людей с одной записью базы данных в конце
+        
+        persons - список словарей: 'info' (name, position, age, rank),
+        'face_rois' и 'features' (образцы лица), 'source_path' (исходная
+        фотография). У уже известных людей добавляются только образцы.
+        Возвращает (новых людей, добавленных образцов).
+        """
+        added_persons = 0
+        added_samples = 0
+        for person in persons:
+            person_info = person['info']
+            name = person_info['name']
+            face_rois = person['face_rois']
+            features = person['features']
+            if not features:
+                continue
+            
+            # Файлы пишутся без блокировки базы
+            refs = [self.image_store.put(face_roi) for face_roi in face_rois]
+            with self._lock:
+                is_new = name not in self.persons_data
+            if is_new:
+                _, face_path = self._save_person_photos(name, face_rois[0])
+                original_path = None
+                source_path = person.get('source_path')
+                if source_path and os.path.exists(source_path):
+                    # Оригинал копируется без улучшения: шумоподавление тысяч фото слишком долгое
+                    original_path = os.path.join(os.path.dirname(face_path),
+                                                 "original_" + os.path.basename(source_path))
+                    shutil.copy2(source_path, original_path)
+            
+            with self._lock:
+                if name not in self.face_database:
+                    self.face_database[name] = []
+                    self.label_counter += 1
+                self.face_database[name].extend(features)
+                self.gallery_index.add(name, features)
+                self._features_dirty = True
+                
+                if is_new:
+                    self.persons_data[name] = {
+                        'info': {
+                            'name': name,
+                            'position': person_info['position'],
+                            'age': person_info['age'],
+                            'rank': person_info['rank']
+                        },
+                        'face_photo_path': face_path,
+                        'original_photo_path': original_path,
+                        'entry_time': None,
+                        'exit_time': None,
+                        'status': 'Вышел',
+                        'face_image_refs': refs
+                    }
+                    added_persons += 1
+                else:
+                    self.persons_data[name].setdefault('face_image_refs', []).extend(refs)
+                self._dirty_persons.add(name)
+            added_samples += len(features)
+        
+        # Одна запись галереи и данных о людях за весь импорт
+        self.save_database()
+        self.flush()
+        return added_persons, added_samples
+    
+    def recognize_face(self, face_roi, features=None):
+        """Распознавание лица по матричному индексу галереи
+        
+        Если признаки уже посчитаны (например, в detect_faces), их можно
+        передать через features, тогда face_roi не обрабатывается повторно.
+        """
         if not self.face_database:
             return None, 0.0
         
-        features = self.extract_features(face_roi)
-        
-        best_match = None
-        best_similarity = 0.0
+        if features is None:
+            features = self.extract_features(face_roi)
         threshold = 0.65  # Понижаем порог для лучшего распознавания
         
-        # Сравниваем с каждым человеком в базе данных
-        for name, feature_list in self.face_database.items():
-            similarities = []
-            
-            for stored_features in feature_list:
-                try:
-                    # Проверяем размерности
-                    if len(features) != len(stored_features):
-                        print(f"Предупреждение: Несовместимые размерности для {name}: {len(features)} vs {len(stored_features)}")
-                        continue
-                    
-                    # Косинусное сходство
-                    similarity = cosine_similarity([features], [stored_features])[0, 0]
-                    similarities.append(similarity)
-                    
-                except Exception as e:
-                    print(f"Ошибка при сравнении с {name}: {e}")
-                    continue
-            
-            if similarities:
-                # Берем среднее из топ-3 сходств для большей надежности
-                similarities.sort(reverse=True)
-                top_similarities = similarities[:min(3, len(similarities))]
-                avg_similarity = np.mean(top_similarities)
-                
-                if avg_similarity > best_similarity and avg_similarity > threshold:
-                    best_similarity = avg_similarity
-                    best_match = name
+        # Одно матричное произведение по всем образцам и среднее топ-3 для каждого человека
+        return self.gallery_index.search(features, threshold)
+    
+    def recognize_faces(self, face_rois, features=None):
+        """Пакетное распознавание всех лиц кадра за один проход по галерее
         
-        return best_match, best_similarity
+        features - необязательный список готовых признаков в порядке face_rois
+        (элементы None извлекаются заново). Возвращает список (имя, уверенность).
+        """
+        if not face_rois:
+            return []
+        if not self.face_database:
+            return [(None, 0.0)] * len(face_rois)
+        
+        started = time.perf_counter()
+        if features is None:
+            features = self.extract_features_batch(face_rois)
+        else:
+            features = np.vstack([
+                self.extract_features(face_roi) if face_features is None else face_features
+                for face_roi, face_features in zip(face_rois, features)
+            ])
+        threshold = 0.65
+        
+        if self.metrics is None:
+            return self.gallery_index.search_batch(features, threshold)
+        
+        matched = time.perf_counter()
+        results = self.gallery_index.search_batch(features, threshold)
+        self.metrics.observe('features', matched - started)
+        self.metrics.observe('match', time.perf_counter() - matched)
+        return results
+    
+    def enable_ann_index(self, n_probe=8, n_lists=None, pq_subvectors=0, max_candidates=256, min_rows=20000):
+        """Приближенный поиск (IVF) для очень больших галерей
+        
+        n_probe - сколько ячеек просматривать (больше - точнее и медленнее),
+        pq_subvectors - сжатие образцов PQ для отбора кандидатов (0 - без сжатия),
+        min_rows - с какого числа образцов включается приближенный поиск.
+        """
+        ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, pq_subvectors=pq_subvectors,
+                             max_candidates=max_candidates)
+        self.gallery_index.enable_ann(ann_index, min_rows=min_rows)
     
-    def record_entry_exit(self, name, action):
-        """Записать вход/выход сотрудника"""
+    def record_entry_exit(self, name, action, source=None):
+        """Записать вход/выход сотрудника
+
+        source - камера (вход), на которой зафиксировано событие.
+        """
         import datetime
         
-        if name not in self.persons_data:
-            return False
+        with self._lock:
+            if name not in self.persons_data:
+                return False
+            
+            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            event = {
+                'type': 'entry_exit',
+                'name': name,
+                'action': action,
+                'time': current_time
+            }
+            if source is not None:
+                event['source'] = source
+            self._update_person_status(name, action, current_time)
+            
+            if self.storage is not None:
+                # Событие и новый статус записываются в SQLite одной транзакцией
+                self.storage.record_event(event, self.persons_data[name])
+                return True
+            
+            # Добавляем в историю
+            self.entry_history.append(self._history_entry(event))
+            
+            # Дописываем событие в журнал вместо перезаписи всей базы
+            seq = self.journal.append(event)
+            
+            # Периодически сворачиваем журнал в снимок базы данных
+            if self.journal.pending_events >= self.journal_compact_threshold:
+                self.compact_journal()
         
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Фиксацию ждем без блокировки, чтобы события других потоков
+        # попали в ту же группу записи
+        return self.journal.wait_durable(seq)
+    
+    def _update_person_status(self, name, action, current_time):
+        """Обновление статуса и времени входа/выхода человека"""
+        if name in self.persons_data:
+            if action == "Вошел":
+                self.persons_data[name]['entry_time'] = current_time
+                self.persons_data[name]['status'] = 'На работе'
+            else:  # Вышел
+                self.persons_data[name]['exit_time'] = current_time
+                self.persons_data[name]['status'] = 'Вышел'
+    
+    def _apply_event(self, event):
+        """Применение события журнала к данным в памяти"""
+        name = event['name']
+        action = event['action']
+        current_time = event['time']
         
-        if action == "Вошел":
-            self.persons_data[name]['entry_time'] = current_time
-            self.persons_data[name]['status'] = 'На работе'
-        else:  # Вышел
-            self.persons_data[name]['exit_time'] = current_time
-            self.persons_data[name]['status'] = 'Вышел'
+        self._update_person_status(name, action, current_time)
         
         # Добавляем в историю
-        self.entry_history.append({
-            'name': name,
-            'action': action,
-            'time': current_time
-        })
-        
-        # Сохраняем изменения
+        self.entry_history.append(self._history_entry(event))
+    
+    @staticmethod
+    def _history_entry(event):
+        """Запись истории из события (камера - только если известна)"""
+        entry = {
+            'name': event['name'],
+            'action': event['action'],
+            'time': event['time']
+        }
+        if event.get('source') is not None:
+            entry['source'] = event['source']
+        return entry
+    
+    def replay_journal(self, after_seq=0):
+        """Накат событий журнала, не вошедших в снимок базы данных"""
+        events = self.journal.replay(after_seq)
+        for event in events:
+            if event.get('type') == 'entry_exit':
+                self._apply_event(event)
+        if events:
+            print(f"Восстановлено {len(events)} событий из журнала")
+    
+    def compact_journal(self):
+        """Свертка журнала: сохраняем снимок, журнал усекается в save_database"""
         self.save_database()
-        
-        return True
+    
+    def close(self):
+        """Запись несохраненных изменений и событий журнала, закрытие хранилища"""
+        # Закрытый распознаватель не должен удерживаться обработчиком atexit
+        atexit.unregister(self.flush)
+        self._saver.close()
+        self.journal.close()
+        if self.storage is not None:
+            self.storage.close()
     
     def get_person_info(self, name):
         """Получить информацию о человеке"""
@@ -516,23 +757,88 @@ class SimpleFaceRecognizer:
                 return person_data
         return None
     
-    def get_entry_history(self, name=None):
-        """Получить историю входов/выходов"""
+    def get_entry_history(self, name=None, limit=None, start_time=None, end_time=None):
+        """Получить историю входов/выходов
+        
+        limit - вернуть только последние limit записей,
+        start_time/end_time - границы по времени ("%Y-%m-%d %H:%M:%S").
+        """
+        if self.storage is not None:
+            # Выборка по индексам SQLite без просмотра всей истории
+            return self.storage.get_history(name, limit, start_time, end_time)
+        
+        history = self.entry_history
         if name:
-            return [entry for entry in self.entry_history if entry['name'] == name]
-        return self.entry_history
+            history = [entry for entry in history if entry['name'] == name]
+        if start_time:
+            history = [entry for entry in history if entry['time'] >= start_time]
+        if end_time:
+            history = [entry for entry in history if entry['time'] <= end_time]
+        if limit:
+            history = history[-limit:]
+        return history
     
     def save_database(self):
-        """Сохранение базы данных"""
+        """Сохранение базы данных (отложенное: запись выполняется в фоновом потоке)"""
+        self._saver.mark_dirty()
+    
+    def flush(self):
+        """Немедленная запись несохраненных изменений и событий журнала"""
+        self._saver.flush()
+        self.journal.flush()
+    
+    def get_persistence_stats(self):
+        """Счетчики отложенной записи: запросы, объединенные запросы, записи"""
+        return self._saver.get_stats()
+    
+    def _write_database(self):
+        """Атомарная запись снимка базы данных на диск"""
         os.makedirs("database", exist_ok=True)
         
-        with open(self.database_path, 'wb') as f:
-            pickle.dump({
-                'face_database': self.face_database,
-                'persons_data': self.persons_data,
-                'entry_history': self.entry_history,
-                'label_counter': self.label_counter
-            }, f)
+        # Под блокировкой только фиксируем состояние, запись идет без нее
+        with self._lock:
+            # Номер последнего события журнала, уже учтенного в снимке
+            journal_seq = self.journal.last_seq
+            features_dirty = self._features_dirty
+            self._features_dirty = False
+            
+            # При хранилище SQLite данные о людях и история в снимок не попадают
+            snapshot = pickle.dumps({
+                'face_database': {},
+                'persons_data': self.persons_data if self.storage is None else {},
+                'entry_history': self.entry_history if self.storage is None else [],
+                'label_counter': self.label_counter,
+                'journal_seq': journal_seq
+            })
+        
+        # Векторы признаков пишутся в отдельное хранилище только при изменениях
+        if features_dirty:
+            try:
+                self.feature_store.save(self.gallery_index)
+            except Exception:
+                with self._lock:
+                    self._features_dirty = True
+                raise
+        
+        atomic_write_bytes(self.database_path, snapshot)
+        
+        if self.storage is not None:
+            # Только измененные записи и под той же блокировкой, что и запись
+            # событий: статус из record_entry_exit не перезаписывается старой копией
+            with self._lock:
+                dirty = self._dirty_persons
+                self._dirty_persons = set()
+                if dirty:
+                    try:
+                        self.storage.update_persons(
+                            {name: self.persons_data[name] for name in dirty if name in self.persons_data},
+                            [name for name in dirty if name not in self.persons_data])
+                    except Exception:
+                        self._dirty_persons |= dirty
+                        raise
+        
+        # События до journal_seq теперь есть в снимке
+        self.journal.truncate(journal_seq)
     
     def load_database(self):
         """Загрузка базы данных"""
@@ -544,6 +850,16 @@ class SimpleFaceRecognizer:
                     self.persons_data = data.get('persons_data', {})
                     self.entry_history = data.get('entry_history', [])
                     self.label_counter = data.get('label_counter', 0)
+                    journal_seq = data.get('journal_seq', 0)
+                
+                # Векторы признаков из хранилища, отображенного в память
+                self.load_features()
+                
+                # Накатываем журнал событий поверх снимка
+                self.replay_journal(journal_seq)
+                
+                # Данные о людях и история из SQLite
+                self.load_storage()
                 
                 # Очистка базы данных от несовместимых записей
                 self.cleanup_database()
@@ -554,6 +870,68 @@ class SimpleFaceRecognizer:
                 self.persons_data = {}
                 self.entry_history = []
                 self.label_counter = 0
+                self.load_features()
+                self.load_storage()
+        else:
+            self.load_features()
+            if os.path.exists(self.journal.path):
+                self.replay_journal()
+            self.load_storage()
+        
+        # Переносим изображения лиц и признаки из старого снимка в хранилища
+        images_migrated = self.migrate_face_images()
+        if images_migrated or self._features_dirty:
+            self.save_database()
+    
+    def migrate_face_images(self):
+        """Перенос изображений лиц из записей о людях в хранилище изображений"""
+        migrated = 0
+        for name, person_data in self.persons_data.items():
+            if 'face_images' in person_data:
+                refs = [self.image_store.put(image) for image in person_data.pop('face_images')]
+                person_data.setdefault('face_image_refs', []).extend(refs)
+                self._dirty_persons.add(name)
+                migrated += len(refs)
+        if migrated:
+            print(f"Перенесено {migrated} изображений лиц в хранилище изображений")
+        return migrated > 0
+    
+    def load_features(self):
+        """Открытие матрицы признаков и построение индекса галереи
+        
+        Индекс работает прямо с отображенным в память файлом, а face_database
+        содержит представления строк этой матрицы без копирования.
+        """
+        loaded = self.feature_store.load()
+        if loaded is not None:
+            matrix, labels, names = loaded
+            self.gallery_index.attach(matrix, labels, names)
+            self.face_database = self.gallery_index.rows_by_person()
+            self._features_dirty = False
+        else:
+            # Старый формат: признаки лежат в pickle-снимке
+            self.gallery_index.rebuild(self.face_database)
+            self._features_dirty = bool(self.face_database)
+    
+    def load_storage(self):
+        """Загрузка данных о людях из SQLite с однократным переносом из pickle-снимка"""
+        if self.storage is None:
+            return
+        
+        migrated = False
+        if not self.storage.get_meta('pickle_migrated'):
+            if self.persons_data or self.entry_history:
+                print(f"Перенос в SQLite: {len(self.persons_data)} сотрудников, {len(self.entry_history)} записей истории")
+                self.storage.import_data(self.persons_data, self.entry_history)
+                migrated = True
+            self.storage.set_meta('pickle_migrated', 1)
+        
+        self.persons_data = self.storage.load_persons()
+        self.entry_history = []  # История читается из SQLite по запросу
+        
+        # Убираем перенесенные данные из снимка
+        if migrated:
+            self.save_database()
     
     def cleanup_database(self):
         """Очистка базы данных от записей с несовместимыми размерностями"""
@@ -582,12 +960,16 @@ class SimpleFaceRecognizer:
             else:
                 print(f"Удален пользователь {name} - не осталось совместимых записей")
                 if name in self.persons_data:
-                    del self.persons_data[name]
+                    refs = self.persons_data.pop(name).get('face_image_refs', [])
+                    self._dirty_persons.add(name)
+                    self._release_face_images(refs)
         
         self.face_database = cleaned_database
         
         if removed_count > 0:
             print(f"Удалено {removed_count} несовместимых записей")
+            self.gallery_index.rebuild(self.face_database)
+            self._features_dirty = True
             self.save_database()
         else:
             print("Все записи совместимы")
@@ -598,26 +980,45 @@ class SimpleFaceRecognizer:
     
     def delete_person(self, name):
         """Удаление человека из базы данных"""
-        if name in self.face_database:
-            del self.face_database[name]
+        with self._lock:
+            if name in self.face_database:
+                del self.face_database[name]
+            if self.gallery_index.remove(name):
+                self._features_dirty = True
             
-        if name in self.persons_data:
-            del self.persons_data[name]
+            if name in self.persons_data:
+                refs = self.persons_data.pop(name).get('face_image_refs', [])
+                self._dirty_persons.add(name)
+                self._release_face_images(refs)
             
         # Сохраняем изменения
         self.save_database()
         
         return True
     
+    def _release_face_images(self, refs):
+        """Удаление изображений лиц, которые не нужны больше никому (под self._lock)"""
+        if not refs:
+            return
+        live_refs = set()
+        for person_data in self.persons_data.values():
+            live_refs.update(person_data.get('face_image_refs', []))
+        self.image_store.remove_unused(refs, live_refs)
+    
     def get_stored_face_images(self, name):
-        """Получение сохраненных изображений лиц для человека"""
-        if name in self.persons_data and 'face_images' in self.persons_data[name]:
-            return self.persons_data[name]['face_images']
+        """Получение сохраненных изображений лиц для человека (загружаются по запросу)"""
+        if name in self.persons_data:
+            refs = self.persons_data[name].get('face_image_refs', [])
+            images = [self.image_store.get(ref) for ref in refs]
+            return [image for image in images if image is not None]
         return []
     
     def update_person_info(self, old_name, new_info):
         """Обновление информации о человеке"""
-        if old_name in self.face_database and old_name in self.persons_data:
+        with self._lock:
+            if old_name not in self.face_database or old_name not in self.persons_data:
+                return False
+            
             # Сохраняем старые данные лица
             old_features = self.face_database[old_name].copy()
             old_data = self.persons_data[old_name].copy()
@@ -629,6 +1030,8 @@ class SimpleFaceRecognizer:
             
             # Создаем новые записи
             self.face_database[new_info['name']] = old_features
+            self.gallery_index.rename(old_name, new_info['name'])
+            self._features_dirty = True
             self.persons_data[new_info['name']] = old_data
             
             # Обновляем информацию
@@ -638,8 +1041,8 @@ class SimpleFaceRecognizer:
                 'age': new_info['age'],
                 'rank': new_info['rank']
             })
-            
-            # Сохраняем изменения
-            self.save_database()
-            return True
-        return False
+            self._dirty_persons.update((old_name, new_info['name']))
+        
+        # Сохраняем изменения
+        self.save_database()
+        return True
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище данных о сотрудниках и истории входов/выходов в SQLite
+Записи о людях хранятся по одной строке на человека, история -
+отдельной таблицей с индексами по имени и времени, поэтому выборка
+истории одного сотрудника и запуск программы не зависят от объема
+накопленной истории.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS persons (
+    name TEXT PRIMARY KEY,
+    record BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS entry_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    action TEXT NOT NULL,
+    time TEXT NOT NULL,
+    source TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_entry_history_name ON entry_history(name, id);
+CREATE INDEX IF NOT EXISTS idx_entry_history_time ON entry_history(time);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStorage:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Соединение используется из нескольких потоков под общей блокировкой
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Добавление столбцов, которых нет в базах прежних версий"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(entry_history)")}
+        if 'source' not in columns:
+            # Камера (вход), на которой записано событие; у старых записей - NULL
+            self.conn.execute("ALTER TABLE entry_history ADD COLUMN source TEXT")
+
+    @staticmethod
+    def _dump(record):
+        return sqlite3.Binary(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_meta(self, key, default=None):
+        """Чтение служебного значения"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        """Запись служебного значения"""
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def load_persons(self):
+        """Загрузка записей обо всех людях: имя -> данные"""
+        with self._lock:
+            rows = self.conn.execute("SELECT name, record FROM persons").fetchall()
+        return {name: pickle.loads(record) for name, record in rows}
+
+    def save_person(self, name, record):
+        """Сохранение записи об одном человеке"""
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO persons (name, record) VALUES (?, ?)",
+                              (name, self._dump(record)))
+
+    def update_persons(self, changed, removed=()):
+        """Запись измененных людей (имя -> данные) и удаление removed одной транзакцией"""
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM persons WHERE name = ?", [(name,) for name in removed])
+            self.conn.executemany("INSERT OR REPLACE INTO persons (name, record) VALUES (?, ?)",
+                                  [(name, self._dump(record)) for name, record in changed.items()])
+
+    def record_event(self, event, record=None):
+        """Запись события входа/выхода и нового статуса человека в одной транзакции"""
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO entry_history (name, action, time, source) VALUES (?, ?, ?, ?)",
+                              (event['name'], event['action'], event['time'], event.get('source')))
+            if record is not None:
+                self.conn.execute("INSERT OR REPLACE INTO persons (name, record) VALUES (?, ?)",
+                                  (event['name'], self._dump(record)))
+
+    def get_history(self, name=None, limit=None, start_time=None, end_time=None):
+        """История входов/выходов в хронологическом порядке
+
+        limit - только последние limit записей, start_time/end_time -
+        границы по времени в формате "%Y-%m-%d %H:%M:%S".
+        """
+        conditions = []
+        params = []
+        if name:
+            conditions.append("name = ?")
+            params.append(name)
+        if start_time:
+            conditions.append("time >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("time <= ?")
+            params.append(end_time)
+
+        query = "SELECT name, action, time, source FROM entry_history"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        history = []
+        for name, action, time, source in reversed(rows):
+            entry = {'name': name, 'action': action, 'time': time}
+            if source is not None:
+                entry['source'] = source
+            history.append(entry)
+        return history
+
+    def count_history(self, name=None):
+        """Количество записей в истории"""
+        with self._lock:
+            if name:
+                row = self.conn.execute("SELECT COUNT(*) FROM entry_history WHERE name = ?", (name,)).fetchone()
+            else:
+                row = self.conn.execute("SELECT COUNT(*) FROM entry_history").fetchone()
+        return row[0]
+
+    def import_data(self, persons_data, entry_history):
+        """Перенос данных из старого pickle-снимка одной транзакцией"""
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO persons (name, record) VALUES (?, ?)",
+                                  [(name, self._dump(record)) for name, record in persons_data.items()])
+            self.conn.executemany("INSERT INTO entry_history (name, action, time, source) VALUES (?, ?, ?, ?)",
+                                  [(e['name'], e['action'], e['time'], e.get('source')) for e in entry_history])
+
+    def close(self):
+        """Закрытие соединения"""
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики стадий обработки видео
+Время каждой стадии (захват, уменьшение, детекция, признаки, поиск по
+галерее, подписи, подготовка кадра для Tk, показ) копится в гистограммах,
+рядом - счетчики и текущие значения (FPS, пропущенные кадры, размер
+галереи). Метрики можно показать поверх видео или отдать системе
+мониторинга в текстовом формате Prometheus: по HTTP на локальном порту
+и/или файлом для textfile-коллектора node_exporter.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from persistence import atomic_write_bytes
+
+
+# Границы корзин гистограмм (с): от 0.25 мс до 1 с
+DEFAULT_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, smoothing=0.1):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Последняя корзина - больше всех границ
+        self.count = 0
+        self.sum = 0.0
+        self.recent = None  # Сглаженное последнее время (для наложения на видео)
+        self.smoothing = smoothing
+
+    def observe(self, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if self.recent is None:
+            self.recent = seconds
+        else:
+            self.recent += self.smoothing * (seconds - self.recent)
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class StageMetrics:
+    """Гистограммы стадий, счетчики и текущие значения; методы потокобезопасны"""
+
+    def __init__(self, prefix="personnel", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.stages = {}  # Стадия -> Histogram (в порядке первого появления)
+        self.counters = {}  # Имя -> (значение, описание)
+        self.gauges = {}  # Имя -> (значение, описание)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Измерение стадии: with metrics.time('detect'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name, value=1, help_text=""):
+        with self._lock:
+            current, description = self.counters.get(name, (0, help_text))
+            self.counters[name] = (current + value, description or help_text)
+
+    def set_counter(self, name, value, help_text=""):
+        """Счетчик, который ведется в другом объекте (например, пропущенные кадры захвата)"""
+        with self._lock:
+            self.counters[name] = (value, help_text)
+
+    def set_gauge(self, name, value, help_text=""):
+        with self._lock:
+            self.gauges[name] = (value, help_text)
+
+    def summary(self):
+        """Стадия -> (сглаженное время мс, p95 мс, число измерений) для наложения"""
+        with self._lock:
+            return {stage: ((histogram.recent or 0.0) * 1000, histogram.quantile(0.95) * 1000, histogram.count)
+                    for stage, histogram in self.stages.items()}
+
+    def overlay_lines(self):
+        """Строки для вывода поверх видео (только ASCII для cv2.putText)"""
+        lines = [f"{stage:<9}{recent:7.1f} ms  p95 {p95:6.1f}"
+                 for stage, (recent, p95, _) in self.summary().items()]
+        with self._lock:
+            for name, (value, _) in self.gauges.items():
+                lines.append(f"{name:<9}{value:7.1f}" if isinstance(value, float) else f"{name:<9}{value:7}")
+        return lines
+
+    def prometheus_text(self):
+        """Все метрики в текстовом формате Prometheus"""
+        p = self.prefix
+        lines = []
+        with self._lock:
+            if self.stages:
+                lines.append(f"# HELP {p}_stage_seconds Время стадии обработки кадра")
+                lines.append(f"# TYPE {p}_stage_seconds histogram")
+                for stage, histogram in self.stages.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                    lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            for name, (value, help_text) in self.counters.items():
+                lines.append(f"# HELP {p}_{name}_total {help_text or name}")
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                lines.append(f"{p}_{name}_total {value}")
+
+            for name, (value, help_text) in self.gauges.items():
+                lines.append(f"# HELP {p}_{name} {help_text or name}")
+                lines.append(f"# TYPE {p}_{name} gauge")
+                lines.append(f"{p}_{name} {value:g}" if isinstance(value, float) else f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Отдача метрик: HTTP /metrics на локальном порту и/или периодическая запись в файл
+
+    collect - необязательная функция, обновляющая счетчики и значения перед отдачей.
+    """
+
+    def __init__(self, metrics, port=None, path=None, interval=5.0, host="127.0.0.1", collect=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.collect = collect
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+        if port:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = exporter.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer((host, port), Handler)
+            self.server.daemon_threads = True
+            self._start(self.server.serve_forever)
+
+        if path:
+            self._start(self._write_loop)
+
+    @property
+    def port(self):
+        return self.server.server_address[1] if self.server is not None else None
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def render(self):
+        if self.collect is not None:
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+        return self.metrics.prometheus_text()
+
+    def write_file(self):
+        """Атомарная запись, чтобы коллектор не прочитал файл наполовину"""
+        atomic_write_bytes(self.path, self.render().encode('utf-8'))
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_file()
+            except OSError as e:
+                print(f"Ошибка записи метрик в {self.path}: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path:
+            try:
+                self.write_file()
+            except OSError:
+                pass